@@ -1,19 +1,31 @@
 from flask import Flask
 
+from core import cache, metrics
+from core.csv_import import import_command
+from core.export import export_command, export_methods
 from core.collaborator_methods import collaborator_methods
-from database.database import db, ma
+from database import database, summary
 from core.sector_methods import sector_methods
 
 
-def create_app():
+def create_app(config=None):
+    """
+    Creates the API
+    :param config: Settings that override the defaults (see database.configure() for the database ones)
+    :return: The Flask app
+    """
     app = Flask(__name__)
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['JSON_SORT_KEYS'] = False
-    db.init_app(app)
-    app.db = db
-    ma.init_app(app)
+    app.config.update(config or {})
+    database.configure(app)
     app.register_blueprint(collaborator_methods)
     app.register_blueprint(sector_methods)
+    app.register_blueprint(export_methods)
+    cache.configure(app)
+    metrics.configure(app)
+    app.cli.add_command(summary.rebuild_command)
+    app.cli.add_command(export_command)
+    app.cli.add_command(import_command)
 
     return app
@@ -0,0 +1,261 @@
+"""
+ASGI serving mode. Serves the same app (the same routes and JSON contracts) on an ASGI server:
+the event loop handles the connections, so slow clients and idle keep-alive connections cost no thread,
+and each request runs in a bounded pool of worker threads. Run it with:
+
+    python asgi.py [--host 127.0.0.1] [--port 5000]    (requires uvicorn)
+or
+    uvicorn --factory asgi:create_asgi_app
+"""
+import argparse
+import asyncio
+import io
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+from flask.testing import EnvironBuilder
+
+from __init__ import create_app
+from database import migrations
+from database.database import db
+
+DEFAULT_THREADS = 32
+
+
+class AsgiApp:
+    """
+    Adapts a WSGI app (the Flask app) to ASGI
+    """
+
+    def __init__(self, wsgi_app, threads=DEFAULT_THREADS):
+        """
+        :param wsgi_app: The Flask app
+        :param threads: The maximum number of requests handled at the same time
+        """
+        self.wsgi_app = wsgi_app
+        self.executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix='asgi')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise ValueError(f'Unsupported ASGI scope: {scope["type"]}')
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                # The requests in flight finish first. They send their responses through the event loop,
+                # so it must keep running while they are waited for (in another thread)
+                await asyncio.get_running_loop().run_in_executor(None, self.executor.shutdown)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        # Read the whole body before handing the request to a worker thread
+        body = bytearray()
+        while True:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body += message.get('body', b'')
+            if not message.get('more_body'):
+                break
+
+        loop = asyncio.get_running_loop()
+        environ = _environ(scope, bytes(body))
+        await loop.run_in_executor(self.executor, self._run_wsgi, environ, send, loop)
+
+    def _run_wsgi(self, environ, send, loop):
+        # Runs in a worker thread. Each message is sent through the event loop, waiting for it to be sent
+        # (so a streamed response advances at the pace of the client)
+        def call(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        response = {'started': False}
+
+        def start():
+            if not response['started']:
+                response['started'] = True
+                call({'type': 'http.response.start', 'status': response['status'], 'headers': response['headers']})
+
+        def write(data):
+            # The headers are sent along with the first chunk of the body
+            if data:
+                start()
+                call({'type': 'http.response.body', 'body': data, 'more_body': True})
+
+        def start_response(status, headers, exc_info=None):
+            # PEP 3333: an error may replace the status and the headers until they are sent,
+            # after that it can only abort the response
+            if exc_info:
+                try:
+                    if response['started']:
+                        raise exc_info[1].with_traceback(exc_info[2])
+                finally:
+                    exc_info = None
+            elif 'status' in response:
+                raise AssertionError('start_response() was already called')
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+            return write
+
+        chunks = self.wsgi_app(environ, start_response)
+        try:
+            for chunk in chunks:
+                write(chunk)
+            start()
+            call({'type': 'http.response.body', 'body': b'', 'more_body': False})
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+    def test_client(self):
+        """
+        :return: A client that sends requests through the ASGI interface, with the same methods
+        as the Flask test client (get, post, put and delete)
+        """
+        return AsgiTestClient(self)
+
+
+class AsgiTestClient:
+
+    def __init__(self, asgi_app):
+        self.asgi_app = asgi_app
+
+    def get(self, *args, **kwargs):
+        return self.open(*args, method='GET', **kwargs)
+
+    def post(self, *args, **kwargs):
+        return self.open(*args, method='POST', **kwargs)
+
+    def put(self, *args, **kwargs):
+        return self.open(*args, method='PUT', **kwargs)
+
+    def delete(self, *args, **kwargs):
+        return self.open(*args, method='DELETE', **kwargs)
+
+    def open(self, *args, **kwargs):
+        """
+        Sends a request (built from the same arguments as the Flask test client)
+        :return: The response
+        """
+        flask_app = self.asgi_app.wsgi_app
+        builder = EnvironBuilder(flask_app, *args, **kwargs)
+        try:
+            environ = builder.get_environ()
+        finally:
+            builder.close()
+
+        scope = _scope(environ)
+        body = environ['wsgi.input'].read()
+        status, headers, response_body = asyncio.run(self._send(scope, body))
+        return flask_app.response_class(response_body, status=status, headers=headers)
+
+    async def _send(self, scope, body):
+        messages = [{'type': 'http.request', 'body': body, 'more_body': False}]
+        response = {'headers': [], 'body': bytearray()}
+
+        async def receive():
+            return messages.pop(0) if messages else {'type': 'http.disconnect'}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                response['status'] = message['status']
+                response['headers'] = [(name.decode('latin-1'), value.decode('latin-1'))
+                                       for name, value in message['headers']]
+            else:
+                response['body'] += message.get('body', b'')
+
+        await self.asgi_app(scope, receive, send)
+        return response['status'], response['headers'], bytes(response['body'])
+
+
+def _environ(scope, body):
+    """
+    Builds the WSGI environ of an ASGI http request
+    """
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'REMOTE_ADDR': client[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+def _scope(environ):
+    """
+    Builds the ASGI scope of a WSGI environ (used by the test client)
+    """
+    headers = []
+    for key, value in environ.items():
+        if key.startswith('HTTP_'):
+            headers.append((key[5:].replace('_', '-').lower().encode('latin-1'), value.encode('latin-1')))
+        elif key in ('CONTENT_TYPE', 'CONTENT_LENGTH') and value:
+            headers.append((key.replace('_', '-').lower().encode('latin-1'), value.encode('latin-1')))
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': environ['REQUEST_METHOD'],
+        'scheme': environ['wsgi.url_scheme'],
+        'root_path': environ.get('SCRIPT_NAME', ''),
+        'path': environ['PATH_INFO'].encode('latin-1').decode('utf-8'),
+        'query_string': environ.get('QUERY_STRING', '').encode('latin-1'),
+        'headers': headers,
+        'server': (environ['SERVER_NAME'], int(environ['SERVER_PORT'])),
+        'client': ('127.0.0.1', 0),
+    }
+
+
+def create_asgi_app():
+    return AsgiApp(create_app(), threads=int(os.environ.get('ASGI_THREADS', DEFAULT_THREADS)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serves the API on an ASGI server (uvicorn)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    arguments = parser.parse_args()
+
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit('The ASGI mode requires uvicorn (pip install uvicorn)')
+
+    asgi_app = create_asgi_app()
+    with asgi_app.wsgi_app.app_context():
+        db.create_all()
+        migrations.upgrade()
+    uvicorn.run(asgi_app, host=arguments.host, port=arguments.port)
+
+
+if __name__ == '__main__':
+    main()
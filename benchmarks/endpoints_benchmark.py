@@ -0,0 +1,294 @@
+"""
+Benchmarks every route of the collaborators and sectors, through the Flask test client, on databases
+seeded with synthetic data of several sizes. Writes the latency percentiles and the throughput
+of each route to a JSON file, and compares them with the results of a previous run:
+
+    python benchmarks/endpoints_benchmark.py --sizes 1000,10000 --output results.json
+    python benchmarks/endpoints_benchmark.py --sizes 1000,10000 --baseline results.json --threshold 0.25
+
+Exits with status 1 when a route got slower than its baseline by more than the threshold
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from __init__ import create_app
+from benchmarks import synthetic_data
+from database import migrations
+from database.database import db
+
+DEFAULT_SIZES = (1000, 10000)
+DEFAULT_SECTORS = 20
+DEFAULT_REQUESTS = 50
+DEFAULT_THRESHOLD = 0.25
+
+# Differences below this (in milliseconds) are noise, never reported as regressions
+MIN_REGRESSION_MS = 0.5
+
+NDJSON = {'Accept': 'application/x-ndjson'}
+
+
+class Context:
+    """
+    State shared by the requests of a run: the seeded data, and the rows created by the write routes
+    (so that the update and delete routes have something to work on)
+    """
+
+    def __init__(self, sectors, collaborators, seed=0):
+        self.rng = random.Random(seed)
+        self.sectors = sectors
+        self.collaborators = collaborators
+        self.next_collab_number = collaborators + 1
+        self.added_collaborators = []
+        self.added_sectors = []
+        self.renamed_sectors = []
+        self.upserted_sectors = 0
+
+    def existing_collab_number(self):
+        return self.rng.randint(1, self.collaborators)
+
+    def new_collaborator(self):
+        collaborator = synthetic_data.collaborator(self.next_collab_number, self.rng.choice(self.sectors), self.rng)
+        self.next_collab_number += 1
+        return collaborator
+
+
+def _range(client, context):
+    lower = context.rng.randint(1, max(1, context.collaborators - 100))
+    return client.get(f'/collaborators/all/{lower}/{lower + 99}')
+
+
+def _add_collaborator(client, context):
+    collaborator = context.new_collaborator()
+    context.added_collaborators.append(collaborator['collab_number'])
+    return client.post(f'/collaborators/add/{collaborator["collab_number"]}', json=collaborator)
+
+
+def _add_bulk(client, context):
+    return client.post('/collaborators/add/bulk', json=[context.new_collaborator() for _ in range(100)])
+
+
+def _update_collaborator(client, context):
+    collab_number = context.existing_collab_number()
+    collaborator = synthetic_data.collaborator(collab_number, context.rng.choice(context.sectors), context.rng)
+    return client.put(f'/collaborators/update/{collab_number}', json=collaborator)
+
+
+def _upsert_collaborator(client, context):
+    collab_number = context.existing_collab_number()
+    collaborator = synthetic_data.collaborator(collab_number, context.rng.choice(context.sectors), context.rng)
+    return client.put(f'/collaborators/upsert/{collab_number}', json=collaborator)
+
+
+def _upsert_bulk(client, context):
+    collaborators = [
+        synthetic_data.collaborator(context.existing_collab_number(), context.rng.choice(context.sectors), context.rng)
+        for _ in range(50)
+    ] + [context.new_collaborator() for _ in range(50)]
+    return client.put('/collaborators/upsert/bulk', json=collaborators)
+
+
+def _delete_collaborator(client, context):
+    return client.delete(f'/collaborators/delete/{context.added_collaborators.pop()}')
+
+
+def _add_sector(client, context):
+    name = f'Benchmark {len(context.added_sectors)}'
+    context.added_sectors.append(name)
+    return client.post(f'/sectors/add/{name}', json={'name': name})
+
+
+def _update_sector(client, context):
+    name = context.added_sectors.pop()
+    context.renamed_sectors.append(f'{name} renamed')
+    return client.put(f'/sectors/update/{name}', json={'name': f'{name} renamed'})
+
+
+def _upsert_sector(client, context):
+    name = context.rng.choice(context.sectors)
+    return client.put(f'/sectors/upsert/{name}', json={'name': name})
+
+
+def _upsert_sectors_bulk(client, context):
+    sectors = [{'name': name} for name in context.sectors[:50]]
+    for _ in range(100 - len(sectors)):
+        context.upserted_sectors += 1
+        sectors.append({'name': f'Upserted {context.upserted_sectors}'})
+    return client.put('/sectors/upsert/bulk', json=sectors)
+
+
+def _delete_sector(client, context):
+    return client.delete(f'/sectors/delete/{context.renamed_sectors.pop()}')
+
+
+# The benchmarked requests, by name. They run in this order, so the write routes
+# find the rows created by the ones before them
+CASES = (
+    ('GET /collaborators/all', lambda client, context: client.get('/collaborators/all')),
+    ('GET /collaborators/all (ndjson)', lambda client, context: client.get('/collaborators/all', headers=NDJSON)),
+    ('GET /collaborators/all?fields', lambda client, context: client.get('/collaborators/all?fields=collab_number,full_name')),
+    ('GET /collaborators/all?limit', lambda client, context: client.get('/collaborators/all?limit=100')),
+    ('GET /collaborators/all/<lower>/<upper>', _range),
+    ('GET /collaborators/all/<name>', lambda client, context: client.get(f'/collaborators/all/{context.rng.choice(synthetic_data.LAST_NAMES)}')),
+    ('GET /collaborators/query', lambda client, context: client.get(
+        f'/collaborators/query?sector_name={context.rng.choice(context.sectors)}&active=true&sort=-current_salary')),
+    ('GET /collaborators/born/<start>/<end>', lambda client, context: client.get('/collaborators/born/1980-01-01/1980-12-31')),
+    ('GET /collaborators/birthdays/<days>', lambda client, context: client.get('/collaborators/birthdays/7?from=2021-06-01')),
+    ('GET /collaborators/search', lambda client, context: client.get(f'/collaborators/search?q={context.rng.choice(synthetic_data.FIRST_NAMES)}')),
+    ('GET /collaborators/<collab_number>', lambda client, context: client.get(f'/collaborators/{context.existing_collab_number()}')),
+    ('POST /collaborators/add/<collab_number>', _add_collaborator),
+    ('POST /collaborators/add/bulk', _add_bulk),
+    ('PUT /collaborators/update/<collab_number>', _update_collaborator),
+    ('PUT /collaborators/upsert/<collab_number>', _upsert_collaborator),
+    ('PUT /collaborators/upsert/bulk', _upsert_bulk),
+    ('DELETE /collaborators/delete/<collab_number>', _delete_collaborator),
+    ('GET /sectors/all', lambda client, context: client.get('/sectors/all')),
+    ('GET /sectors/all?limit', lambda client, context: client.get('/sectors/all?limit=10')),
+    ('GET /sectors/all/<name>', lambda client, context: client.get('/sectors/all/Sector 00')),
+    ('GET /sectors/<name>', lambda client, context: client.get(f'/sectors/{context.rng.choice(context.sectors)}')),
+    ('GET /sectors/summary', lambda client, context: client.get('/sectors/summary')),
+    ('GET /sectors/<name>/summary', lambda client, context: client.get(f'/sectors/{context.rng.choice(context.sectors)}/summary')),
+    ('GET /sectors/stats', lambda client, context: client.get('/sectors/stats')),
+    ('GET /sectors/<name>/stats', lambda client, context: client.get(f'/sectors/{context.rng.choice(context.sectors)}/stats')),
+    ('POST /sectors/add/<sector_name>', _add_sector),
+    ('PUT /sectors/update/<sector_name>', _update_sector),
+    ('PUT /sectors/upsert/<sector_name>', _upsert_sector),
+    ('PUT /sectors/upsert/bulk', _upsert_sectors_bulk),
+    ('DELETE /sectors/delete/<sector_name>', _delete_sector),
+)
+
+
+def percentile(sorted_values, fraction):
+    # Nearest rank percentile
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def summarize(latencies, errors):
+    """
+    :param latencies: The latency of each request, in seconds
+    :param errors: The number of requests that didn't succeed
+    :return: A dict with the latency percentiles (in milliseconds) and the throughput (requests per second)
+    """
+    values = sorted(latency * 1000 for latency in latencies)
+    return {
+        'requests': len(values),
+        'errors': errors,
+        'mean_ms': round(statistics.mean(values), 3),
+        'p50_ms': round(percentile(values, 0.50), 3),
+        'p90_ms': round(percentile(values, 0.90), 3),
+        'p99_ms': round(percentile(values, 0.99), 3),
+        'max_ms': round(values[-1], 3),
+        'throughput_rps': round(len(values) / (sum(values) / 1000), 1),
+    }
+
+
+def run(size, sectors, requests, warmup=3):
+    """
+    Benchmarks every route on a new database with synthetic data
+    :param size: The number of collaborators
+    :param sectors: The number of sectors
+    :param requests: The number of measured requests per route
+    :param warmup: The number of requests per route made before measuring
+    :return: A dict with the summary of each route (see summarize()), by name
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(directory, "benchmark.db")}'})
+        with app.app_context():
+            db.create_all()
+            migrations.upgrade()
+            context = Context(synthetic_data.seed(sectors, size), size)
+            db.session.remove()
+
+        client = app.test_client()
+        results = {}
+        for name, send in CASES:
+            latencies = []
+            errors = 0
+            for number in range(warmup + requests):
+                start = time.perf_counter()
+                response = send(client, context)
+                response.get_data()
+                elapsed = time.perf_counter() - start
+                if number >= warmup:
+                    latencies.append(elapsed)
+                    errors += response.status_code >= 400
+            results[name] = summarize(latencies, errors)
+
+        with app.app_context():
+            db.get_engine(app).dispose()
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Compares the median latency of each route with a previous run
+    :param results: The results of this run (see main())
+    :param baseline: The results of the previous run
+    :param threshold: The tolerated slowdown (0.25 means 25% slower)
+    :return: A list with a message for each route that regressed
+    """
+    regressions = []
+    for size, routes in results['results'].items():
+        for name, summary in routes.items():
+            previous = baseline.get('results', {}).get(size, {}).get(name)
+            if previous is None:
+                continue
+            before, after = previous['p50_ms'], summary['p50_ms']
+            if after > before * (1 + threshold) and after - before > MIN_REGRESSION_MS:
+                regressions.append(f'{name} ({size} collaborators): p50 {before:.3f}ms -> {after:.3f}ms')
+    return regressions
+
+
+def main(arguments=None):
+    parser = argparse.ArgumentParser(description='Benchmarks the collaborator and sector routes')
+    parser.add_argument('--sizes', default=','.join(map(str, DEFAULT_SIZES)),
+                        help='Numbers of collaborators, separated by commas')
+    parser.add_argument('--sectors', type=int, default=DEFAULT_SECTORS)
+    parser.add_argument('--requests', type=int, default=DEFAULT_REQUESTS, help='Measured requests per route')
+    parser.add_argument('--output', help='File where the results are written (JSON)')
+    parser.add_argument('--baseline', help='Results of a previous run (JSON) to compare with')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD,
+                        help='Tolerated slowdown of the median latency (0.25 means 25%%)')
+    arguments = parser.parse_args(arguments)
+
+    results = {
+        'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'sectors': arguments.sectors,
+        'requests': arguments.requests,
+        'results': {},
+    }
+    for size in (int(size) for size in arguments.sizes.split(',')):
+        results['results'][str(size)] = routes = run(size, arguments.sectors, arguments.requests)
+        print(f'{size} collaborators, {arguments.sectors} sectors')
+        for name, summary in routes.items():
+            print(f'  {name:<48} p50 {summary["p50_ms"]:9.3f}ms  p99 {summary["p99_ms"]:9.3f}ms  '
+                  f'{summary["throughput_rps"]:9.1f} req/s' + (f'  {summary["errors"]} errors' if summary['errors'] else ''))
+
+    if arguments.output:
+        with open(arguments.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+    if arguments.baseline:
+        with open(arguments.baseline) as file:
+            regressions = compare(results, json.load(file), arguments.threshold)
+        for regression in regressions:
+            print(f'REGRESSION: {regression}')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
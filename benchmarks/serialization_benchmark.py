@@ -0,0 +1,71 @@
+"""
+Compares the serialization of a large listing of collaborators with the marshmallow schema
+(objects loaded by the ORM, encoded by flask.json) and with the fast serialization (plain rows, encoded by orjson
+when it is installed). Run it from the root of the project:
+
+    python benchmarks/serialization_benchmark.py [--rows 100000] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import json
+
+from __init__ import create_app
+from benchmarks import synthetic_data
+from core import serialization
+from database.database import db
+from models.collaborator_model import Collaborator, collaborators_schema
+
+
+def schema_dump(query):
+    return json.dumps(collaborators_schema.dump(query.all())).encode()
+
+
+def fast_dump(query):
+    return serialization.dumps(serialization.dump(query, Collaborator, collaborators_schema))
+
+
+def measure(function, query, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        db.session.expunge_all()
+        start = time.perf_counter()
+        function(query)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the serialization of the collaborators listing')
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--repeat', type=int, default=3)
+    arguments = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(directory, "benchmark.db")}'})
+        with app.app_context():
+            db.create_all()
+            synthetic_data.seed(10, arguments.rows)
+
+            query = Collaborator.query.order_by(Collaborator.full_name)
+            if json.loads(schema_dump(query)) != json.loads(fast_dump(query)):
+                sys.exit('The serializations differ')
+
+            schema_time = measure(schema_dump, query, arguments.repeat)
+            fast_time = measure(fast_dump, query, arguments.repeat)
+            db.session.remove()
+
+    encoder = 'orjson' if serialization.orjson is not None else 'json'
+    print(f'{arguments.rows} rows (best of {arguments.repeat})')
+    print(f'  marshmallow + flask.json: {schema_time:8.3f}s')
+    print(f'  fast rows + {encoder}:{" " * (13 - len(encoder))}{fast_time:8.3f}s')
+    print(f'  speedup: {schema_time / fast_time:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""
+Synthetic sectors and collaborators for the benchmarks. The data is random but reproducible (seeded)
+"""
+import random
+from datetime import date, timedelta
+
+from database.database import db
+from models.collaborator_model import Collaborator
+from models.sector_model import Sector
+
+FIRST_NAMES = (
+    'Ana', 'Beatriz', 'Bernardino', 'Bruno', 'Camila', 'Carlos', 'Daniel', 'Eduarda', 'Fernanda', 'Gabriel',
+    'Helena', 'Igor', 'Joana', 'João', 'Juliana', 'Lucas', 'Mariana', 'Mateus', 'Natália', 'Pedro',
+    'Rafael', 'Sofia', 'Thiago', 'Vitória',
+)
+LAST_NAMES = (
+    'Almeida', 'Barbosa', 'Cardoso', 'Costa', 'Dias', 'Ferreira', 'Gomes', 'Lima', 'Martins', 'Melo',
+    'Oliveira', 'Pereira', 'Ribeiro', 'Rocha', 'Santos', 'Silva', 'Souza', 'Teixeira',
+)
+
+# Rows inserted at a time while seeding
+INSERT_BATCH_SIZE = 10000
+
+
+def sector_name(number):
+    return f'Sector {number:04d}'
+
+
+def full_name(rng):
+    return f'{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)} {rng.choice(LAST_NAMES)}'
+
+
+def birth_date(rng):
+    return date(year=1960, month=1, day=1) + timedelta(days=rng.randrange(45 * 365))
+
+
+def collaborator(collab_number, sector, rng):
+    """
+    :return: The JSON of a random collaborator, as sent to the API
+    """
+    return {
+        'collab_number': collab_number,
+        'full_name': full_name(rng),
+        'birth_date': birth_date(rng).isoformat(),
+        'current_salary': round(rng.uniform(1000, 30000), 2),
+        'active': rng.random() < 0.9,
+        'sector_name': sector,
+    }
+
+
+def seed(sectors, collaborators, seed=0):
+    """
+    Fills the database of the current app with random sectors and collaborators
+    (numbered from 1 to the number of collaborators). Expects the tables to be empty
+    :param sectors: The number of sectors
+    :param collaborators: The number of collaborators
+    :param seed: The seed of the random data
+    :return: The names of the sectors
+    """
+    rng = random.Random(seed)
+    names = [sector_name(number) for number in range(sectors)]
+    db.session.execute(Sector.__table__.insert(), [{'name': name} for name in names])
+    sector_ids = dict(db.session.query(Sector.name, Sector.id))
+
+    rows = []
+    for collab_number in range(1, collaborators + 1):
+        row = collaborator(collab_number, rng.choice(names), rng)
+        row['sector_id'] = sector_ids[row.pop('sector_name')]
+        row['birth_date'] = date.fromisoformat(row['birth_date'])
+        rows.append(row)
+        if len(rows) == INSERT_BATCH_SIZE:
+            db.session.execute(Collaborator.__table__.insert(), rows)
+            rows = []
+    if rows:
+        db.session.execute(Collaborator.__table__.insert(), rows)
+
+    db.session.commit()
+    return names
@@ -0,0 +1,210 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Blueprint, Response, current_app, jsonify
+
+from core import conditional
+
+cache_methods = Blueprint('cache_methods', __name__)
+
+DEFAULT_SIZE = 10000
+DEFAULT_TTL = 60
+
+
+class MemoryCache:
+    """
+    In-process LRU cache whose entries expire after a TTL (in seconds)
+    """
+
+    def __init__(self, size=DEFAULT_SIZE, ttl=DEFAULT_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache:
+    """
+    Cache stored in a SQLite file, shared by every process (worker) that opens the same file.
+    Stands in for a shared cache server when running on a single machine
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL):
+        self.ttl = ttl
+        self.path = path
+        self._lock = threading.Lock()
+        self._pid = None
+        self._open()
+
+    @property
+    def _connection(self):
+        # A SQLite connection can't be used across fork(), so each worker process opens its own
+        if self._pid != os.getpid():
+            self._open()
+        return self.__connection
+
+    def _open(self):
+        self.__connection = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._pid = os.getpid()
+        self.__connection.execute('PRAGMA journal_mode=WAL')
+        self.__connection.execute(
+            'CREATE TABLE IF NOT EXISTS response_cache (key TEXT PRIMARY KEY, value BLOB, expires_at REAL)'
+        )
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT value FROM response_cache WHERE key = ? AND expires_at >= ?', (key, time.time())
+            ).fetchone()
+        return row and row[0]
+
+    def set(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, value, now + self.ttl)
+            )
+            self._connection.execute('DELETE FROM response_cache WHERE expires_at < ?', (now,))
+
+    def delete(self, *keys):
+        with self._lock:
+            self._connection.executemany('DELETE FROM response_cache WHERE key = ?', [(key,) for key in keys])
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute('SELECT COUNT(*) FROM response_cache').fetchone()[0]
+
+
+class ResponseCache:
+    """
+    Read-through cache of serialized JSON responses, with hit/miss counters.
+    Only successful responses are cached, and the write handlers invalidate the entries they change.
+    Each entry is stored with the versions of the tables its response reads, and only served while they
+    are the same, since a write handled by another process (worker) invalidates the entries of its own cache only
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_or_set(self, key, produce, version=''):
+        """
+        Returns the cached response of a key. On a miss, the response is produced,
+        and cached if successful
+        :param key: The cache key (see collaborator_key() and sector_key())
+        :param produce: Function that builds the (response, status code) tuple
+        :param version: The version of the data the response reads. An entry cached with another version is a miss
+        :return: A (response, status code) tuple
+        """
+        if self.backend is None:
+            return produce()
+
+        tag = version.encode() + b'\n'
+        value = self.backend.get(key)
+        if value is not None and value.startswith(tag):
+            self.hits += 1
+            return Response(value[len(tag):], mimetype='application/json'), 200
+
+        self.misses += 1
+        response, code = produce()
+        if code == 200:
+            self.backend.set(key, tag + response.get_data())
+        return response, code
+
+    def invalidate(self, *keys):
+        if self.backend is None:
+            return
+        self.invalidations += len(keys)
+        self.backend.delete(*keys)
+
+    def stats(self):
+        return {
+            'Backend': type(self.backend).__name__ if self.backend is not None else None,
+            'Size': len(self.backend) if self.backend is not None else 0,
+            'Hits': self.hits,
+            'Misses': self.misses,
+            'Invalidations': self.invalidations,
+        }
+
+
+def collaborator_key(collab_number):
+    return f'collaborator:{collab_number}'
+
+
+def sector_key(name):
+    return f'sector:{name}'
+
+
+def configure(app):
+    """
+    Creates the response cache of the app, according to its config:
+    RESPONSE_CACHE is 'memory' (default), a path to a SQLite file (shared by the workers) or None (disabled),
+    RESPONSE_CACHE_SIZE is the number of entries kept in memory and RESPONSE_CACHE_TTL their lifetime in seconds
+    """
+    kind = app.config.setdefault('RESPONSE_CACHE', 'memory')
+    size = app.config.setdefault('RESPONSE_CACHE_SIZE', DEFAULT_SIZE)
+    ttl = app.config.setdefault('RESPONSE_CACHE_TTL', DEFAULT_TTL)
+
+    if not kind:
+        backend = None
+    elif kind == 'memory':
+        backend = MemoryCache(size=size, ttl=ttl)
+    else:
+        backend = SQLiteCache(kind, ttl=ttl)
+
+    app.cache = ResponseCache(backend)
+    app.register_blueprint(cache_methods)
+
+
+def get_or_set(key, produce, tables=()):
+    """
+    Returns the cached response of a key (see ResponseCache.get_or_set())
+    :param tables: The names of the tables the response reads
+    """
+    return current_app.cache.get_or_set(key, produce, version=repr(conditional.versions(*tables)))
+
+
+def invalidate(*keys):
+    current_app.cache.invalidate(*keys)
+
+
+@cache_methods.route('/cache/stats', methods=['GET'])
+def stats():
+    """
+    Shows the counters of the response cache (of this process)
+    :return: JSON string containing the size, hits, misses and invalidations of the cache
+    """
+    return jsonify(current_app.cache.stats()), 200
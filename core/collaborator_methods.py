@@ -1,12 +1,38 @@
+import json
+from datetime import date, timedelta
+
 from flask import jsonify, Blueprint, request
+from marshmallow import ValidationError
+from sqlalchemy import case, or_, select
+from sqlalchemy.exc import IntegrityError
 
-from database import database
+from core import cache, filtering, pagination, serialization, streaming
+from core.conditional import conditional
+from database import database, search
 
 from models.sector_model import Sector
-from models.collaborator_model import collaborators_schema, Collaborator, collaborator_schema
+from models.collaborator_model import collaborators_schema, Collaborator, collaborator_schema, CollaboratorSchema, birthday
 
 collaborator_methods = Blueprint('collaborator_methods', __name__)
 
+# SQLite refuses statements with too many bound parameters, so IN lists are sent in chunks of this size
+MAX_IN_PARAMETERS = 900
+
+DEFAULT_SEARCH_LIMIT = 10
+MAX_SEARCH_LIMIT = 100
+
+# Every birthday falls within a year from any day
+MAX_BIRTHDAY_DAYS = 366
+
+# The indexes that may answer a query of /collaborators/query (see core.filtering).
+# A query that none of them serves would scan the whole table, so it is refused
+QUERY_PLANS = (
+    filtering.Plan('ix_collaborator_collab_number', (), 'collab_number'),
+    filtering.Plan('ix_collaborator_sector_id_active_current_salary', ('sector_name', 'active'), 'current_salary'),
+    filtering.Plan('ix_collaborator_birth_date', (), 'birth_date'),
+    filtering.Plan('ix_collaborator_full_name_id', (), 'full_name'),
+)
+
 
 @collaborator_methods.route('/collaborators/add/<int:collab_number>', methods=['POST'])
 def add(collab_number):
@@ -16,18 +42,14 @@ def add(collab_number):
     :return: JSON string containing data about the collaborator, if added successfully.
     Else, a JSON string with an error message
     """
-    # Validate the json
-    errors = collaborator_schema.validate(request.json)
-    if errors:
-        return jsonify(errors), 422
-
-    # Check whether the Collaborator does not already exist
-    collaborator = Collaborator.query.filter_by(collab_number=collab_number).first()
-    if collaborator:
-        return jsonify({'Error': f'Collaborator already exists with number = {collab_number}'}), 409
+    # Validate the json (and parse its values)
+    try:
+        data = collaborator_schema.load(request.json)
+    except ValidationError as error:
+        return jsonify(error.messages), 422
 
     # Locate the sector based on its name
-    sector_name = request.json['sector_name']
+    sector_name = data['sector_name']
     sector = Sector.query.filter_by(name=sector_name).first()
 
     # Verify whether the Sector exists (we can't add a collaborator to a Sector that doesn't exist)
@@ -36,73 +58,396 @@ def add(collab_number):
 
     # Insert the collaborator and persist the data
     new_collaborator = Collaborator(
-        collab_number=request.json['collab_number'],
-        full_name=request.json['full_name'],
-        birth_date=request.json['birth_date'],
-        current_salary=request.json['current_salary'],
-        active=request.json['active'],
+        collab_number=data['collab_number'],
+        full_name=data['full_name'],
+        birth_date=data['birth_date'],
+        current_salary=data['current_salary'],
+        active=data['active'],
         sector_name=sector_name,
     )
     new_collaborator.sector = sector
-    database.insert(new_collaborator)
+
+    # The unique index on collab_number rejects collaborators that already exist
+    try:
+        database.insert(new_collaborator)
+    except IntegrityError:
+        return jsonify({'Error': f'Collaborator already exists with number = {collab_number}'}), 409
+    cache.invalidate(cache.collaborator_key(new_collaborator.collab_number))
 
     return collaborator_schema.jsonify(new_collaborator), 200
 
 
+@collaborator_methods.route('/collaborators/add/bulk', methods=['POST'])
+def add_bulk():
+    """
+    Inserts many collaborators at once. The body is either a JSON array or NDJSON
+    (one collaborator per line, sent with the application/x-ndjson content type).
+    Valid records are written with a single batched INSERT in one transaction
+    :return: JSON string containing the number of inserted collaborators and the errors
+    of the rejected records, keyed by their position in the body
+    """
+    candidates, errors, sector_ids = _load_bulk_body()
+    if candidates is None:
+        return jsonify({'Error': 'Expected a JSON array or NDJSON body'}), 422
+
+    # Find the collaborators that already exist with one set-based query
+    collab_numbers = {record['collab_number'] for record in candidates.values()}
+    existing = {
+        number for chunk in _chunks(collab_numbers)
+        for number, in Collaborator.query.with_entities(Collaborator.collab_number)
+        .filter(Collaborator.collab_number.in_(chunk))
+    }
+
+    rows = []
+    seen = set()
+    for index, record in candidates.items():
+        collab_number = record['collab_number']
+        sector_name = record['sector_name']
+        if collab_number in existing or collab_number in seen:
+            errors[index] = {'Error': f'Collaborator already exists with number = {collab_number}'}
+        elif sector_name not in sector_ids:
+            errors[index] = {'Error': f'Sector not found with name = {sector_name}'}
+        else:
+            seen.add(collab_number)
+            rows.append({
+                'collab_number': collab_number,
+                'full_name': record['full_name'],
+                'birth_date': record['birth_date'],
+                'current_salary': record['current_salary'],
+                'active': record['active'],
+                'sector_id': sector_ids[sector_name],
+            })
+
+    # Insert all the valid collaborators and persist the data
+    # (a collaborator added concurrently by another request makes the whole batch fail)
+    try:
+        database.bulk_insert(Collaborator.__table__, rows)
+    except IntegrityError:
+        return jsonify({'Error': 'Some collaborators were added concurrently, please retry'}), 409
+    cache.invalidate(*(cache.collaborator_key(row['collab_number']) for row in rows))
+
+    return jsonify({'Inserted': len(rows), 'Errors': {str(index): errors[index] for index in sorted(errors)}}), 200
+
+
+def _load_bulk_body():
+    """
+    Parses and validates the collaborators of a bulk request
+    :return: A tuple with the valid records keyed by their position in the body (None if the body
+    is not a list of records), the errors of the other records, and the ids of their sectors by name
+    """
+    records, parse_errors = _read_bulk_body()
+    if records is None:
+        return None, {}, {}
+
+    # Validate (and parse) every record at once (errors are keyed by the index of the record)
+    try:
+        records = CollaboratorSchema(many=True).load(records)
+        errors = {}
+    except ValidationError as error:
+        records, errors = error.valid_data, error.messages
+    errors.update(parse_errors)
+    candidates = {index: record for index, record in enumerate(records) if index not in errors}
+
+    # Resolve all sector names with one set-based query
+    sector_names = {record['sector_name'] for record in candidates.values()}
+    sector_ids = {
+        name: sector_id for chunk in _chunks(sector_names)
+        for name, sector_id in Sector.query.with_entities(Sector.name, Sector.id).filter(Sector.name.in_(chunk))
+    }
+    return candidates, errors, sector_ids
+
+
+def _read_bulk_body():
+    """
+    Parses the body of a bulk request
+    :return: A tuple with the list of records (None if the body is not a list of records)
+    and the errors of the lines that could not be parsed
+    """
+    if request.mimetype == 'application/x-ndjson':
+        records, errors = [], {}
+        lines = (line for line in request.get_data(as_text=True).splitlines() if line.strip())
+        for index, line in enumerate(lines):
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                records.append({})
+                errors[index] = {'Error': 'Invalid JSON'}
+        return records, errors
+
+    records = request.get_json(silent=True)
+    if not isinstance(records, list):
+        return None, {}
+    return records, {}
+
+
+def _chunks(values):
+    values = list(values)
+    for start in range(0, len(values), MAX_IN_PARAMETERS):
+        yield values[start:start + MAX_IN_PARAMETERS]
+
+
 @collaborator_methods.route('/collaborators/all', methods=['GET'])
+@conditional(Collaborator.__tablename__, Sector.__tablename__)
 def list_all_collaborators():
     """
-    Lists the collaborators in the database (ordered by name)
+    Lists the collaborators in the database (ordered by name). If a limit or a cursor
+    is given (?limit=100&cursor=...), only one page of the listing is returned,
+    along with the cursor of the next page. With Accept: application/x-ndjson, the whole
+    listing is streamed instead (one collaborator per line). With ?fields=collab_number,full_name,
+    only those fields are read and returned
     :return: JSON string containing data about all collaborators, if found.
     Else, a JSON string with an error message
     """
-    all_collaborators = Collaborator.query.order_by(Collaborator.full_name).all()
-    result = collaborators_schema.dump(all_collaborators)
+    try:
+        fields = serialization.requested_fields(Collaborator)
+    except ValueError as error:
+        return jsonify({'Error': str(error)}), 422
+
+    if pagination.is_paginated():
+        return _list_collaborators_page(fields)
+
+    query = Collaborator.query.order_by(Collaborator.full_name)
+    if streaming.wants_ndjson():
+        return streaming.ndjson_response(query, Collaborator, collaborator_schema, fields)
+
+    result = serialization.dump(query, Collaborator, collaborators_schema, fields)
     if not result:
         return jsonify({'Error': 'No collaborators found'}), 404
-    return jsonify(result)
+    return serialization.json_response(result)
+
+
+def _list_collaborators_page(fields):
+    key_columns = (Collaborator.full_name, Collaborator.id)
+    try:
+        limit, cursor = pagination.page_arguments(key_columns)
+    except ValueError as error:
+        return jsonify({'Error': str(error)}), 422
+
+    items, next_cursor = pagination.dump_page(Collaborator.query, Collaborator, collaborators_schema,
+                                              key_columns, limit, cursor, fields)
+    if not items and cursor is None:
+        return jsonify({'Error': 'No collaborators found'}), 404
+    return serialization.json_response({'Items': items, 'Next': next_cursor})
 
 
 @collaborator_methods.route('/collaborators/all/<int:lower_bound>/<int:upper_bound>', methods=['GET'])
+@conditional(Collaborator.__tablename__, Sector.__tablename__)
 def list_all_collaborators_in_range(lower_bound, upper_bound):
     """
-    Lists the collaborators in the database in a range
+    Lists the collaborators in the database in a range. With Accept: application/x-ndjson,
+    the listing is streamed (one collaborator per line). Accepts ?fields= (see list_all_collaborators())
     :return: JSON string containing data about all collaborators, if found.
     Else, a JSON string with an error message
     """
+    try:
+        fields = serialization.requested_fields(Collaborator)
+    except ValueError as error:
+        return jsonify({'Error': str(error)}), 422
+
     # There is no need to check the lower bound and upper bound values
     # since flask only accepts positive integers
-    all_collaborators = Collaborator.query.filter(
-        Collaborator.collab_number.between(lower_bound, upper_bound)).all()
+    query = Collaborator.query.filter(Collaborator.collab_number.between(lower_bound, upper_bound))
+    if streaming.wants_ndjson():
+        return streaming.ndjson_response(query, Collaborator, collaborator_schema, fields)
 
-    result = collaborators_schema.dump(all_collaborators)
+    result = serialization.dump(query, Collaborator, collaborators_schema, fields)
     if not result:
         return jsonify({'Error': 'No collaborators found'}), 404
-    return jsonify(result)
+    return serialization.json_response(result)
 
 
 @collaborator_methods.route('/collaborators/all/<string:name>', methods=['GET'])
+@conditional(Collaborator.__tablename__, Sector.__tablename__)
 def list_collaborators_filtered_by_name(name):
     """
     Lists the collaborators in the database filtered by name. In other words,
     returns one or more collaborators if the given name is a substring of any
-    collaborator's name in the database
+    collaborator's name in the database. With Accept: application/x-ndjson,
+    the listing is streamed (one collaborator per line). Accepts ?fields= (see list_all_collaborators())
     :param name: The name to be matched
     :return: JSON string containing data about collaborators, if found.
     Else, a JSON string with an error message
     """
-    all_collaborators = Collaborator\
+    try:
+        fields = serialization.requested_fields(Collaborator)
+    except ValueError as error:
+        return jsonify({'Error': str(error)}), 422
+
+    pattern = '%' + name + '%'
+
+    # The search index answers the LIKE without scanning the whole table
+    if search.is_available():
+        name_filter = Collaborator.id.in_(search.like_ids(Collaborator.__table__, 'full_name', pattern))
+    else:
+        name_filter = Collaborator.full_name.like(pattern)
+
+    query = Collaborator\
         .query\
-        .filter(Collaborator.full_name.like('%' + name + '%'))\
-        .order_by(Collaborator.full_name).all()
+        .filter(name_filter)\
+        .order_by(Collaborator.full_name)
+    if streaming.wants_ndjson():
+        return streaming.ndjson_response(query, Collaborator, collaborator_schema, fields)
 
-    result = collaborators_schema.dump(all_collaborators)
+    result = serialization.dump(query, Collaborator, collaborators_schema, fields)
+    if not result:
+        return jsonify({'Error': 'Not found'}), 404
+    return serialization.json_response(result)
+
+
+@collaborator_methods.route('/collaborators/born/<string:start>/<string:end>', methods=['GET'])
+@conditional(Collaborator.__tablename__, Sector.__tablename__)
+def list_collaborators_born_between(start, end):
+    """
+    Lists the collaborators born between two dates (YYYY-MM-DD, both included), the oldest first.
+    An age bracket is a range of birth dates: e.g. from 30 to 39 years old, born between
+    40 years ago (plus a day) and 30 years ago. With Accept: application/x-ndjson, the listing is streamed
+    (one collaborator per line). Accepts ?fields= (see list_all_collaborators())
+    :param start: The first birth date
+    :param end: The last birth date
+    :return: JSON string containing data about the collaborators, if found.
+    Else, a JSON string with an error message
+    """
+    try:
+        fields = serialization.requested_fields(Collaborator)
+    except ValueError as error:
+        return jsonify({'Error': str(error)}), 422
+
+    try:
+        start, end = date.fromisoformat(start), date.fromisoformat(end)
+    except ValueError:
+        return jsonify({'Error': 'The dates must be in the YYYY-MM-DD format'}), 422
+
+    # Answered by the index on the birth date
+    query = Collaborator.query\
+        .filter(Collaborator.birth_date.between(start, end))\
+        .order_by(Collaborator.birth_date, Collaborator.id)
+    if streaming.wants_ndjson():
+        return streaming.ndjson_response(query, Collaborator, collaborator_schema, fields)
+
+    result = serialization.dump(query, Collaborator, collaborators_schema, fields)
+    if not result:
+        return jsonify({'Error': 'No collaborators found'}), 404
+    return serialization.json_response(result)
+
+
+# The answer depends on the current date, so it has no ETag (see conditional())
+@collaborator_methods.route('/collaborators/birthdays/<int:days>', methods=['GET'])
+def list_upcoming_birthdays(days):
+    """
+    Lists the collaborators whose birthday is within the next days (today included), the nearest first.
+    The days are counted from ?from=YYYY-MM-DD (default: today). Accepts ?fields= (see list_all_collaborators())
+    :param days: The number of days after today (0 for the birthdays of today only)
+    :return: JSON string containing data about the collaborators, if found.
+    Else, a JSON string with an error message
+    """
+    try:
+        fields = serialization.requested_fields(Collaborator)
+    except ValueError as error:
+        return jsonify({'Error': str(error)}), 422
+
+    if days > MAX_BIRTHDAY_DAYS:
+        return jsonify({'Error': f'The number of days must be at most {MAX_BIRTHDAY_DAYS}'}), 422
+    try:
+        today = date.fromisoformat(request.args['from']) if 'from' in request.args else date.today()
+    except ValueError:
+        return jsonify({'Error': 'The date must be in the YYYY-MM-DD format'}), 422
+
+    # The birthdays are compared as 'MM-DD', answered by the index on that expression.
+    # A range that goes past the end of the year wraps around to its beginning
+    first = today.strftime('%m-%d')
+    last = (today + timedelta(days=days)).strftime('%m-%d')
+    query = Collaborator.query
+    if days < 365:
+        if first <= last:
+            query = query.filter(birthday.between(first, last))
+        else:
+            query = query.filter(or_(birthday >= first, birthday <= last))
+
+    # This year's birthdays first, then the ones of the next year
+    query = query.order_by(case([(birthday < first, 1)], else_=0), birthday, Collaborator.full_name)
+    if streaming.wants_ndjson():
+        return streaming.ndjson_response(query, Collaborator, collaborator_schema, fields)
+
+    result = serialization.dump(query, Collaborator, collaborators_schema, fields)
+    if not result:
+        return jsonify({'Error': 'No collaborators found'}), 404
+    return serialization.json_response(result)
+
+
+@collaborator_methods.route('/collaborators/query', methods=['GET'])
+@conditional(Collaborator.__tablename__, Sector.__tablename__)
+def query_collaborators():
+    """
+    Lists the collaborators that match some filters, on any field: equality (?active=true),
+    ranges (?current_salary.gte=1000&current_salary.lt=5000, with lt, lte, gt and gte) and lists
+    (?sector_name.in=Limpeza,Tecnologia). Sorted by ?sort=-current_salary,full_name (- means descending),
+    up to ?limit=100 collaborators. Accepts ?fields= (see list_all_collaborators()).
+    The query must filter (or sort) by a field that leads an index (see QUERY_PLANS)
+    :return: JSON string containing the collaborators found (Items) and the index that answered the query (Plan).
+    Else, a JSON string with an error message
+    """
+    try:
+        fields = serialization.requested_fields(Collaborator)
+        filters = filtering.parse_filters(request.args, collaborator_schema)
+        sort = filtering.parse_sort(request.args.get('sort'), Collaborator.fields)
+        limit = pagination.limit_argument()
+    except ValueError as error:
+        return jsonify({'Error': str(error)}), 422
+
+    plan = filtering.choose_plan(QUERY_PLANS, filters, sort)
+    if plan is None:
+        indexed = ', '.join(
+            candidate.equality_fields[0] if candidate.equality_fields else candidate.range_field
+            for candidate in QUERY_PLANS
+        )
+        return jsonify({'Error': f'The query must filter (or sort) by one of: {indexed}'}), 422
+
+    query = filtering.apply(Collaborator.query, Collaborator, filters, sort)
+    result = serialization.dump(query, Collaborator, collaborators_schema, fields, limit)
+    if not result:
+        return jsonify({'Error': 'No collaborators found'}), 404
+    return serialization.json_response({'Items': result, 'Plan': plan.index})
+
+
+@collaborator_methods.route('/collaborators/search', methods=['GET'])
+@conditional(Collaborator.__tablename__, Sector.__tablename__)
+def search_collaborators():
+    """
+    Searches the collaborators by name (?q=joao&limit=10), best matches first.
+    Meant for type-ahead boxes: the text may be any part of the name
+    :return: JSON string containing data about the matching collaborators, if found.
+    Else, a JSON string with an error message
+    """
+    text = request.args.get('q', '').strip()
+    try:
+        limit = int(request.args.get('limit', DEFAULT_SEARCH_LIMIT))
+    except ValueError:
+        return jsonify({'Error': 'The limit must be an integer'}), 422
+    if not text or not 1 <= limit <= MAX_SEARCH_LIMIT:
+        return jsonify({'Error': f'Expected a text (q) and a limit between 1 and {MAX_SEARCH_LIMIT}'}), 422
+
+    if search.is_available() and len(text) >= search.MIN_QUERY_LENGTH:
+        # Rank the matches with the search index, then load only the best ones
+        ids = search.ranked_ids(Collaborator.__table__, 'full_name', text, limit)
+        collaborators_by_id = {
+            collaborator.id: collaborator for collaborator in Collaborator.query.filter(Collaborator.id.in_(ids))
+        }
+        collaborators = [collaborators_by_id[collaborator_id] for collaborator_id in ids]
+    else:
+        # Texts too short for the search index are matched as the beginning of the name
+        collaborators = Collaborator.query\
+            .filter(Collaborator.full_name.like(text + '%'))\
+            .order_by(Collaborator.full_name)\
+            .limit(limit).all()
+
+    result = collaborators_schema.dump(collaborators)
     if not result:
         return jsonify({'Error': 'Not found'}), 404
     return jsonify(result), 200
 
 
 @collaborator_methods.route('/collaborators/<int:collab_number>', methods=['GET'])
+@conditional(Collaborator.__tablename__, Sector.__tablename__)
 def get(collab_number):
     """
     Tries to get a collaborator in the database
@@ -110,12 +455,18 @@ def get(collab_number):
     :return: JSON string containing data about the collaborator, if found.
     Else, a JSON string with an error message
     """
-    # Check whether the Collaborator exists
-    collaborator = Collaborator.query.filter_by(collab_number=collab_number).first()
-    if not collaborator:
-        return jsonify({'Error': f'Collaborator not found with number = {collab_number}'}), 404
+    def produce():
+        # Check whether the Collaborator exists
+        collaborator = Collaborator.query.filter_by(collab_number=collab_number).first()
+        if not collaborator:
+            return jsonify({'Error': f'Collaborator not found with number = {collab_number}'}), 404
 
-    return collaborator_schema.jsonify(collaborator), 200
+        return collaborator_schema.jsonify(collaborator), 200
+
+    # The serialized collaborator is served from the cache, when present
+    return cache.get_or_set(
+        cache.collaborator_key(collab_number), produce, tables=(Collaborator.__tablename__, Sector.__tablename__)
+    )
 
 
 @collaborator_methods.route('/collaborators/update/<int:collab_number>', methods=['PUT'])
@@ -126,36 +477,105 @@ def update(collab_number):
     :return: JSON string containing data about the collaborator, if found.
     Else, a JSON string with an error message
     """
-    request_json = request.json
+    # Validate the json (and parse its values)
+    try:
+        data = collaborator_schema.load(request.json)
+    except ValidationError as error:
+        return jsonify(error.messages), 422
 
-    # Validate the json
-    errors = collaborator_schema.validate(request_json)
-    if errors:
-        return jsonify(errors), 422
+    # Reuse the parsed json to update the data
+    tmp_json = data.copy()
 
-    # Check whether the Collaborator exists
+    # Replace the sector_name field by the sector_id field (for internal house keeping),
+    # resolved by a subquery, so that the whole update is a single statement
+    sector_name = tmp_json.pop('sector_name')
+    tmp_json['sector_id'] = select([Sector.id]).where(Sector.name == sector_name).as_scalar()
+
+    # Apply the changes and persist the data
     query = Collaborator.query.filter_by(collab_number=collab_number)
-    collaborator = query.first()
-    if not collaborator:
+    try:
+        updated = database.update(query=query, json=tmp_json)
+    except IntegrityError:
+        # Either the sector doesn't exist (its id is NULL) or the new number belongs to another collaborator
+        if not Sector.query.filter_by(name=sector_name).first():
+            return jsonify({'Error': f'Sector not found with name = {sector_name}'}), 404
+        return jsonify({'Error': f'Collaborator already exists with number = {data["collab_number"]}'}), 409
+
+    # No row updated means that the Collaborator doesn't exist
+    if not updated:
         return jsonify({'Error': f'Collaborator not found with number = {collab_number}'}), 404
+    cache.invalidate(cache.collaborator_key(collab_number), cache.collaborator_key(data['collab_number']))
 
-    # Check whether the Sector exists
-    sector_name = request_json['sector_name']
-    sector = Sector.query.filter_by(name=sector_name).first()
-    if not sector:
-        return jsonify({'Error': f'Sector not found with name = {sector_name}'}), 404
-
-    # Reuse the request json to update the data
-    tmp_json = request_json.copy()
+    return collaborator_schema.jsonify(data), 200
 
-    # Remove the sector_name field and add the sector_id field (for internal house keeping)
-    del tmp_json['sector_name']
-    tmp_json['sector_id'] = collaborator.sector.id
 
-    # Apply the changes and persist the data
-    database.update(query=query, json=tmp_json)
-
-    return jsonify(request_json), 200
+@collaborator_methods.route('/collaborators/upsert/<int:collab_number>', methods=['PUT'])
+def upsert(collab_number):
+    """
+    Inserts a collaborator, or updates it if it already exists, with a single
+    INSERT ... ON CONFLICT (collab_number) DO UPDATE statement
+    :param collab_number: The number of the collaborator
+    :return: JSON string containing data about the collaborator, if written successfully.
+    Else, a JSON string with an error message
+    """
+    # Validate the json (and parse its values)
+    try:
+        data = collaborator_schema.load(request.json)
+    except ValidationError as error:
+        return jsonify(error.messages), 422
+    if data['collab_number'] != collab_number:
+        return jsonify({'Error': f'The collab_number of the body must be {collab_number}'}), 422
+
+    # The sector_id is resolved by a subquery, so that the whole upsert is a single statement
+    try:
+        database.bulk_upsert(Collaborator.__table__, [data], key='collab_number', expressions={
+            'sector_id': f'(SELECT id FROM {Sector.__tablename__} WHERE name = :sector_name)',
+        })
+    except IntegrityError:
+        # The sector doesn't exist (its id is NULL)
+        return jsonify({'Error': f'Sector not found with name = {data["sector_name"]}'}), 404
+    cache.invalidate(cache.collaborator_key(collab_number))
+
+    return collaborator_schema.jsonify(data), 200
+
+
+@collaborator_methods.route('/collaborators/upsert/bulk', methods=['PUT'])
+def upsert_bulk():
+    """
+    Inserts many collaborators at once, updating the ones that already exist. The body is either a JSON array
+    or NDJSON (one collaborator per line, sent with the application/x-ndjson content type).
+    Valid records are written with a single batched INSERT ... ON CONFLICT DO UPDATE in one transaction
+    :return: JSON string containing the number of written collaborators and the errors
+    of the rejected records, keyed by their position in the body
+    """
+    candidates, errors, sector_ids = _load_bulk_body()
+    if candidates is None:
+        return jsonify({'Error': 'Expected a JSON array or NDJSON body'}), 422
+
+    rows = []
+    for index, record in candidates.items():
+        sector_name = record['sector_name']
+        if sector_name not in sector_ids:
+            errors[index] = {'Error': f'Sector not found with name = {sector_name}'}
+        else:
+            rows.append({
+                'collab_number': record['collab_number'],
+                'full_name': record['full_name'],
+                'birth_date': record['birth_date'],
+                'current_salary': record['current_salary'],
+                'active': record['active'],
+                'sector_id': sector_ids[sector_name],
+            })
+
+    # Write all the valid collaborators and persist the data
+    # (a sector deleted concurrently by another request makes the whole batch fail)
+    try:
+        count = database.bulk_upsert(Collaborator.__table__, rows, key='collab_number')
+    except IntegrityError:
+        return jsonify({'Error': 'Some sectors were deleted concurrently, please retry'}), 409
+    cache.invalidate(*(cache.collaborator_key(row['collab_number']) for row in rows))
+
+    return jsonify({'Upserted': count, 'Errors': {str(index): errors[index] for index in sorted(errors)}}), 200
 
 
 @collaborator_methods.route('/collaborators/delete/<int:collab_number>', methods=['DELETE'])
@@ -173,5 +593,6 @@ def delete(collab_number):
 
     # Delete the data and persist the changes
     database.delete(the_object=collaborator)
+    cache.invalidate(cache.collaborator_key(collab_number))
 
     return jsonify({'Message': 'Successfully deleted'}), 200
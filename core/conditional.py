@@ -0,0 +1,76 @@
+import hashlib
+from functools import wraps
+
+from flask import Response, g, make_response, request
+
+from core import streaming
+from database import database
+
+
+def conditional(*table_names):
+    """
+    Adds an ETag and a Last-Modified header to the successful responses of a GET route,
+    computed from the versions of the tables it reads. A conditional request (If-None-Match or
+    If-Modified-Since) whose data hasn't changed gets a 304 without running the route at all
+    :param table_names: The names of the tables the route reads
+    """
+    def decorator(view):
+
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            versions = _read_versions(table_names)
+            etag = _etag(table_names, versions)
+            last_modified = max((modified_at for _, modified_at in versions.values()), default=None)
+
+            if _not_modified(etag, last_modified):
+                response = Response(status=304)
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            response.vary.add('Accept')
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def versions(*table_names):
+    """
+    Reads the versions of some tables, reusing the ones the request already read
+    :param table_names: The names of the tables
+    :return: A list with the version of each table (None for the tables never written)
+    """
+    read = _read_versions(table_names)
+    return [read.get(name, (None, None))[0] for name in table_names]
+
+
+def _read_versions(table_names):
+    # A GET request reads the same versions for its ETag and for its cached response, so they are read once
+    known = g.setdefault('table_versions', {})
+    missing = [name for name in table_names if name not in known]
+    if missing:
+        read = database.table_versions(*missing)
+        known.update({name: read.get(name) for name in missing})
+    return {name: known[name] for name in table_names if known[name] is not None}
+
+
+def _etag(table_names, versions):
+    # The streamed and the regular listings are different representations of the same url
+    representation = 'ndjson' if streaming.wants_ndjson() else 'json'
+    key = repr([(name, versions.get(name)) for name in table_names] + [representation])
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if request.if_modified_since and last_modified is not None:
+        # HTTP dates have a resolution of seconds
+        return last_modified.replace(microsecond=0) <= request.if_modified_since.replace(tzinfo=None)
+    return False
@@ -0,0 +1,144 @@
+"""
+Import of the collaborators from a CSV file (e.g. the monthly file of the HR vendor), with the columns
+of the export: collab_number, full_name, birth_date, current_salary, active and sector_name (other columns
+are ignored). The file is read line by line and written in chunks, each one a single transaction, so its size
+doesn't matter. Collaborators that already exist are updated. The rows that can't be imported
+are written to a reject file (with their line number and the error), and don't stop the import.
+"""
+import csv
+import json
+
+import click
+from flask.cli import with_appcontext
+from marshmallow import ValidationError
+from sqlalchemy.exc import IntegrityError
+
+from core import cache
+from database import database
+from models.collaborator_model import Collaborator, CollaboratorSchema
+from models.sector_model import Sector
+
+DEFAULT_CHUNK_SIZE = 10000
+
+
+class Import:
+    """
+    The state of an import: the sector ids by name (read once), the reject file and the counters
+    """
+
+    def __init__(self, reject_path):
+        self.sector_ids = dict(Sector.query.with_entities(Sector.name, Sector.id))
+        self.schema = CollaboratorSchema(many=True)
+        self.reject_path = reject_path
+        self.reject_file = None
+        self.reject_writer = None
+        self.read = 0
+        self.imported = 0
+        self.rejected = 0
+
+    def load(self, lines):
+        """
+        Validates and writes a chunk of the file
+        :param lines: A list of (line number, row) tuples, where a row is a dict read from the file
+        """
+        self.read += len(lines)
+
+        # Only the fields of the collaborators are read (the file may have other columns),
+        # and empty values are missing ones, so that the schema reports them
+        records = [{field: row[field] for field in Collaborator.fields if row[field] != ''} for _, row in lines]
+        try:
+            records = self.schema.load(records)
+            errors = {}
+        except ValidationError as error:
+            records, errors = error.valid_data, error.messages
+
+        rows = []
+        accepted = []
+        for index, (line_number, row) in enumerate(lines):
+            if index in errors:
+                self.reject(line_number, row, errors[index])
+                continue
+            record = records[index]
+            sector_id = self.sector_ids.get(record['sector_name'])
+            if sector_id is None:
+                self.reject(line_number, row, {'Error': f'Sector not found with name = {record["sector_name"]}'})
+                continue
+            rows.append({
+                'collab_number': record['collab_number'],
+                'full_name': record['full_name'],
+                'birth_date': record['birth_date'],
+                'current_salary': record['current_salary'],
+                'active': record['active'],
+                'sector_id': sector_id,
+            })
+            accepted.append((line_number, row))
+
+        # A chunk that fails as a whole (e.g. a sector deleted meanwhile) is rejected, and the import goes on
+        try:
+            database.bulk_upsert(Collaborator.__table__, rows, key='collab_number')
+        except IntegrityError as error:
+            for line_number, row in accepted:
+                self.reject(line_number, row, {'Error': str(error.orig)})
+            return
+        cache.invalidate(*(cache.collaborator_key(row['collab_number']) for row in rows))
+        self.imported += len(rows)
+
+    def reject(self, line_number, row, error):
+        # The reject file is only created if some row is rejected
+        if self.reject_writer is None:
+            self.reject_file = open(self.reject_path, 'w', newline='', encoding='utf-8')
+            self.reject_writer = csv.writer(self.reject_file)
+            self.reject_writer.writerow(('line', *Collaborator.fields, 'error'))
+        self.reject_writer.writerow((line_number, *(row.get(field) for field in Collaborator.fields), json.dumps(error)))
+        self.rejected += 1
+
+    def close(self):
+        if self.reject_file is not None:
+            self.reject_file.close()
+
+
+def chunks(reader, size):
+    """
+    Groups the rows of a CSV file
+    :param reader: A csv.DictReader
+    :param size: The number of rows of a chunk
+    :return: A generator of lists of (line number, row) tuples
+    """
+    chunk = []
+    for row in reader:
+        chunk.append((reader.line_num, row))
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+@click.command('import-collaborators')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--chunk-size', type=click.IntRange(1), default=DEFAULT_CHUNK_SIZE,
+              help='Rows written per transaction')
+@click.option('--rejects', 'reject_path', type=click.Path(dir_okay=False, writable=True),
+              help='File where the rejected rows are written (default: <file>.rejected.csv)')
+@with_appcontext
+def import_command(path, chunk_size, reject_path):
+    """Imports (adds or updates) the collaborators of a CSV file."""
+    reject_path = reject_path or f'{path}.rejected.csv'
+    with open(path, newline='', encoding='utf-8-sig') as file:
+        reader = csv.DictReader(file)
+        missing = set(Collaborator.fields) - set(reader.fieldnames or ())
+        if missing:
+            raise click.UsageError(f'Missing columns: {", ".join(sorted(missing))}')
+
+        the_import = Import(reject_path)
+        try:
+            for chunk in chunks(reader, chunk_size):
+                the_import.load(chunk)
+                click.echo(f'{the_import.read} rows read, {the_import.imported} imported, '
+                           f'{the_import.rejected} rejected', err=True)
+        finally:
+            the_import.close()
+
+    click.echo(f'Imported {the_import.imported} collaborators')
+    if the_import.rejected:
+        click.echo(f'Rejected {the_import.rejected} rows (see {reject_path})')
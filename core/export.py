@@ -0,0 +1,337 @@
+"""
+Bulk export of the collaborators and the sectors, for the analytics pipeline. The rows are read in batches
+(each one a query that seeks past the key of the previous batch through its unique index), and written
+as they are read, so the memory used doesn't depend on the size of the table. An export interrupted
+after some key is resumed from it (?after=... or --after).
+
+Formats:
+    csv     A header line, then one line per row
+    arrow   Arrow IPC stream, one record batch per batch of rows (requires pyarrow)
+    binary  Columnar, typed format, for when pyarrow isn't installed (see write_binary_header()
+            and read_binary())
+"""
+import csv
+import io
+import struct
+import sys
+from array import array
+from datetime import date
+
+import click
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from flask.cli import with_appcontext
+from marshmallow import ValidationError
+from sqlalchemy import Boolean, Date, Float, Integer
+
+from core import serialization
+from database.database import db
+from models.collaborator_model import Collaborator, CollaboratorSchema
+from models.sector_model import Sector, SectorSchema
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+except ImportError:
+    pyarrow = None
+
+export_methods = Blueprint('export_methods', __name__)
+
+DEFAULT_BATCH_SIZE = 10000
+MAX_BATCH_SIZE = 100000
+
+# The exported tables: the model, the schema that parses the resume key, and the (unique) key field
+EXPORTS = {
+    'collaborators': (Collaborator, CollaboratorSchema, 'collab_number'),
+    'sectors': (Sector, SectorSchema, 'name'),
+}
+
+MIMETYPES = {
+    'csv': 'text/csv',
+    'arrow': 'application/vnd.apache.arrow.stream',
+    'binary': 'application/octet-stream',
+}
+
+# Binary format: the magic number and version, then the columns (name and type code),
+# then the batches (number of rows and the values of each column), ended by a batch of 0 rows
+BINARY_MAGIC = b'COLB\x01'
+BINARY_INTEGER, BINARY_FLOAT, BINARY_BOOLEAN, BINARY_DATE, BINARY_STRING = b'ifbds'
+
+# Binary dates are the number of days since 1970-01-01
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+
+def formats():
+    """
+    :return: The available formats
+    """
+    return [name for name in MIMETYPES if name != 'arrow' or pyarrow is not None]
+
+
+def batches(table, after=None, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Reads the rows of a table in batches, ordered by its key
+    :param table: The name of the table (see EXPORTS)
+    :param after: Only the rows whose key is greater than this one are read (None for every row)
+    :param batch_size: The number of rows of a batch
+    :return: A generator of the batches (lists of rows, with the fields of the model, in order)
+    """
+    model, _, key_field = EXPORTS[table]
+    key_index = model.fields.index(key_field)
+    key_column = getattr(model, key_field)
+    while True:
+        query = model.query.order_by(key_column)
+        if after is not None:
+            query = query.filter(key_column > after)
+        rows = db.session.execute(serialization.project(query, model, limit=batch_size).statement).fetchall()
+        if not rows:
+            return
+        yield rows
+        after = rows[-1][key_index]
+
+
+def column_types(table):
+    """
+    :return: The binary type code of each field of a table
+    """
+    model = EXPORTS[table][0]
+    statement = serialization.project(model.query, model).statement
+    return [_type_code(column.type) for column in statement.columns]
+
+
+def _type_code(column_type):
+    # Boolean comes before Integer, since some dialects implement it as an integer
+    if isinstance(column_type, Boolean):
+        return BINARY_BOOLEAN
+    if isinstance(column_type, Integer):
+        return BINARY_INTEGER
+    if isinstance(column_type, Float):
+        return BINARY_FLOAT
+    if isinstance(column_type, Date):
+        return BINARY_DATE
+    return BINARY_STRING
+
+
+def export(table, export_format, row_batches):
+    """
+    Writes the batches of rows of a table in a format
+    :param table: The name of the table (see EXPORTS)
+    :param export_format: One of formats()
+    :param row_batches: The batches of rows (see batches())
+    :return: A generator of the chunks of the export (bytes)
+    """
+    fields = EXPORTS[table][0].fields
+    if export_format == 'csv':
+        return _csv_chunks(fields, row_batches)
+    if export_format == 'arrow':
+        return _arrow_chunks(fields, column_types(table), row_batches)
+    return _binary_chunks(fields, column_types(table), row_batches)
+
+
+def _csv_chunks(fields, row_batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    writer.writerow(fields)
+    for rows in row_batches:
+        writer.writerows(rows)
+        yield _take(buffer).encode()
+    yield _take(buffer).encode()
+
+
+def _take(buffer):
+    # Empties a buffer, returning what was written to it
+    value = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return value
+
+
+def _arrow_chunks(fields, types, row_batches):
+    arrow_types = {
+        BINARY_INTEGER: pyarrow.int64(), BINARY_FLOAT: pyarrow.float64(), BINARY_BOOLEAN: pyarrow.bool_(),
+        BINARY_DATE: pyarrow.date32(), BINARY_STRING: pyarrow.string(),
+    }
+    schema = pyarrow.schema([(name, arrow_types[code]) for name, code in zip(fields, types)])
+    buffer = io.BytesIO()
+    with pyarrow.ipc.new_stream(buffer, schema) as writer:
+        yield _take(buffer)
+        for rows in row_batches:
+            columns = [pyarrow.array(values, type=schema.field(index).type) for index, values in enumerate(zip(*rows))]
+            writer.write_batch(pyarrow.record_batch(columns, schema=schema))
+            yield _take(buffer)
+    yield _take(buffer)
+
+
+def write_binary_header(fields, types):
+    """
+    :return: The header of the binary format: the magic number, the number of columns,
+    and the name (length-prefixed UTF-8) and type code of each column
+    """
+    header = bytearray(BINARY_MAGIC)
+    header += struct.pack('<H', len(fields))
+    for name, code in zip(fields, types):
+        encoded = name.encode()
+        header += struct.pack('<H', len(encoded)) + encoded + bytes([code])
+    return bytes(header)
+
+
+def write_binary_batch(types, rows):
+    """
+    :return: A batch of the binary format: the number of rows, then the values of each column
+    (little-endian int64, float64, uint8 booleans, int32 days since 1970-01-01, or, for strings,
+    the int32 end offset of each string followed by their UTF-8 bytes)
+    """
+    chunk = bytearray(struct.pack('<I', len(rows)))
+    for code, values in zip(types, zip(*rows)):
+        if code == BINARY_STRING:
+            encoded = [value.encode() for value in values]
+            offsets = array('i')
+            end = 0
+            for value in encoded:
+                end += len(value)
+                offsets.append(end)
+            chunk += _little_endian(offsets) + b''.join(encoded)
+        elif code == BINARY_DATE:
+            chunk += _little_endian(array('i', [value.toordinal() - EPOCH_ORDINAL for value in values]))
+        elif code == BINARY_BOOLEAN:
+            chunk += bytes(values)
+        elif code == BINARY_FLOAT:
+            chunk += _little_endian(array('d', values))
+        else:
+            chunk += _little_endian(array('q', values))
+    return bytes(chunk)
+
+
+def _little_endian(values):
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def _binary_chunks(fields, types, row_batches):
+    yield write_binary_header(fields, types)
+    for rows in row_batches:
+        yield write_binary_batch(types, rows)
+    yield struct.pack('<I', 0)
+
+
+def read_binary(stream):
+    """
+    Reads a file in the binary format
+    :param stream: A binary file
+    :return: A tuple with the names of the columns and a generator of the rows (tuples)
+    """
+    if stream.read(len(BINARY_MAGIC)) != BINARY_MAGIC:
+        raise ValueError('Not a binary export')
+    count, = struct.unpack('<H', stream.read(2))
+    names, types = [], []
+    for _ in range(count):
+        length, = struct.unpack('<H', stream.read(2))
+        names.append(stream.read(length).decode())
+        types.append(stream.read(1)[0])
+
+    def rows():
+        while True:
+            size, = struct.unpack('<I', stream.read(4))
+            if not size:
+                return
+            yield from zip(*(_read_binary_column(stream, code, size) for code in types))
+
+    return names, rows()
+
+
+def _read_binary_column(stream, code, size):
+    def read_array(typecode, count):
+        values = array(typecode)
+        values.frombytes(stream.read(values.itemsize * count))
+        if sys.byteorder == 'big':
+            values.byteswap()
+        return values
+
+    if code == BINARY_STRING:
+        offsets = read_array('i', size)
+        data = stream.read(offsets[-1])
+        starts = [0] + list(offsets[:-1])
+        return [data[start:end].decode() for start, end in zip(starts, offsets)]
+    if code == BINARY_DATE:
+        return [date.fromordinal(value + EPOCH_ORDINAL) for value in read_array('i', size)]
+    if code == BINARY_BOOLEAN:
+        return [bool(value) for value in stream.read(size)]
+    if code == BINARY_FLOAT:
+        return list(read_array('d', size))
+    return list(read_array('q', size))
+
+
+def _parse_after(table, value):
+    # The resume key is parsed by the field of the schema (e.g. an integer collab_number)
+    _, schema, key_field = EXPORTS[table]
+    if value is None:
+        return None
+    try:
+        return schema().fields[key_field].deserialize(value)
+    except ValidationError:
+        raise ValueError(f'Invalid value for after: {value}')
+
+
+@export_methods.route('/export/<string:table>', methods=['GET'])
+def export_table(table):
+    """
+    Streams a whole table (collaborators or sectors), ordered by its key (collab_number or name).
+    ?format= is csv (default), arrow (if pyarrow is installed) or binary. ?after=<key> resumes an export
+    after the last key received, and ?batch_size= sets the number of rows read at a time
+    :param table: The name of the table
+    :return: The export, streamed. Else, a JSON string with an error message
+    """
+    if table not in EXPORTS:
+        return jsonify({'Error': f'Unknown table: {table}. The tables are: {", ".join(EXPORTS)}'}), 404
+
+    export_format = request.args.get('format', 'csv')
+    if export_format not in formats():
+        return jsonify({'Error': f'Unknown format: {export_format}. The formats are: {", ".join(formats())}'}), 422
+    try:
+        after = _parse_after(table, request.args.get('after'))
+        batch_size = int(request.args.get('batch_size', DEFAULT_BATCH_SIZE))
+    except ValueError as error:
+        return jsonify({'Error': str(error)}), 422
+    if not 1 <= batch_size <= MAX_BATCH_SIZE:
+        return jsonify({'Error': f'The batch size must be between 1 and {MAX_BATCH_SIZE}'}), 422
+
+    chunks = export(table, export_format, batches(table, after, batch_size))
+    response = Response(stream_with_context(chunks), mimetype=MIMETYPES[export_format])
+    extension = 'arrows' if export_format == 'arrow' else export_format
+    response.headers['Content-Disposition'] = f'attachment; filename={table}.{extension}'
+    return response
+
+
+@click.command('export')
+@click.argument('table', type=click.Choice(list(EXPORTS)))
+@click.argument('path', type=click.Path(dir_okay=False, writable=True))
+@click.option('--format', 'export_format', type=click.Choice(list(MIMETYPES)), default='csv')
+@click.option('--after', help='Export only the rows after this key (resumes an interrupted export)')
+@click.option('--batch-size', type=click.IntRange(1, MAX_BATCH_SIZE), default=DEFAULT_BATCH_SIZE)
+@with_appcontext
+def export_command(table, path, export_format, after, batch_size):
+    """Exports the collaborators or the sectors to a file (CSV, Arrow or binary)."""
+    if export_format not in formats():
+        raise click.UsageError(f'The {export_format} format requires pyarrow (pip install pyarrow)')
+    try:
+        after = _parse_after(table, after)
+    except ValueError as error:
+        raise click.UsageError(str(error))
+
+    key_index = EXPORTS[table][0].fields.index(EXPORTS[table][2])
+    exported = 0
+    last_key = after
+
+    def counted(row_batches):
+        # Reports the progress, with the key to resume from if the export is interrupted
+        nonlocal exported, last_key
+        for rows in row_batches:
+            yield rows
+            exported += len(rows)
+            last_key = rows[-1][key_index]
+            click.echo(f'{exported} rows exported (last key: {last_key})', err=True)
+
+    with open(path, 'wb') as file:
+        for chunk in export(table, export_format, counted(batches(table, after, batch_size))):
+            file.write(chunk)
+    click.echo(f'Exported {exported} {table} to {path}')
@@ -0,0 +1,133 @@
+import operator
+from collections import namedtuple
+
+from marshmallow import ValidationError
+from sqlalchemy import select
+
+# Filter operators, written after the field (?current_salary.gte=1000). A field alone means equality
+OPERATORS = {
+    'eq': operator.eq,
+    'lt': operator.lt,
+    'lte': operator.le,
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'in': lambda column, values: column.in_(values),
+}
+
+# Query arguments that are not filters
+RESERVED_ARGUMENTS = ('sort', 'limit', 'fields')
+
+# Each value of a filter is a bound parameter, and old SQLite builds accept at most 999 of them in a statement
+MAX_IN_VALUES = 100
+MAX_FILTER_VALUES = 500
+
+Filter = namedtuple('Filter', 'field operator value')
+
+
+class Plan(namedtuple('Plan', 'index equality_fields range_field')):
+    """
+    A way of answering a query through an index: the index columns are the equality fields
+    (filtered by eq or in, in this order), then the range field (filtered by any operator, or sorted by)
+    """
+
+    def serves(self, filters, sort):
+        constrained = {item.field: item.operator for item in filters}
+        if self.equality_fields:
+            # The leading column of the index must be constrained to some values
+            return constrained.get(self.equality_fields[0]) in ('eq', 'in')
+        return self.range_field in constrained or bool(sort) and sort[0][0] == self.range_field
+
+
+def parse_filters(arguments, schema):
+    """
+    Reads the filters of a query (?full_name=Ana&current_salary.gte=1000&sector_name.in=Limpeza,Tecnologia)
+    :param arguments: The query arguments (request.args)
+    :param schema: The schema of the model, whose fields parse the values
+    :return: A list of filters
+    :raises ValueError: If a field, an operator or a value is not valid
+    """
+    filters = []
+    for key, raw_value in arguments.items(multi=True):
+        if key in RESERVED_ARGUMENTS:
+            continue
+        field, _, operator_name = key.partition('.')
+        operator_name = operator_name or 'eq'
+        if field not in schema.fields:
+            raise ValueError(f'Unknown field: {field}. The fields are: {", ".join(schema.fields)}')
+        if operator_name not in OPERATORS:
+            raise ValueError(f'Unknown operator: {operator_name}. The operators are: {", ".join(OPERATORS)}')
+
+        try:
+            if operator_name == 'in':
+                items = raw_value.split(',')
+                if len(items) > MAX_IN_VALUES:
+                    raise ValueError(f'Too many values for {field}: at most {MAX_IN_VALUES} are accepted')
+                value = [schema.fields[field].deserialize(item) for item in items]
+            else:
+                value = schema.fields[field].deserialize(raw_value)
+        except ValidationError as error:
+            raise ValueError(f'Invalid value for {field}: {" ".join(error.messages)}')
+        filters.append(Filter(field, operator_name, value))
+
+    if sum(len(item.value) if item.operator == 'in' else 1 for item in filters) > MAX_FILTER_VALUES:
+        raise ValueError(f'Too many filter values: at most {MAX_FILTER_VALUES} are accepted')
+    return filters
+
+
+def parse_sort(argument, fields):
+    """
+    Reads the sort keys of a query (?sort=-current_salary,full_name, where - means descending)
+    :param argument: The sort argument (None when missing)
+    :param fields: The fields that may be sorted by
+    :return: A list of (field, descending) tuples
+    :raises ValueError: If a field is not valid
+    """
+    sort = []
+    for key in (argument or '').split(','):
+        key = key.strip()
+        if not key:
+            continue
+        field = key.lstrip('-')
+        if field not in fields:
+            raise ValueError(f'Unknown sort field: {field}. The fields are: {", ".join(fields)}')
+        sort.append((field, key.startswith('-')))
+    return sort
+
+
+def choose_plan(plans, filters, sort):
+    """
+    :return: The first of the plans that serves the query (None if none of them does)
+    """
+    return next((plan for plan in plans if plan.serves(filters, sort)), None)
+
+
+def apply(query, model, filters, sort):
+    """
+    Adds the filters and the sort keys to a query over a model, making a single parameterized statement.
+    The fields in model.joined_fields are filtered through a subquery on the related table (e.g. the sector_id
+    of the sectors with the given names), so that the filter is answered by the index on the foreign key
+    :param query: The query over the model
+    :param model: The model
+    :param filters: The filters (see parse_filters())
+    :param sort: The sort keys (see parse_sort()). The rows are sorted by their primary key last
+    :return: The query
+    """
+    joined_fields = getattr(model, 'joined_fields', {})
+    for item in filters:
+        compare = OPERATORS[item.operator]
+        if item.field in joined_fields:
+            relationship_name, attribute = joined_fields[item.field]
+            relationship = getattr(model, relationship_name).property
+            (local, remote), = relationship.local_remote_pairs
+            related = getattr(relationship.mapper.class_, attribute)
+            query = query.filter(local.in_(select([remote]).where(compare(related, item.value))))
+        else:
+            query = query.filter(compare(getattr(model, item.field), item.value))
+
+    order = [getattr(model, field).desc() if descending else getattr(model, field) for field, descending in sort]
+
+    # The primary key breaks the ties, in the direction of the last key (so that an index on the keys
+    # and the primary key can be read backwards)
+    descending = bool(sort) and sort[-1][1]
+    order.extend(column.desc() if descending else column for column in model.__mapper__.primary_key)
+    return query.order_by(*order)
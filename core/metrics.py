@@ -0,0 +1,184 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import Blueprint, current_app, g, has_app_context, jsonify, request
+from sqlalchemy import event
+
+from database.database import db
+
+metrics_methods = Blueprint('metrics_methods', __name__)
+
+# Upper bounds of the buckets of the time histograms, in milliseconds (the last bucket has no bound)
+TIME_BUCKETS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Upper bounds of the buckets of the histogram of the number of SQL statements per request
+STATEMENT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def to_dict(self):
+        bounds = [str(bound) for bound in self.buckets] + ['+Inf']
+        return {'Count': self.count, 'Sum': round(self.sum, 3), 'Buckets': dict(zip(bounds, self.counts))}
+
+
+class RequestMetrics:
+    """
+    What a single request spent its time on (in milliseconds)
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_time = 0
+        self.sql_statements = 0
+        self.serialization_time = 0
+
+    def elapsed(self):
+        return (time.perf_counter() - self.start) * 1000
+
+
+class Metrics:
+    """
+    Histograms of the time spent by the requests of each route (in this process)
+    """
+
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def record(self, route, request_metrics, total_time):
+        with self._lock:
+            histograms = self._routes.get(route)
+            if histograms is None:
+                histograms = self._routes[route] = {
+                    'Time': Histogram(TIME_BUCKETS),
+                    'SqlTime': Histogram(TIME_BUCKETS),
+                    'SqlStatements': Histogram(STATEMENT_BUCKETS),
+                    'SerializationTime': Histogram(TIME_BUCKETS),
+                }
+            histograms['Time'].observe(total_time)
+            histograms['SqlTime'].observe(request_metrics.sql_time)
+            histograms['SqlStatements'].observe(request_metrics.sql_statements)
+            histograms['SerializationTime'].observe(request_metrics.serialization_time)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                route: dict({'Requests': histograms['Time'].count},
+                            **{name: histogram.to_dict() for name, histogram in histograms.items()})
+                for route, histograms in sorted(self._routes.items())
+            }
+
+
+def configure(app):
+    """
+    Sets up the instrumentation of the requests, when METRICS is true (app config, or the environment variable):
+    each response gets a Server-Timing header with its total time, the time spent running SQL statements
+    (and how many) and the time spent serializing, and the histograms of these are served at /metrics.
+    When it is off, nothing is hooked into the app
+    """
+    app.config.setdefault('METRICS', os.environ.get('METRICS', '').lower() in ('1', 'true', 'yes', 'on'))
+    app.metrics = None
+    if not app.config['METRICS']:
+        return
+
+    app.metrics = Metrics()
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+
+    engine = db.get_engine(app)
+    event.listen(engine, 'before_cursor_execute', _before_cursor_execute)
+    event.listen(engine, 'after_cursor_execute', _after_cursor_execute)
+
+    # Encoding JSON (jsonify) counts as serialization
+    app.json_encoder = _timed_encoder(app.json_encoder)
+    app.register_blueprint(metrics_methods)
+
+
+@contextmanager
+def serialization_timer():
+    """
+    Adds the time spent in the block to the serialization time of the request (if it is being measured)
+    """
+    request_metrics = g.get('request_metrics') if has_app_context() else None
+    if request_metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        request_metrics.serialization_time += (time.perf_counter() - start) * 1000
+
+
+def _timed_encoder(encoder):
+
+    class TimedJSONEncoder(encoder):
+
+        def encode(self, o):
+            with serialization_timer():
+                return super().encode(o)
+
+    return TimedJSONEncoder
+
+
+def _start_request():
+    g.request_metrics = RequestMetrics()
+
+
+def _finish_request(response):
+    request_metrics = g.pop('request_metrics', None)
+    if request_metrics is None:
+        return response
+
+    # Streamed responses are measured until their headers are ready
+    total_time = request_metrics.elapsed()
+    response.headers['Server-Timing'] = ', '.join((
+        f'total;dur={total_time:.3f}',
+        f'sql;dur={request_metrics.sql_time:.3f};desc="{request_metrics.sql_statements} statements"',
+        f'serialization;dur={request_metrics.serialization_time:.3f}',
+    ))
+
+    route = f'{request.method} {request.url_rule.rule}' if request.url_rule is not None else 'unmatched'
+    current_app.metrics.record(route, request_metrics, total_time)
+    return response
+
+
+def _before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    # The start is kept on the execution of the statement, which goes away with it
+    # (after_cursor_execute doesn't fire for the statements that fail)
+    if context is not None:
+        context._metrics_start = time.perf_counter()
+
+
+def _after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    start = getattr(context, '_metrics_start', None)
+    # Statements run outside of a request (or by the group commit thread) are not attributed to any
+    request_metrics = g.get('request_metrics') if has_app_context() else None
+    if start is not None and request_metrics is not None:
+        request_metrics.sql_time += (time.perf_counter() - start) * 1000
+        request_metrics.sql_statements += 1
+
+
+@metrics_methods.route('/metrics', methods=['GET'])
+def metrics():
+    """
+    Shows the histograms of the time spent by the requests of each route (of this process):
+    the total time, the time spent running SQL statements, the number of statements and the serialization time
+    :return: JSON string containing the histograms (in milliseconds) of each route
+    """
+    return jsonify(current_app.metrics.to_dict()), 200
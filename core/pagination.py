@@ -0,0 +1,133 @@
+import base64
+import binascii
+import json
+
+from flask import request
+from sqlalchemy import tuple_
+
+from core import metrics, serialization
+from database.database import db
+
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+
+def is_paginated():
+    """
+    :return: Whether the client asked for a page (instead of the whole listing)
+    """
+    return 'limit' in request.args or 'cursor' in request.args
+
+
+def page_arguments(key_columns):
+    """
+    Reads the pagination arguments of the request (?limit=...&cursor=...)
+    :param key_columns: The columns that identify a row of the listing
+    :return: A tuple with the page size and the decoded cursor (None for the first page)
+    :raises ValueError: If the limit or the cursor are not valid
+    """
+    limit = limit_argument()
+    cursor = request.args.get('cursor')
+    if cursor is None:
+        return limit, None
+    key = decode_cursor(cursor)
+    if len(key) != len(key_columns):
+        raise ValueError('Invalid cursor')
+    return limit, key
+
+
+def limit_argument():
+    """
+    Reads the page size of the request (?limit=...)
+    :return: The page size (DEFAULT_PAGE_SIZE when missing)
+    :raises ValueError: If the limit is not valid
+    """
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError('The limit must be an integer')
+    if not 1 <= limit <= MAX_PAGE_SIZE:
+        raise ValueError(f'The limit must be between 1 and {MAX_PAGE_SIZE}')
+    return limit
+
+
+def keyset_page(query, key_columns, limit, cursor):
+    """
+    Fetches one page of a query ordered by the key columns. Instead of an OFFSET, the page
+    starts right after the key of the last row of the previous page, so the database seeks
+    straight to it through the index on the key columns, no matter how deep the page is
+    :param query: The query to be paginated
+    :param key_columns: The columns that identify a row, in the order of the listing (the last one must be unique)
+    :param limit: The number of rows in the page
+    :param cursor: The key of the last row of the previous page (None for the first page)
+    :return: A tuple with the rows of the page and the cursor of the next page (None for the last page)
+    """
+    # Fetch one row more than needed, to find out whether there is a next page
+    rows = _after_cursor(query, key_columns, cursor).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+
+    rows = rows[:limit]
+    last_row = rows[-1]
+    return rows, encode_cursor([getattr(last_row, column.key) for column in key_columns])
+
+
+def dump_page(query, model, schema, key_columns, limit, cursor, fields=None):
+    """
+    Serializes one page of a query (see keyset_page()) as serialization.dump() does: only the columns
+    of the fields are selected, and the rows are serialized without loading any object
+    :param query: An ORM query over the model
+    :param model: The model
+    :param schema: The schema of the model (many=True), used when the fast serialization is disabled
+    :param key_columns: The columns that identify a row, in the order of the listing (the last one must be unique)
+    :param limit: The number of rows in the page
+    :param cursor: The key of the last row of the previous page (None for the first page)
+    :param fields: The fields to be serialized (default: all the fields of the model)
+    :return: A tuple with the serialized rows of the page and the cursor of the next page (None for the last page)
+    """
+    if not serialization.is_enabled():
+        rows, next_cursor = keyset_page(query, key_columns, limit, cursor)
+        with metrics.serialization_timer():
+            return serialization.schema_of(schema, fields).dump(rows), next_cursor
+
+    # The key columns are selected after the fields, so the serializer (which zips the fields with the row) skips them.
+    # They are labeled, since a column that is a field too would be selected only once otherwise
+    key = [column.label(f'cursor_{index}') for index, column in enumerate(key_columns)]
+    query = serialization.project(_after_cursor(query, key_columns, cursor), model, fields,
+                                  limit=limit + 1, extra_columns=key)
+    rows = db.session.execute(query.statement).fetchall()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(list(rows[-1][-len(key_columns):]))
+
+    serialize = serialization.serializer_of(model, fields)
+    with metrics.serialization_timer():
+        return [serialize(row) for row in rows], next_cursor
+
+
+def _after_cursor(query, key_columns, cursor):
+    # The rows after the cursor, in the order of the key columns
+    if cursor is not None:
+        query = query.filter(tuple_(*key_columns) > tuple_(*cursor))
+    return query.order_by(*key_columns)
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (binascii.Error, ValueError):
+        raise ValueError('Invalid cursor')
+    # The key is a list of plain values (e.g. [{"a": 1}, 2] can't be compared with the key columns)
+    if not isinstance(key, list) or not all(_is_key_value(value) for value in key):
+        raise ValueError('Invalid cursor')
+    return key
+
+
+def _is_key_value(value):
+    # JSON booleans are ints in Python, but never the value of a key column
+    return isinstance(value, (str, int, float)) and not isinstance(value, bool)
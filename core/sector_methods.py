@@ -1,10 +1,18 @@
 from flask import jsonify, Blueprint, request
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.exc import IntegrityError
 
-from database import database
-from models.sector_model import Sector, sectors_schema, sector_schema
+from core import cache, pagination, serialization
+from core.conditional import conditional
+from database import database, search, summary
+from models.collaborator_model import Collaborator
+from models.sector_model import Sector, SectorSchema, sectors_schema, sector_schema
+from models.sector_summary_model import SectorSummary, sector_summaries_schema, sector_summary_schema
 
 sector_methods = Blueprint('sector_methods', __name__)
 
+DEFAULT_PERCENTILES = (25, 50, 75, 90, 99)
+
 
 @sector_methods.route('/sectors/add/<string:sector_name>', methods=['POST'])
 def add(sector_name):
@@ -19,33 +27,52 @@ def add(sector_name):
     if errors:
         return jsonify(errors), 422
 
-    # Check whether the Sector does not already exist
-    sector = Sector.query.filter_by(name=sector_name).first()
-    if sector:
-        return jsonify({'Error': f'Sector already exists with name = {sector_name}'}), 409
-
     # Create a new Sector and persist the data
+    # (the unique index on the name rejects sectors that already exist)
     new_sector = Sector(name=request.json['name'])
-    database.insert(new_sector)
+    try:
+        database.insert(new_sector)
+    except IntegrityError:
+        return jsonify({'Error': f'Sector already exists with name = {sector_name}'}), 409
+    cache.invalidate(cache.sector_key(new_sector.name))
 
     return sector_schema.jsonify(new_sector), 200
 
 
 @sector_methods.route('/sectors/all', methods=['GET'])
+@conditional(Sector.__tablename__)
 def list_all_sectors():
     """
-    Lists the sectors in the database (ordered by name)
+    Lists the sectors in the database (ordered by name). If a limit or a cursor
+    is given (?limit=100&cursor=...), only one page of the listing is returned,
+    along with the cursor of the next page
     :return: JSON string containing data about all sectors, if found.
     Else, a JSON string with an error message
     """
-    all_sectors = Sector.query.order_by(Sector.name).all()
-    result = sectors_schema.dump(all_sectors)
+    if pagination.is_paginated():
+        return _list_sectors_page()
+
+    result = serialization.dump(Sector.query.order_by(Sector.name), Sector, sectors_schema)
     if not result:
         return jsonify({'Error': 'No sectors found'}), 404
-    return jsonify(result)
+    return serialization.json_response(result)
+
+
+def _list_sectors_page():
+    key_columns = (Sector.name, Sector.id)
+    try:
+        limit, cursor = pagination.page_arguments(key_columns)
+    except ValueError as error:
+        return jsonify({'Error': str(error)}), 422
+
+    items, next_cursor = pagination.dump_page(Sector.query, Sector, sectors_schema, key_columns, limit, cursor)
+    if not items and cursor is None:
+        return jsonify({'Error': 'No sectors found'}), 404
+    return serialization.json_response({'Items': items, 'Next': next_cursor})
 
 
 @sector_methods.route('/sectors/all/<string:name>', methods=['GET'])
+@conditional(Sector.__tablename__)
 def list_sectors_filtered_by_name(name):
     """
     Lists the sectors in the database filtered by name
@@ -53,18 +80,27 @@ def list_sectors_filtered_by_name(name):
     :return: JSON string containing data about all sectors, if found.
     Else, a JSON string with an error message
     """
-    all_sectors = Sector\
+    pattern = '%' + name + '%'
+
+    # The search index answers the LIKE without scanning the whole table
+    if search.is_available():
+        name_filter = Sector.id.in_(search.like_ids(Sector.__table__, 'name', pattern))
+    else:
+        name_filter = Sector.name.like(pattern)
+
+    query = Sector\
         .query\
-        .filter(Sector.name.like('%' + name + '%'))\
-        .order_by(Sector.name).all()
+        .filter(name_filter)\
+        .order_by(Sector.name)
 
-    result = sectors_schema.dump(all_sectors)
+    result = serialization.dump(query, Sector, sectors_schema)
     if not result:
         return jsonify({'Message': 'No sectors registered'}), 404
-    return jsonify(result), 200
+    return serialization.json_response(result)
 
 
 @sector_methods.route('/sectors/<string:name>', methods=['GET'])
+@conditional(Sector.__tablename__)
 def get(name):
     """
     Tries to get a sector from the database
@@ -72,10 +108,189 @@ def get(name):
     :return: JSON string containing data about the sector, if found.
     Else, a JSON string with an error message
     """
-    sector = Sector.query.filter_by(name=name).first()
-    if not sector:
+    def produce():
+        sector = Sector.query.filter_by(name=name).first()
+        if not sector:
+            return jsonify({'Error': f'Sector not found with name = {name}'}), 404
+        return sector_schema.jsonify(sector), 200
+
+    # The serialized sector is served from the cache, when present
+    return cache.get_or_set(cache.sector_key(name), produce, tables=(Sector.__tablename__,))
+
+
+@sector_methods.route('/sectors/summary', methods=['GET'])
+@conditional(Collaborator.__tablename__, Sector.__tablename__)
+def list_all_sectors_summaries():
+    """
+    Lists the headcount and payroll of every sector (ordered by name), read from their summaries
+    :return: JSON string containing the summaries of all sectors, if found.
+    Else, a JSON string with an error message
+    """
+    if not summary.is_supported(database.db.session.get_bind()):
+        return _summaries_not_supported()
+
+    result = sector_summaries_schema.dump(_summaries().order_by(Sector.name).all())
+    if not result:
+        return jsonify({'Error': 'No sectors found'}), 404
+    return jsonify(result), 200
+
+
+@sector_methods.route('/sectors/<string:name>/summary', methods=['GET'])
+@conditional(Collaborator.__tablename__, Sector.__tablename__)
+def get_summary(name):
+    """
+    Gets the headcount and payroll of a sector (active and inactive collaborators), read from its summary
+    :param name: The name of the sector
+    :return: JSON string containing the summary of the sector, if found.
+    Else, a JSON string with an error message
+    """
+    if not summary.is_supported(database.db.session.get_bind()):
+        return _summaries_not_supported()
+
+    sector_summary = _summaries().filter(Sector.name == name).first()
+    if not sector_summary:
         return jsonify({'Error': f'Sector not found with name = {name}'}), 404
-    return sector_schema.jsonify(sector), 200
+    return sector_summary_schema.jsonify(sector_summary), 200
+
+
+def _summaries_not_supported():
+    # Without the triggers, nothing keeps the summaries up to date
+    dialect = database.db.session.get_bind().dialect.name
+    return jsonify({'Error': f'The sector summaries are not supported on {dialect} databases'}), 501
+
+
+def _summaries():
+    return database.db.session.query(
+        Sector.name,
+        SectorSummary.active_headcount, SectorSummary.inactive_headcount,
+        SectorSummary.active_payroll, SectorSummary.inactive_payroll
+    ).join(SectorSummary, SectorSummary.sector_id == Sector.id)
+
+
+@sector_methods.route('/sectors/stats', methods=['GET'])
+@conditional(Collaborator.__tablename__, Sector.__tablename__)
+def list_all_sectors_stats():
+    """
+    Lists the salary statistics of every sector (ordered by name)
+    (?active=true|false restricts them to active or inactive collaborators,
+    ?percentiles=50,90 chooses the percentiles)
+    :return: JSON string containing the statistics of all sectors, if found.
+    Else, a JSON string with an error message
+    """
+    try:
+        active, percentiles = _stats_arguments()
+    except ValueError as error:
+        return jsonify({'Error': str(error)}), 422
+
+    result = _salary_stats(active, percentiles)
+    if not result:
+        return jsonify({'Error': 'No sectors found'}), 404
+    return jsonify(result), 200
+
+
+@sector_methods.route('/sectors/<string:name>/stats', methods=['GET'])
+@conditional(Collaborator.__tablename__, Sector.__tablename__)
+def get_stats(name):
+    """
+    Gets the salary statistics of a sector: headcount, total, mean, min, max and percentiles
+    (?active=true|false restricts them to active or inactive collaborators,
+    ?percentiles=50,90 chooses the percentiles)
+    :param name: The name of the sector
+    :return: JSON string containing the statistics of the sector, if found.
+    Else, a JSON string with an error message
+    """
+    try:
+        active, percentiles = _stats_arguments()
+    except ValueError as error:
+        return jsonify({'Error': str(error)}), 422
+
+    result = _salary_stats(active, percentiles, name=name)
+    if not result:
+        return jsonify({'Error': f'Sector not found with name = {name}'}), 404
+    return jsonify(result[0]), 200
+
+
+def _stats_arguments():
+    active = request.args.get('active')
+    if active is not None:
+        if active.lower() not in ('true', 'false'):
+            raise ValueError('active must be true or false')
+        active = active.lower() == 'true'
+
+    percentiles = request.args.get('percentiles')
+    if percentiles is None:
+        return active, DEFAULT_PERCENTILES
+    try:
+        percentiles = tuple(int(percentile) for percentile in percentiles.split(','))
+    except ValueError:
+        raise ValueError('The percentiles must be integers')
+    if not all(1 <= percentile <= 100 for percentile in percentiles):
+        raise ValueError('The percentiles must be between 1 and 100')
+    return active, percentiles
+
+
+def _salary_stats(active, percentiles, name=None):
+    """
+    Computes the salary statistics of the sectors in the database, with two queries
+    (one GROUP BY for the aggregates and one window query for the percentiles)
+    :param active: Whether only active (True) or inactive (False) collaborators count (None for all of them)
+    :param percentiles: The percentiles to be computed (nearest rank)
+    :param name: The name of a sector, to compute only its statistics
+    :return: A list with the statistics of each sector, ordered by name
+    """
+    salary = Collaborator.current_salary
+    join_condition = Collaborator.sector_id == Sector.id
+    if active is not None:
+        join_condition = and_(join_condition, Collaborator.active == active)
+
+    aggregates = select([
+        Sector.id, Sector.name, func.count(Collaborator.id),
+        func.sum(salary), func.avg(salary), func.min(salary), func.max(salary)
+    ]).select_from(Sector.__table__.outerjoin(Collaborator.__table__, join_condition))\
+        .group_by(Sector.id, Sector.name)\
+        .order_by(Sector.name)
+    if name is not None:
+        aggregates = aggregates.where(Sector.name == name)
+
+    result = []
+    positions = {}
+    for sector_id, sector_name, headcount, total, mean, minimum, maximum in database.db.session.execute(aggregates):
+        stats = {
+            'name': sector_name,
+            'headcount': headcount,
+            'total_salary': total,
+            'mean_salary': mean,
+            'min_salary': minimum,
+            'max_salary': maximum,
+            'percentiles': {f'p{percentile}': None for percentile in percentiles},
+        }
+        result.append(stats)
+        positions[sector_id] = stats
+
+    if not result or not any(stats['headcount'] for stats in result):
+        return result
+
+    # Rank the salaries of each sector, keeping only the ranks of the percentiles:
+    # the nearest rank of the percentile p among n salaries is ceil(p * n / 100)
+    ranked = select([
+        Collaborator.sector_id.label('sector_id'),
+        salary.label('salary'),
+        func.row_number().over(partition_by=Collaborator.sector_id, order_by=salary).label('position'),
+        func.count().over(partition_by=Collaborator.sector_id).label('headcount'),
+    ]).where(Collaborator.sector_id.in_(list(positions)))
+    if active is not None:
+        ranked = ranked.where(Collaborator.active == active)
+    ranked = ranked.alias('ranked')
+
+    percentile_rows = select([ranked.c.sector_id, ranked.c.position, ranked.c.headcount, ranked.c.salary]).where(
+        or_(*(ranked.c.position == (percentile * ranked.c.headcount + 99) / 100 for percentile in percentiles))
+    )
+    for sector_id, position, headcount, value in database.db.session.execute(percentile_rows):
+        for percentile in percentiles:
+            if position == (percentile * headcount + 99) // 100:
+                positions[sector_id]['percentiles'][f'p{percentile}'] = value
+
+    return result
 
 
 @sector_methods.route('/sectors/update/<string:sector_name>', methods=['PUT'])
@@ -98,11 +313,62 @@ def update(sector_name):
         return jsonify({'Error': f'Sector not found with name = {sector_name}'}), 404
 
     # Update and persist the changes
-    database.update(query=query, json=request_json)
+    try:
+        database.update(query=query, json=request_json)
+    except IntegrityError:
+        return jsonify({'Error': f'Sector already exists with name = {request_json["name"]}'}), 409
+    # The collaborators of the sector are served with its name, so their cached responses must go as well
+    cache.invalidate(
+        cache.sector_key(sector_name),
+        cache.sector_key(request_json['name']),
+        *(cache.collaborator_key(collab_number) for collab_number in _collab_numbers(sector))
+    )
 
     return jsonify(request.json), 200
 
 
+@sector_methods.route('/sectors/upsert/<string:sector_name>', methods=['PUT'])
+def upsert(sector_name):
+    """
+    Inserts a sector, unless it already exists, with a single INSERT ... ON CONFLICT (name) statement
+    :param sector_name: The name of the sector
+    :return: JSON string containing data about the sector, if written successfully.
+    Else, a JSON string with an error message
+    """
+    errors = sector_schema.validate(request.json)
+    if errors:
+        return jsonify(errors), 422
+    if request.json['name'] != sector_name:
+        return jsonify({'Error': f'The name of the body must be {sector_name}'}), 422
+
+    database.bulk_upsert(Sector.__table__, [{'name': sector_name}], key='name')
+    cache.invalidate(cache.sector_key(sector_name))
+
+    return jsonify(request.json), 200
+
+
+@sector_methods.route('/sectors/upsert/bulk', methods=['PUT'])
+def upsert_bulk():
+    """
+    Inserts many sectors at once, skipping the ones that already exist. The body is a JSON array of sectors.
+    Valid records are written with a single batched INSERT ... ON CONFLICT (name) in one transaction
+    :return: JSON string containing the number of written sectors and the errors
+    of the rejected records, keyed by their position in the body
+    """
+    records = request.get_json(silent=True)
+    if not isinstance(records, list):
+        return jsonify({'Error': 'Expected a JSON array body'}), 422
+
+    # Validate every record at once (errors are keyed by the index of the record)
+    errors = SectorSchema(many=True).validate(records)
+    rows = [{'name': record['name']} for index, record in enumerate(records) if index not in errors]
+
+    count = database.bulk_upsert(Sector.__table__, rows, key='name')
+    cache.invalidate(*(cache.sector_key(row['name']) for row in rows))
+
+    return jsonify({'Upserted': count, 'Errors': {str(index): errors[index] for index in sorted(errors)}}), 200
+
+
 @sector_methods.route('/sectors/delete/<string:sector_name>', methods=['DELETE'])
 def delete(sector_name):
     """
@@ -117,7 +383,22 @@ def delete(sector_name):
     if not sector:
         return jsonify({'Error': f'Sector not found with name = {sector_name}'}), 404
 
+    # The collaborators of the sector are deleted along with it, so their cached responses must go as well
+    collab_numbers = _collab_numbers(sector)
+
     # Delete the data and persist the changes
     database.delete(the_object=sector)
+    cache.invalidate(
+        cache.sector_key(sector_name),
+        *(cache.collaborator_key(collab_number) for collab_number in collab_numbers)
+    )
 
     return jsonify({'Message': 'Successfully deleted'}), 200
+
+
+def _collab_numbers(sector):
+    return [
+        collab_number for collab_number, in Collaborator.query
+        .with_entities(Collaborator.collab_number)
+        .filter_by(sector_id=sector.id)
+    ]
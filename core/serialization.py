@@ -0,0 +1,167 @@
+import json
+from datetime import date
+
+from flask import Response, current_app, request
+
+from core import metrics
+from database.database import db
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Rows fetched from the database at a time by iter_rows()
+FETCH_BATCH_SIZE = 1000
+
+
+def row_serializer(fields):
+    """
+    Builds a function that turns a row (a tuple with the values of the fields, in order)
+    into a dict keyed by the field names, in the same order
+    :param fields: The names of the fields
+    :return: The function
+    """
+    fields = tuple(fields)
+
+    def serialize(row):
+        return dict(zip(fields, row))
+
+    return serialize
+
+
+_serializers = {}
+
+
+def serializer_of(model, fields=None):
+    """
+    :param model: A model with a "fields" attribute (e.g. Collaborator.fields)
+    :param fields: The fields to be serialized (default: all the fields of the model)
+    :return: The row serializer of the fields (see row_serializer())
+    """
+    fields = tuple(fields or model.fields)
+    serializer = _serializers.get(fields)
+    if serializer is None:
+        serializer = _serializers[fields] = row_serializer(fields)
+    return serializer
+
+
+def requested_fields(model):
+    """
+    Reads the fields asked for by the client (?fields=collab_number,full_name)
+    :param model: The model of the listing
+    :return: The fields, in the order of the model (None when the argument is missing)
+    :raises ValueError: If a field is not a field of the model
+    """
+    argument = request.args.get('fields')
+    if argument is None:
+        return None
+    names = {name.strip() for name in argument.split(',') if name.strip()}
+    unknown = names.difference(model.fields)
+    if not names or unknown:
+        raise ValueError(f'The fields must be some of: {", ".join(model.fields)}')
+    return tuple(name for name in model.fields if name in names)
+
+
+def is_enabled():
+    # FAST_SERIALIZATION=False falls back to the marshmallow schemas
+    return current_app.config.get('FAST_SERIALIZATION', True)
+
+
+def project(query, model, fields=None, limit=None, extra_columns=()):
+    """
+    Turns a query over a model into a query of the columns of some of its fields, so that it returns plain rows
+    (no objects are loaded into the session). The fields in model.joined_fields are read through a join
+    :param query: An ORM query over the model (its filters and ordering are kept)
+    :param model: The model
+    :param fields: The fields to be selected (default: all the fields of the model)
+    :param limit: The maximum number of rows (applied after the joins, since a limited query can't be joined)
+    :param extra_columns: Columns selected after the fields (e.g. the key of a page)
+    :return: The query of the columns
+    """
+    joined_fields = getattr(model, 'joined_fields', {})
+    columns = []
+    relationships = []
+    for name in fields or model.fields:
+        if name in joined_fields:
+            relationship_name, attribute = joined_fields[name]
+            relationship = getattr(model, relationship_name)
+            columns.append(getattr(relationship.property.mapper.class_, attribute).label(name))
+            if relationship not in relationships:
+                relationships.append(relationship)
+        else:
+            columns.append(getattr(model, name))
+    columns.extend(extra_columns)
+
+    query = query.with_entities(*columns)
+    for relationship in relationships:
+        query = query.join(relationship)
+    return query.limit(limit) if limit is not None else query
+
+
+def iter_rows(query, model, fields=None, limit=None):
+    """
+    Runs the projection of a query (see project())
+    :return: A generator of the rows, fetched in batches
+    """
+    result = db.session.execute(project(query, model, fields, limit).statement)
+    while True:
+        rows = result.fetchmany(FETCH_BATCH_SIZE)
+        if not rows:
+            return
+        yield from rows
+
+
+def dump(query, model, schema, fields=None, limit=None):
+    """
+    Serializes the rows of a query
+    :param query: An ORM query over the model
+    :param model: The model
+    :param schema: The schema of the model (many=True), used when the fast serialization is disabled
+    :param fields: The fields to be serialized (default: all the fields of the model)
+    :param limit: The maximum number of rows
+    :return: A list with a dict per row, with the same fields (in the same order) as the schema
+    """
+    if not is_enabled():
+        rows = query.limit(limit).all()
+        with metrics.serialization_timer():
+            return schema_of(schema, fields).dump(rows)
+    serialize = serializer_of(model, fields)
+    rows = list(iter_rows(query, model, fields, limit))
+    with metrics.serialization_timer():
+        return [serialize(row) for row in rows]
+
+
+def schema_of(schema, fields=None):
+    """
+    :return: A schema like the given one, restricted to some fields (the same schema when fields is None)
+    """
+    if fields is None:
+        return schema
+    return type(schema)(only=fields, many=schema.many)
+
+
+def dumps(data):
+    """
+    Encodes data as JSON, with orjson when it is installed
+    :return: The JSON, as bytes
+    """
+    if orjson is not None:
+        return orjson.dumps(data)
+    return json.dumps(data, separators=(',', ':'), default=_encode_date).encode()
+
+
+def _encode_date(value):
+    # Dates are encoded as YYYY-MM-DD, as orjson (and the schemas) do
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def json_response(data, status=200):
+    """
+    Same as flask.jsonify(), encoded by dumps()
+    """
+    with metrics.serialization_timer():
+        body = dumps(data) + b'\n'
+    return Response(body, status=status, mimetype='application/json')
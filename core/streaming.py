@@ -0,0 +1,39 @@
+from flask import Response, json, request, stream_with_context
+
+from core import serialization
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+# Number of rows fetched from the database at a time while streaming
+STREAM_BATCH_SIZE = 1000
+
+
+def wants_ndjson():
+    """
+    :return: Whether the client asked for a streamed listing (Accept: application/x-ndjson)
+    """
+    return request.accept_mimetypes.best == NDJSON_MIMETYPE
+
+
+def ndjson_response(query, model, schema, fields=None):
+    """
+    Streams the rows of a query as NDJSON (one JSON object per line), in a chunked response.
+    The rows are fetched in batches and serialized one at a time, so the memory used
+    doesn't grow with the size of the listing
+    :param query: The query whose rows will be streamed
+    :param model: The model of the query
+    :param schema: The schema used to serialize a single row, when the fast serialization is disabled
+    :param fields: The fields to be serialized (default: all the fields of the model)
+    :return: The streamed response
+    """
+    def generate():
+        if serialization.is_enabled():
+            serialize = serialization.serializer_of(model, fields)
+            for row in serialization.iter_rows(query, model, fields):
+                yield serialization.dumps(serialize(row)) + b'\n'
+        else:
+            row_schema = serialization.schema_of(schema, fields)
+            for row in query.yield_per(STREAM_BATCH_SIZE):
+                yield json.dumps(row_schema.dump(row)) + '\n'
+
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPE)
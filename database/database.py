@@ -1,27 +1,381 @@
+import os
+from contextlib import contextmanager
+from datetime import datetime
+
 from flask_marshmallow import Marshmallow
 from flask_sqlalchemy import SQLAlchemy
+from flask import current_app
+from sqlalchemy import Column, DateTime, Integer, String, and_, bindparam, event, inspect, text
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.interfaces import MANYTOONE
+from sqlalchemy.pool import QueuePool
+
+from database.group_commit import GroupCommitter
 
 
 db = SQLAlchemy()
 ma = Marshmallow()
 
 
+# Version of each table, bumped by every write made through this module
+# Used to tell whether a response has changed without running its query (ETag / Last-Modified)
+table_version = db.Table(
+    'table_version',
+    Column('name', String(50), primary_key=True),
+    Column('version', Integer, nullable=False),
+    Column('modified_at', DateTime, nullable=False),
+)
+
+
+# Settings of the database connections. Each one is read from the app config,
+# then from an environment variable with the same name, then from these defaults
+DEFAULT_SETTINGS = {
+    # Connection pool (for every database, SQLite files included)
+    'DATABASE_POOL_SIZE': 10,
+    'DATABASE_MAX_OVERFLOW': 20,
+    'DATABASE_POOL_TIMEOUT': 30,
+    'DATABASE_POOL_RECYCLE': 1800,
+
+    # SQLite profile, applied to every connection
+    # WAL lets readers run alongside the writer, and writers wait for each other (busy_timeout, in ms)
+    # instead of failing with "database is locked"
+    'SQLITE_JOURNAL_MODE': 'WAL',
+    'SQLITE_SYNCHRONOUS': 'NORMAL',
+    'SQLITE_BUSY_TIMEOUT': 5000,
+    'SQLITE_MMAP_SIZE': 256 * 1024 * 1024,
+    'SQLITE_CACHE_SIZE': -64 * 1024,
+
+    # Group commit: the writes of concurrent requests are committed together, in a single transaction,
+    # after waiting up to DATABASE_GROUP_COMMIT_WINDOW milliseconds for others to join the batch
+    'DATABASE_GROUP_COMMIT': False,
+    'DATABASE_GROUP_COMMIT_WINDOW': 2,
+    'DATABASE_GROUP_COMMIT_MAX_BATCH': 100,
+}
+
+DEFAULT_DATABASE_URI = 'sqlite:///database.db'
+
+
 def configure(app):
+    """
+    Sets up the database of the app. The database URI comes from SQLALCHEMY_DATABASE_URI
+    (or the DATABASE_URL environment variable), and the engine options are built from
+    DEFAULT_SETTINGS. Options given in SQLALCHEMY_ENGINE_OPTIONS take precedence over them
+    """
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', os.environ.get('DATABASE_URL', DEFAULT_DATABASE_URI))
+    for key, default in DEFAULT_SETTINGS.items():
+        app.config.setdefault(key, _read_setting(os.environ.get(key), default))
+
+    url = make_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    options = engine_options(url, app.config)
+    options.update(app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = options
+
     db.init_app(app)
     app.db = db
     ma.init_app(app)
 
+    if url.drivername.startswith('sqlite'):
+        pragmas = sqlite_pragmas(app.config)
+        event.listen(db.get_engine(app), 'connect', lambda connection, record: _execute_pragmas(connection, pragmas))
+
+    app.group_committer = None
+    if app.config['DATABASE_GROUP_COMMIT']:
+        app.group_committer = GroupCommitter(
+            db.get_engine(app),
+            window=app.config['DATABASE_GROUP_COMMIT_WINDOW'] / 1000,
+            max_batch=app.config['DATABASE_GROUP_COMMIT_MAX_BATCH'],
+        )
+
+
+def _read_setting(value, default):
+    # Settings read from environment variables are strings, converted to the type of their default
+    if value is None:
+        return default
+    if isinstance(default, bool):
+        return value.lower() in ('1', 'true', 'yes', 'on')
+    return type(default)(value)
+
+
+def engine_options(url, config):
+    """
+    Builds the options of the engine of a database
+    :param url: The URL of the database
+    :param config: The app config, with the DEFAULT_SETTINGS keys
+    :return: A dict with the keyword arguments of create_engine()
+    """
+    pool = {
+        'pool_size': config['DATABASE_POOL_SIZE'],
+        'max_overflow': config['DATABASE_MAX_OVERFLOW'],
+        'pool_timeout': config['DATABASE_POOL_TIMEOUT'],
+    }
+
+    if not url.drivername.startswith('sqlite'):
+        # Server databases drop idle connections, so they are recycled and checked before use
+        return dict(pool, pool_recycle=config['DATABASE_POOL_RECYCLE'], pool_pre_ping=True)
+
+    if url.database in (None, '', ':memory:'):
+        # An in memory database lives in a single connection (Flask-SQLAlchemy sets it up)
+        return {}
+
+    # SQLite files are pooled too, so that each connection keeps its page cache between requests
+    # (a pooled connection is only used by one thread at a time)
+    return dict(pool, poolclass=QueuePool, connect_args={
+        'check_same_thread': False,
+        'timeout': config['SQLITE_BUSY_TIMEOUT'] / 1000,
+    })
+
+
+def sqlite_pragmas(config):
+    return (
+        f"PRAGMA journal_mode={config['SQLITE_JOURNAL_MODE']}",
+        f"PRAGMA synchronous={config['SQLITE_SYNCHRONOUS']}",
+        f"PRAGMA busy_timeout={int(config['SQLITE_BUSY_TIMEOUT'])}",
+        f"PRAGMA mmap_size={int(config['SQLITE_MMAP_SIZE'])}",
+        f"PRAGMA cache_size={int(config['SQLITE_CACHE_SIZE'])}",
+        # SQLite only enforces foreign keys (and their ON DELETE CASCADE) when asked to
+        'PRAGMA foreign_keys=ON',
+    )
+
+
+def _execute_pragmas(dbapi_connection, pragmas):
+    cursor = dbapi_connection.cursor()
+    for pragma in pragmas:
+        cursor.execute(pragma)
+    cursor.close()
+
 
 def insert(the_object):
+    committer = _group_committer()
+    if committer is not None:
+        table = the_object.__table__
+        row = _row_of(the_object)
+        _end_session_transaction()
+
+        def operation(connection):
+            result = connection.execute(table.insert().values(row))
+            _bump_versions(connection, table)
+            return result.inserted_primary_key
+
+        primary_key = committer.submit(operation)
+        mapper = inspect(the_object).mapper
+        for column, value in zip(table.primary_key.columns, primary_key):
+            setattr(the_object, mapper.get_property_by_column(column).key, value)
+        return
+
     db.session.add(the_object)
-    db.session.commit()
+    _bump_versions(db.session, the_object.__table__)
+    _commit()
 
 
 def update(query, json):
-    query.update(json)
-    db.session.commit()
+    table = query.column_descriptions[0]['entity'].__table__
+
+    committer = _group_committer()
+    if committer is not None:
+        statement = table.update().where(query.whereclause).values(json)
+        _end_session_transaction()
+
+        def operation(connection):
+            count = connection.execute(statement).rowcount
+            if count:
+                _bump_versions(connection, table)
+            return count
+
+        return committer.submit(operation)
+
+    # A single UPDATE statement (the session is expired on commit, so it needs no synchronization)
+    with _committed():
+        count = query.update(json, synchronize_session=False)
+        if count:
+            _bump_versions(db.session, table)
+    return count
 
 
 def delete(the_object):
+    # The rows deleted in cascade change their tables as well
+    mapper = inspect(the_object).mapper
+    cascaded = [relationship.mapper.local_table for relationship in mapper.relationships if relationship.cascade.delete]
+
+    committer = _group_committer()
+    if committer is not None:
+        # The rows of the relationships are deleted in cascade by the database (ON DELETE CASCADE)
+        table = the_object.__table__
+        statement = table.delete().where(and_(*(
+            column == getattr(the_object, mapper.get_property_by_column(column).key)
+            for column in table.primary_key.columns
+        )))
+        _end_session_transaction()
+
+        def operation(connection):
+            connection.execute(statement)
+            _bump_versions(connection, table, *cascaded)
+
+        committer.submit(operation)
+        return
+
     db.session.delete(the_object)
-    db.session.commit()
+    _bump_versions(db.session, the_object.__table__, *cascaded)
+    _commit()
+
+
+def bulk_insert(table, rows):
+    committer = _group_committer()
+    if committer is not None:
+        _end_session_transaction()
+
+        def operation(connection):
+            if rows:
+                connection.execute(table.insert(), rows)
+                _bump_versions(connection, table)
+
+        committer.submit(operation)
+        return
+
+    # A single executemany INSERT, committed as one transaction
+    with _committed():
+        if rows:
+            db.session.execute(table.insert(), rows)
+            _bump_versions(db.session, table)
+
+
+def bulk_upsert(table, rows, key, expressions=None):
+    """
+    Inserts rows, updating the ones whose key already exists, with a single executemany
+    INSERT ... ON CONFLICT (key) DO UPDATE, committed as one transaction (SQLite 3.24+ and PostgreSQL)
+    :param table: The table
+    :param rows: A list of dicts with the values of the columns (the same columns in every row)
+    :param key: The name of the column (with a unique index) that identifies a row
+    :param expressions: SQL expressions of other columns, by column name, whose parameters are values
+    of the rows as well (e.g. {'sector_id': '(SELECT id FROM sector WHERE name = :sector_name)'})
+    :return: The number of rows written (the rows skipped by the ON CONFLICT clause are not counted)
+    """
+    statement = upsert_statement(table, [column for column in rows[0] if column in table.c], key, expressions) \
+        if rows else None
+
+    committer = _group_committer()
+    if committer is not None:
+        _end_session_transaction()
+
+        def operation(connection):
+            if not rows:
+                return 0
+            count = connection.execute(statement, rows).rowcount
+            _bump_versions(connection, table)
+            return count
+
+        return committer.submit(operation)
+
+    count = 0
+    with _committed():
+        if rows:
+            count = db.session.execute(statement, rows).rowcount
+            _bump_versions(db.session, table)
+    return count
+
+
+def upsert_statement(table, columns, key, expressions=None):
+    """
+    Builds an INSERT ... ON CONFLICT (key) DO UPDATE statement (SQLAlchemy 1.3 has no construct for it)
+    :param table: The table
+    :param columns: The names of the inserted columns
+    :param key: The name of the column (with a unique index) that identifies a row
+    :param expressions: SQL expressions of other inserted columns, by column name
+    :return: The statement, whose parameters are the columns (converted by their types)
+    and the parameters of the expressions
+    """
+    values = {column: f':{column}' for column in columns}
+    values.update(expressions or {})
+    updated = [column for column in values if column != key]
+    action = 'DO NOTHING'
+    if updated:
+        # The rows that wouldn't change are left alone, so that they don't fire the triggers (search, summaries).
+        # The values that may be NULL (including the expressions, e.g. a subquery that finds nothing) are compared
+        # so that NULL differs from any value
+        changed = ' OR '.join(
+            f'({table.name}.{column} IS NULL) <> (excluded.{column} IS NULL) OR {table.name}.{column} <> excluded.{column}'
+            if table.c[column].nullable or column in (expressions or {}) else f'{table.name}.{column} <> excluded.{column}'
+            for column in updated
+        )
+        action = f'DO UPDATE SET {", ".join(f"{column} = excluded.{column}" for column in updated)} WHERE {changed}'
+    return text(
+        f'INSERT INTO {table.name} ({", ".join(values)}) VALUES ({", ".join(values.values())}) '
+        f'ON CONFLICT ({key}) {action}'
+    ).bindparams(*(bindparam(column, type_=table.c[column].type) for column in columns))
+
+
+def table_versions(*names):
+    """
+    Reads the versions of some tables
+    :param names: The names of the tables
+    :return: A dict with the (version, modified_at) tuple of each table that has ever been written
+    """
+    query = table_version.select().where(table_version.c.name.in_(names))
+    return {name: (version, modified_at) for name, version, modified_at in db.session.execute(query)}
+
+
+def _bump_versions(executor, *tables):
+    # Runs in the transaction of the write (executor is the session or the connection of a group commit),
+    # so the versions change exactly when the data does
+    now = datetime.utcnow()
+    for table in tables:
+        result = executor.execute(
+            table_version.update()
+            .where(table_version.c.name == table.name)
+            .values(version=table_version.c.version + 1, modified_at=now)
+        )
+        if result.rowcount == 0:
+            executor.execute(table_version.insert().values(name=table.name, version=1, modified_at=now))
+
+
+def _group_committer():
+    return getattr(current_app, 'group_committer', None)
+
+
+def _end_session_transaction():
+    # The write runs on the connection of the group commit, so the request ends its own transaction,
+    # not to hold locks (or a stale snapshot) while it waits. The pending objects are forgotten
+    db.session.rollback()
+
+
+def _row_of(the_object):
+    """
+    Reads the column values of a new object
+    :return: A dict with the values of the columns set on the object, keyed by column name
+    """
+    state = inspect(the_object)
+    mapper = state.mapper
+    row = {}
+    for column in mapper.local_table.columns:
+        key = mapper.get_property_by_column(column).key
+        if key in state.dict:
+            row[column.name] = state.dict[key]
+
+    # Foreign keys set through a relationship (e.g. collaborator.sector = sector) are only filled in on flush
+    for relationship in mapper.relationships:
+        target = state.dict.get(relationship.key)
+        if relationship.direction is MANYTOONE and target is not None:
+            for local, remote in relationship.local_remote_pairs:
+                row[local.name] = getattr(target, remote.key)
+    return row
+
+
+@contextmanager
+def _committed():
+    # The statements executed inside are committed with the session, or rolled back with it when they
+    # violate a constraint (so that the rows written before the failing one aren't committed by a later write)
+    try:
+        yield
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        raise
+
+
+def _commit():
+    # Unique constraint violations are reported to the caller, leaving the session usable
+    try:
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        raise
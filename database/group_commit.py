@@ -0,0 +1,126 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+
+class _PendingWrite:
+
+    def __init__(self, operation):
+        self.operation = operation
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class GroupCommitter:
+    """
+    Commits the writes of concurrent requests together. The writes submitted within a short window
+    (or until the batch is full) run in a single transaction, paying for a single commit (fsync).
+    Each write runs in its own SAVEPOINT, so a failing write is rolled back alone,
+    and its error is raised to the request that submitted it
+    """
+
+    def __init__(self, engine, window=0.002, max_batch=100):
+        """
+        :param engine: The engine of the database
+        :param window: How long (in seconds) the first write of a batch waits for others to join it
+        :param max_batch: The maximum number of writes in a batch
+        """
+        self.engine = engine
+        if engine.dialect.name == 'sqlite':
+            # pysqlite doesn't send BEGIN when a transaction begins, so each SAVEPOINT would open (and each
+            # RELEASE commit) a transaction of its own. The batches run on a copy of the engine (sharing its pool)
+            # that sends BEGIN itself, on connections whose implicit transactions are turned off for the batch
+            self.engine = engine.execution_options()
+            event.listen(self.engine, 'begin', _begin)
+        self.window = window
+        self.max_batch = max_batch
+        self.batches = 0
+        self.writes = 0
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, operation):
+        """
+        Runs a write in the next batch, waiting for the batch to be committed
+        :param operation: Function that receives the connection of the batch and makes the write
+        :return: The value returned by the operation
+        :raises: The error raised by the operation, or by the commit of the batch
+        """
+        self._start()
+        pending = _PendingWrite(operation)
+        self._queue.put(pending)
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='group-commit', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+            self._commit(batch)
+
+    def _commit(self, batch):
+        try:
+            with self.engine.connect() as connection, _explicit_transactions(connection):
+                transaction = connection.begin()
+                try:
+                    for pending in batch:
+                        savepoint = connection.begin_nested()
+                        try:
+                            pending.result = pending.operation(connection)
+                            savepoint.commit()
+                        except Exception as error:
+                            savepoint.rollback()
+                            pending.error = error
+                    transaction.commit()
+                except Exception:
+                    transaction.rollback()
+                    raise
+        except Exception as error:
+            # The batch could not be committed, so none of its writes took effect
+            for pending in batch:
+                pending.error = pending.error or error
+        finally:
+            self.batches += 1
+            self.writes += len(batch)
+            for pending in batch:
+                pending.done.set()
+
+
+def _begin(connection):
+    connection.execute('BEGIN')
+
+
+@contextmanager
+def _explicit_transactions(connection):
+    # Turns off the implicit transactions of a pysqlite connection (it goes back to the pool as it came)
+    if connection.dialect.name != 'sqlite':
+        yield
+        return
+    dbapi_connection = connection.connection.connection
+    isolation_level = dbapi_connection.isolation_level
+    dbapi_connection.isolation_level = None
+    try:
+        yield
+    finally:
+        dbapi_connection.isolation_level = isolation_level
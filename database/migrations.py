@@ -0,0 +1,176 @@
+from datetime import datetime
+
+from sqlalchemy import MetaData, text
+from sqlalchemy.schema import CreateTable
+
+from database.database import db
+from database import search, summary
+from models.collaborator_model import BIRTHDAY_INDEX, Collaborator
+from models.sector_model import Sector
+from models.sector_summary_model import SectorSummary
+
+
+class MigrationError(Exception):
+    pass
+
+
+# Unique indexes used by the hot lookups (name, table, column)
+# The names match the ones SQLAlchemy gives to Column(..., unique=True, index=True)
+UNIQUE_INDEXES = (
+    ('ix_collaborator_collab_number', 'collaborator', 'collab_number'),
+    ('ix_sector_name', 'sector', 'name'),
+)
+
+# Full text search indexes (table, column)
+SEARCH_INDEXES = (
+    (Collaborator.__table__, 'full_name'),
+    (Sector.__table__, 'name'),
+)
+
+# Indexes that back the ordered listings and the statistics (name, table, columns)
+INDEXES = (
+    ('ix_collaborator_full_name_id', 'collaborator', 'full_name, id'),
+    ('ix_collaborator_sector_id_active_current_salary', 'collaborator', 'sector_id, active, current_salary'),
+    ('ix_collaborator_birth_date', 'collaborator', 'birth_date'),
+)
+
+# Formats of the birth dates stored before they were dates (besides the ISO ones, e.g. 2020-11-11 00:00:00)
+LEGACY_DATE_FORMATS = ('%d/%m/%Y', '%Y/%m/%d', '%d-%m-%Y')
+
+
+def upgrade():
+    """
+    Brings an existing database up to date with the models. Every step is idempotent,
+    so it is safe to run on a new database as well as on every start of the API
+    """
+    _add_collaborator_cascade()
+    _convert_birth_dates()
+    _create_unique_indexes()
+    _create_indexes()
+    _create_search_indexes()
+    _create_sector_summaries()
+    db.session.commit()
+
+
+def _add_collaborator_cascade():
+    # SQLite can't alter a foreign key, so the collaborator table is rebuilt with ON DELETE CASCADE
+    if not _is_sqlite():
+        return
+
+    foreign_keys = db.session.execute(text('PRAGMA foreign_key_list(collaborator)')).fetchall()
+    if not foreign_keys or all(foreign_key.on_delete == 'CASCADE' for foreign_key in foreign_keys):
+        return
+
+    # Collaborators whose sector no longer exists violate the foreign key, and can't be copied
+    orphans = db.session.execute(text(
+        'SELECT collab_number FROM collaborator WHERE sector_id NOT IN (SELECT id FROM sector) ORDER BY collab_number'
+    )).fetchall()
+    if orphans:
+        values = ', '.join(str(collab_number) for collab_number, in orphans)
+        raise MigrationError(f'Can not add the collaborator cascade, collaborators of sectors not found: {values}')
+
+    metadata = MetaData()
+    Sector.__table__.tometadata(metadata)
+    rebuilt = Collaborator.__table__.tometadata(metadata, name='collaborator_rebuild')
+    db.session.execute(CreateTable(rebuilt))
+
+    existing = {column.name for column in db.session.execute(text('PRAGMA table_info(collaborator)'))}
+    columns = ', '.join(column.name for column in rebuilt.columns if column.name in existing)
+    db.session.execute(text(f'INSERT INTO collaborator_rebuild ({columns}) SELECT {columns} FROM collaborator'))
+
+    # Dropping the table drops its indexes and triggers too, they are created again by the next steps
+    db.session.execute(text('DROP TABLE collaborator'))
+    db.session.execute(text('ALTER TABLE collaborator_rebuild RENAME TO collaborator'))
+
+
+def _convert_birth_dates():
+    # The birth dates used to be free-form strings. SQLite stores the dates as YYYY-MM-DD strings,
+    # so the other values are parsed and rewritten (a date and time keeps only its date)
+    if not _is_sqlite():
+        return
+
+    rows = db.session.execute(text(
+        "SELECT id, collab_number, birth_date FROM collaborator "
+        "WHERE birth_date NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'"
+    )).fetchall()
+
+    converted = []
+    invalid = []
+    for collaborator_id, collab_number, birth_date in rows:
+        parsed = _parse_date(str(birth_date).strip())
+        if parsed is None:
+            invalid.append(f'{collab_number} ({birth_date})')
+        else:
+            converted.append({'id': collaborator_id, 'birth_date': parsed.isoformat()})
+
+    if invalid:
+        raise MigrationError(f'Can not convert collaborator.birth_date to a date, invalid values: {", ".join(invalid)}')
+    if converted:
+        db.session.execute(text('UPDATE collaborator SET birth_date = :birth_date WHERE id = :id'), converted)
+
+
+def _parse_date(value):
+    try:
+        return datetime.fromisoformat(value).date()
+    except ValueError:
+        pass
+    for date_format in LEGACY_DATE_FORMATS:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            pass
+    return None
+
+
+def _create_unique_indexes():
+    for index_name, table, column in UNIQUE_INDEXES:
+
+        # A unique index can't be built while the table holds duplicated values
+        duplicates = db.session.execute(
+            text(f'SELECT {column} FROM {table} GROUP BY {column} HAVING COUNT(*) > 1')
+        ).fetchall()
+        if duplicates:
+            values = ', '.join(str(value) for value, in duplicates)
+            raise MigrationError(f'Can not create {index_name}, duplicated {table}.{column}: {values}')
+
+        db.session.execute(text(f'CREATE UNIQUE INDEX IF NOT EXISTS {index_name} ON {table} ({column})'))
+
+
+def _create_indexes():
+    for index_name, table, columns in INDEXES:
+        db.session.execute(text(f'CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({columns})'))
+
+    # An index on an expression (the month and day of the birth date)
+    if _is_sqlite():
+        db.session.execute(text(BIRTHDAY_INDEX))
+
+
+def _create_search_indexes():
+    if not search.is_available():
+        return
+
+    for table, column in SEARCH_INDEXES:
+        exists = db.session.execute(
+            text("SELECT 1 FROM sqlite_master WHERE name = :name"), {'name': search.search_table_name(table)}
+        ).first()
+        for statement in search.ddl_statements(table, column):
+            db.session.execute(text(statement))
+
+        # Index the rows that already exist
+        if not exists:
+            db.session.execute(text(search.rebuild_statement(table)))
+
+
+def _create_sector_summaries():
+    bind = db.session.get_bind()
+    if summary.is_supported(bind):
+        for statement in summary.ddl_statements(bind.dialect.name):
+            db.session.execute(text(statement))
+
+    # Fill in the summaries of the sectors that existed before them
+    if SectorSummary.query.count() != Sector.query.count():
+        summary.rebuild()
+
+
+def _is_sqlite():
+    return db.session.get_bind().dialect.name == 'sqlite'
@@ -0,0 +1,127 @@
+from weakref import WeakKeyDictionary
+
+from sqlalchemy import DDL, event, select, func, literal_column
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.sql import table as table_clause, column as column_clause
+
+from database.database import db
+
+# The tokenizer of the search indexes (SQLite 3.34 or newer)
+TOKENIZER = 'trigram'
+
+# The trigram tokenizer only matches queries with at least this many characters
+MIN_QUERY_LENGTH = 3
+
+# Whether the SQLite library of each engine supports the search indexes (see is_supported())
+_supported = WeakKeyDictionary()
+
+
+def search_table_name(table):
+    return f'{table.name}_search'
+
+
+def ddl_statements(table, column):
+    """
+    Builds the statements that create a full text search index (SQLite FTS5 with the trigram tokenizer)
+    over a column of a table. The index stores no copy of the data (it reads it from the table) and
+    is kept in sync by triggers, so every insert, update and delete is reflected on it,
+    including the ones made by bulk statements
+    :param table: The indexed table (its primary key must be "id")
+    :param column: The name of the indexed column
+    :return: A list of idempotent SQL statements
+    """
+    name = search_table_name(table)
+    insert = f'INSERT INTO {name}(rowid, {column}) VALUES (new.id, new.{column});'
+    delete = f"INSERT INTO {name}({name}, rowid, {column}) VALUES ('delete', old.id, old.{column});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {name} "
+        f"USING fts5({column}, content='{table.name}', content_rowid='id', tokenize='{TOKENIZER}')",
+        f'CREATE TRIGGER IF NOT EXISTS {name}_insert AFTER INSERT ON {table.name} BEGIN {insert} END',
+        f'CREATE TRIGGER IF NOT EXISTS {name}_delete AFTER DELETE ON {table.name} BEGIN {delete} END',
+        f'CREATE TRIGGER IF NOT EXISTS {name}_update AFTER UPDATE OF {column} ON {table.name} '
+        f'BEGIN {delete} {insert} END',
+    ]
+
+
+def rebuild_statement(table):
+    name = search_table_name(table)
+    return f"INSERT INTO {name}({name}) VALUES ('rebuild')"
+
+
+def register(table, column):
+    """
+    Creates (and drops) the search index of a column along with its table, on the databases that support it
+    :param table: The indexed table
+    :param column: The name of the indexed column
+    """
+    for statement in ddl_statements(table, column):
+        event.listen(table, 'after_create', DDL(statement).execute_if(callable_=_supports_ddl))
+    event.listen(
+        table, 'before_drop', DDL(f'DROP TABLE IF EXISTS {search_table_name(table)}').execute_if(dialect='sqlite')
+    )
+
+
+def _supports_ddl(ddl, target, bind, **kwargs):
+    return is_supported(bind)
+
+
+def is_available():
+    """
+    :return: Whether the database supports the search indexes (else, the name filters fall back to LIKE)
+    """
+    return is_supported(db.session.get_bind())
+
+
+def is_supported(bind):
+    """
+    Checks (once per engine) whether a database supports the search indexes: it must be SQLite,
+    built with FTS5 and the trigram tokenizer
+    :param bind: An engine or a connection of the database
+    """
+    if bind.dialect.name != 'sqlite':
+        return False
+    engine = bind.engine
+    if engine not in _supported:
+        _supported[engine] = _probe(bind)
+    return _supported[engine]
+
+
+def _probe(bind):
+    # Creates (and drops) an index in the temp schema, which leaves the database untouched
+    try:
+        bind.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS temp.search_probe USING fts5(value, tokenize='{TOKENIZER}')")
+        bind.execute('DROP TABLE temp.search_probe')
+        return True
+    except OperationalError:
+        return False
+
+
+def like_ids(table, column, pattern):
+    """
+    Builds a subquery with the ids of the rows whose column matches a LIKE pattern.
+    The trigram index answers it without scanning the table, even with a leading wildcard
+    :return: A SELECT statement, meant to be used with Column.in_()
+    """
+    search_table = table_clause(search_table_name(table), column_clause('rowid'), column_clause(column))
+    return select([search_table.c.rowid]).where(search_table.c[column].like(pattern))
+
+
+def ranked_ids(table, column, text, limit):
+    """
+    Finds the best matches of a text in a column, ranked by relevance (BM25)
+    :param table: The indexed table
+    :param column: The name of the indexed column
+    :param text: The text to be matched (at least MIN_QUERY_LENGTH characters long)
+    :param limit: The maximum number of results
+    :return: A list with the ids of the matching rows, best matches first
+    """
+    name = search_table_name(table)
+    search_table = table_clause(name, column_clause('rowid'), column_clause(column))
+
+    # Quote the text, so that it is matched as a phrase (and not parsed as a query)
+    phrase = '"' + text.replace('"', '""') + '"'
+    query = select([search_table.c.rowid])\
+        .where(literal_column(name).op('MATCH')(phrase))\
+        .order_by(func.bm25(literal_column(name)), search_table.c[column])\
+        .limit(limit)
+    return [row_id for row_id, in db.session.execute(query)]
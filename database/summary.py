@@ -0,0 +1,111 @@
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import DDL, event, text
+
+from database.database import db
+
+
+# The dialects that have the triggers
+DIALECTS = ('sqlite', 'postgresql')
+
+
+def _apply(row, sign):
+    # Adds (sign = '+') or removes (sign = '-') a collaborator row ("new" or "old") from the summary of its sector
+    return (
+        f'UPDATE sector_summary SET '
+        f'active_headcount = active_headcount {sign} (CASE WHEN {row}.active THEN 1 ELSE 0 END), '
+        f'inactive_headcount = inactive_headcount {sign} (CASE WHEN {row}.active THEN 0 ELSE 1 END), '
+        f'active_payroll = active_payroll {sign} (CASE WHEN {row}.active THEN {row}.current_salary ELSE 0 END), '
+        f'inactive_payroll = inactive_payroll {sign} (CASE WHEN {row}.active THEN 0 ELSE {row}.current_salary END) '
+        f'WHERE sector_id = {row}.sector_id;'
+    )
+
+
+def ddl_statements(dialect='sqlite'):
+    """
+    Builds the triggers that keep the sector summaries up to date. Each write to a collaborator
+    changes the summary of its sector by the difference it makes, so the summaries never need to
+    be recomputed. The summary of a deleted sector goes away with it (ON DELETE CASCADE)
+    :param dialect: The name of the dialect of the database (one of DIALECTS)
+    :return: A list of idempotent SQL statements
+    """
+    if dialect == 'postgresql':
+        return _postgresql_ddl_statements()
+    return [
+        'CREATE TRIGGER IF NOT EXISTS sector_summary_sector_insert AFTER INSERT ON sector BEGIN '
+        'INSERT INTO sector_summary (sector_id, active_headcount, inactive_headcount, active_payroll, '
+        'inactive_payroll) VALUES (new.id, 0, 0, 0, 0); END',
+        f'CREATE TRIGGER IF NOT EXISTS sector_summary_collaborator_insert AFTER INSERT ON collaborator '
+        f'BEGIN {_apply("new", "+")} END',
+        f'CREATE TRIGGER IF NOT EXISTS sector_summary_collaborator_delete AFTER DELETE ON collaborator '
+        f'BEGIN {_apply("old", "-")} END',
+        f'CREATE TRIGGER IF NOT EXISTS sector_summary_collaborator_update '
+        f'AFTER UPDATE OF active, current_salary, sector_id ON collaborator '
+        f'BEGIN {_apply("old", "-")} {_apply("new", "+")} END',
+    ]
+
+
+def _postgresql_ddl_statements():
+    # PostgreSQL triggers run functions, and have no IF NOT EXISTS (they are dropped and created again instead)
+    return [
+        'CREATE OR REPLACE FUNCTION sector_summary_sector_insert() RETURNS trigger AS $$ BEGIN '
+        'INSERT INTO sector_summary (sector_id, active_headcount, inactive_headcount, active_payroll, '
+        'inactive_payroll) VALUES (new.id, 0, 0, 0, 0); RETURN NULL; END $$ LANGUAGE plpgsql',
+        'DROP TRIGGER IF EXISTS sector_summary_sector_insert ON sector',
+        'CREATE TRIGGER sector_summary_sector_insert AFTER INSERT ON sector '
+        'FOR EACH ROW EXECUTE PROCEDURE sector_summary_sector_insert()',
+        f'CREATE OR REPLACE FUNCTION sector_summary_collaborator_write() RETURNS trigger AS $$ BEGIN '
+        f"IF TG_OP IN ('UPDATE', 'DELETE') THEN {_apply('old', '-')} END IF; "
+        f"IF TG_OP IN ('INSERT', 'UPDATE') THEN {_apply('new', '+')} END IF; "
+        f'RETURN NULL; END $$ LANGUAGE plpgsql',
+        'DROP TRIGGER IF EXISTS sector_summary_collaborator_write ON collaborator',
+        'CREATE TRIGGER sector_summary_collaborator_write '
+        'AFTER INSERT OR DELETE OR UPDATE OF active, current_salary, sector_id ON collaborator '
+        'FOR EACH ROW EXECUTE PROCEDURE sector_summary_collaborator_write()',
+    ]
+
+
+def is_supported(bind):
+    """
+    Tells whether the summaries are kept up to date on a database
+    :param bind: The engine (or connection) of the database
+    :return: True if its dialect has the triggers, False otherwise
+    """
+    return bind.dialect.name in DIALECTS
+
+
+def register(metadata):
+    """
+    Creates the triggers along with the tables, on the databases of DIALECTS
+    (they are attached to the metadata, since they need both the sector and the collaborator tables)
+    """
+    for dialect in DIALECTS:
+        for statement in ddl_statements(dialect):
+            event.listen(metadata, 'after_create', DDL(statement).execute_if(dialect=dialect))
+
+
+def rebuild():
+    """
+    Recomputes every sector summary from the collaborators (fixes any drift of the counters,
+    e.g. the rounding errors accumulated by the payrolls)
+    """
+    db.session.execute(text('DELETE FROM sector_summary'))
+    db.session.execute(text(
+        'INSERT INTO sector_summary (sector_id, active_headcount, inactive_headcount, active_payroll, inactive_payroll) '
+        'SELECT sector.id, '
+        'COUNT(CASE WHEN collaborator.active THEN 1 END), '
+        'COUNT(CASE WHEN NOT collaborator.active THEN 1 END), '
+        'COALESCE(SUM(CASE WHEN collaborator.active THEN collaborator.current_salary END), 0), '
+        'COALESCE(SUM(CASE WHEN NOT collaborator.active THEN collaborator.current_salary END), 0) '
+        'FROM sector LEFT OUTER JOIN collaborator ON collaborator.sector_id = sector.id '
+        'GROUP BY sector.id'
+    ))
+
+
+@click.command('rebuild-sector-summary')
+@with_appcontext
+def rebuild_command():
+    """Recomputes the headcount and payroll summaries of every sector."""
+    rebuild()
+    db.session.commit()
+    click.echo('Sector summaries rebuilt')
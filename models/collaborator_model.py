@@ -1,5 +1,12 @@
-from sqlalchemy import Column, Integer, String, Float, Boolean, ForeignKey
+from datetime import datetime
+
+from sqlalchemy import Column, Integer, String, Float, Boolean, Date, DDL, ForeignKey, Index, event, func, select
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.orm import column_property
+from sqlalchemy.sql.functions import FunctionElement
 from database.database import db, ma
+from database import search
+from models.sector_model import Sector
 from marshmallow import fields
 
 
@@ -9,12 +16,30 @@ class Collaborator(db.Model):
 
     id = Column(Integer, primary_key=True)
 
-    collab_number = Column(Integer, nullable=False)
+    collab_number = Column(Integer, nullable=False, unique=True, index=True)
     full_name = Column(String(100), nullable=False)
-    birth_date = Column(String, nullable=False)  # Change to DateTime
+    # Backs the ranges of birth dates (and ages)
+    birth_date = Column(Date, nullable=False, index=True)
     current_salary = Column(Float, nullable=False)
     active = Column(Boolean, nullable=False)
-    sector_id = Column(Integer, ForeignKey('sector.id'), nullable=False)
+    # The database deletes the collaborators of a sector along with it (see Sector.collaborators)
+    sector_id = Column(Integer, ForeignKey('sector.id', ondelete='CASCADE'), nullable=False)
+
+    # Loaded by the same SELECT that loads the collaborator (as a correlated subquery),
+    # so serializing a listing never issues one query per collaborator
+    sector_name = column_property(select([Sector.name]).where(Sector.id == sector_id).as_scalar())
+
+    # Fields read from a related table (relationship, attribute). The listings that select only
+    # the columns of the fields (see core.serialization) join the table instead of running a subquery per row
+    joined_fields = {'sector_name': ('sector', 'name')}
+
+    __table_args__ = (
+        # Backs the listings ordered by name, which are paginated by (full_name, id)
+        Index('ix_collaborator_full_name_id', 'full_name', 'id'),
+
+        # Backs the salary statistics, grouped by sector (the salaries are read from the index alone)
+        Index('ix_collaborator_sector_id_active_current_salary', 'sector_id', 'active', 'current_salary'),
+    )
 
     def __init__(self, collab_number, full_name, birth_date, current_salary, active, sector_name):
 
@@ -35,11 +60,61 @@ class Collaborator(db.Model):
                f' Current Salary: {self.current_salary}, Status: {status}, Sector name: {self.sector_name}'
 
 
+# Full text search index over the names (backs the name filter and the search)
+search.register(Collaborator.__table__, 'full_name')
+
+
+class month_day(FunctionElement):
+    """
+    The month and day ('MM-DD') of a date, compiled for each dialect
+    """
+    type = String()
+    name = 'month_day'
+
+
+@compiles(month_day)
+def _month_day(element, compiler, **kwargs):
+    # PostgreSQL (and Oracle)
+    return compiler.process(func.to_char(*element.clauses.clauses, 'MM-DD'), **kwargs)
+
+
+@compiles(month_day, 'mysql')
+def _month_day_mysql(element, compiler, **kwargs):
+    return compiler.process(func.date_format(*element.clauses.clauses, '%m-%d'), **kwargs)
+
+
+@compiles(month_day, 'sqlite')
+def _month_day_sqlite(element, compiler, **kwargs):
+    # SQLite stores the dates as text ('YYYY-MM-DD'). The expression is the one of BIRTHDAY_INDEX,
+    # with literal arguments, so that SQLite uses the index
+    return f'substr({compiler.process(element.clauses, **kwargs)}, 6, 5)'
+
+
+# The month and day ('MM-DD') of the birth date
+birthday = month_day(Collaborator.birth_date)
+
+# Backs the upcoming birthdays (SQLite only)
+BIRTHDAY_INDEX = 'CREATE INDEX IF NOT EXISTS ix_collaborator_birthday ON collaborator (substr(birth_date, 6, 5))'
+event.listen(Collaborator.__table__, 'after_create', DDL(BIRTHDAY_INDEX).execute_if(dialect='sqlite'))
+
+
+class BirthDate(fields.Date):
+    """
+    A date (YYYY-MM-DD). A date and time is accepted as well (e.g. 2020-11-11 00:00:00), and its time is dropped
+    """
+
+    def _deserialize(self, value, attr, data, **kwargs):
+        try:
+            return datetime.fromisoformat(value).date()
+        except (TypeError, ValueError):
+            raise self.make_error('invalid')
+
+
 class CollaboratorSchema(ma.Schema):
 
     collab_number = fields.Int(required=True)
     full_name = fields.Str(required=True)
-    birth_date = fields.Str(required=True)
+    birth_date = BirthDate(required=True)
     current_salary = fields.Float(required=True)
     active = fields.Boolean(required=True)
     sector_name = fields.Str(required=True)
@@ -1,6 +1,7 @@
 from sqlalchemy import Column, Integer, String
 from sqlalchemy.orm import relationship
 from database.database import db, ma
+from database import search
 from marshmallow import fields
 
 
@@ -9,10 +10,13 @@ class Sector(db.Model):
     fields = ('name',)
 
     id = Column(Integer, primary_key=True)
-    name = Column(String(100), nullable=False)
+    # The listings are paginated by (name, id). Since the name is unique, its index already covers them
+    name = Column(String(100), nullable=False, unique=True, index=True)
 
     # Creates a pseudo column in the Collaborator table
-    collaborators = relationship('Collaborator', cascade='all,delete', backref='sector')
+    # The collaborators are deleted by the database (ON DELETE CASCADE), in a single statement,
+    # instead of being loaded into the session and deleted one by one
+    collaborators = relationship('Collaborator', cascade='all,delete', passive_deletes=True, backref='sector')
 
     def __init__(self, name):
         self.name = name
@@ -21,6 +25,10 @@ class Sector(db.Model):
         return f'Database id: {Sector.id}, Sector name: {self.name}'
 
 
+# Full text search index over the names (backs the name filter)
+search.register(Sector.__table__, 'name')
+
+
 class SectorSchema(ma.Schema):
 
     name = fields.Str(required=True)
@@ -0,0 +1,59 @@
+from sqlalchemy import Column, Integer, Float, ForeignKey
+from database.database import db, ma
+from database import summary
+from marshmallow import fields
+
+
+class SectorSummary(db.Model):
+    """
+    Materialized headcount and payroll of a sector. Kept up to date by triggers on every write
+    to the collaborators (see database/summary.py), so reading it never scans the collaborators
+    """
+
+    __tablename__ = 'sector_summary'
+
+    fields = ('name', 'headcount', 'active_headcount', 'inactive_headcount',
+              'payroll', 'active_payroll', 'inactive_payroll')
+
+    sector_id = Column(Integer, ForeignKey('sector.id', ondelete='CASCADE'), primary_key=True)
+
+    active_headcount = Column(Integer, nullable=False, default=0)
+    inactive_headcount = Column(Integer, nullable=False, default=0)
+    active_payroll = Column(Float, nullable=False, default=0)
+    inactive_payroll = Column(Float, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'Sector id: {self.sector_id}, Active headcount: {self.active_headcount}, ' \
+               f'Inactive headcount: {self.inactive_headcount}, Active payroll: {self.active_payroll}, ' \
+               f'Inactive payroll: {self.inactive_payroll}'
+
+
+# Triggers that maintain the summaries
+summary.register(db.metadata)
+
+
+class SectorSummarySchema(ma.Schema):
+
+    name = fields.Str()
+    headcount = fields.Method('get_headcount')
+    active_headcount = fields.Int()
+    inactive_headcount = fields.Int()
+    payroll = fields.Method('get_payroll')
+    active_payroll = fields.Float()
+    inactive_payroll = fields.Float()
+
+    class Meta:
+        ordered = True
+        fields = SectorSummary.fields
+
+    @staticmethod
+    def get_headcount(row):
+        return row.active_headcount + row.inactive_headcount
+
+    @staticmethod
+    def get_payroll(row):
+        return row.active_payroll + row.inactive_payroll
+
+
+sector_summary_schema = SectorSummarySchema()
+sector_summaries_schema = SectorSummarySchema(many=True)
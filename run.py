@@ -1,12 +1,112 @@
+import argparse
+import os
+import signal
+import socket
+import sys
+import threading
+
+from werkzeug.serving import make_server
+
 from __init__ import create_app
 from database.database import db
+from database import migrations
+
+
+def create_schema(app):
+    with app.app_context():
+        db.create_all()
+        migrations.upgrade()
 
 
 def main():
+    parser = argparse.ArgumentParser(description='Runs the API')
+    commands = parser.add_subparsers(dest='command')
+
+    serve = commands.add_parser('serve', help='Production server: preforked worker processes sharing a preloaded app')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=5000)
+    serve.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Number of worker processes')
+    arguments = parser.parse_args()
+
     app = create_app()
+    create_schema(app)
+
+    if arguments.command == 'serve':
+        serve_forever(app, arguments.host, arguments.port, arguments.workers)
+    else:
+        # Development server (single process, with the debugger and the reloader)
+        app.run(debug=True)
+
+
+def serve_forever(app, host, port, workers):
+    """
+    Serves the app with preforked worker processes. The master process loads the app (and creates the schema)
+    once, then forks the workers, which share its listening socket and serve requests with threads.
+    Workers that die are replaced. On SIGTERM or SIGINT, the workers finish their requests and exit
+    :param app: The preloaded app
+    :param host: The address to listen on
+    :param port: The port to listen on
+    :param workers: The number of worker processes
+    """
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(1024)
+
+    # The workers must not share the connections opened by the master
     with app.app_context():
-        db.create_all()
-    app.run(debug=True)
+        db.get_engine(app).dispose()
+
+    children = set()
+    stopping = threading.Event()
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(app, host, port, listener)
+            os._exit(0)
+        children.add(pid)
+
+    def stop(signum, frame):
+        stopping.set()
+        for pid in children:
+            os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        spawn()
+    print(f' * Serving on http://{host}:{port} with {workers} workers (master pid {os.getpid()})', flush=True)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping.is_set():
+            print(f' * Worker {pid} exited (status {status}), starting a new one', file=sys.stderr, flush=True)
+            spawn()
+
+    listener.close()
+
+
+def _run_worker(app, host, port, listener):
+    server = make_server(host, port, app, threaded=True, fd=listener.fileno())
+
+    # Wait for the requests in progress before exiting
+    server.daemon_threads = False
+    server.block_on_close = True
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    server.serve_forever()
+    server.server_close()
 
 
 if __name__ == '__main__':
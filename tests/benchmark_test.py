@@ -0,0 +1,67 @@
+import json
+import os
+import tempfile
+import unittest
+
+from benchmarks import endpoints_benchmark
+
+
+class EndpointsBenchmarkTestCase(unittest.TestCase):
+    """
+    Runs the benchmark suite on a tiny dataset, so that it doesn't rot
+    """
+
+    def test_every_route_succeeds(self):
+
+        results = endpoints_benchmark.run(size=200, sectors=3, requests=2, warmup=0)
+
+        self.assertEqual([name for name, _ in endpoints_benchmark.CASES], list(results))
+        for name, summary in results.items():
+            self.assertEqual(0, summary['errors'], name)
+            self.assertEqual(2, summary['requests'])
+            self.assertLessEqual(summary['p50_ms'], summary['p99_ms'])
+
+    def test_compare_reports_regressions(self):
+
+        baseline = {'results': {'1000': {
+            'GET /sectors/all': {'p50_ms': 10.0},
+            'GET /sectors/stats': {'p50_ms': 10.0},
+            'GET /sectors/summary': {'p50_ms': 0.1},
+        }}}
+        results = {'results': {'1000': {
+            'GET /sectors/all': {'p50_ms': 11.0},
+            'GET /sectors/stats': {'p50_ms': 20.0},
+            # Slower in proportion, but by less than MIN_REGRESSION_MS
+            'GET /sectors/summary': {'p50_ms': 0.3},
+            # Not in the baseline
+            'GET /sectors/<name>': {'p50_ms': 50.0},
+        }}}
+
+        regressions = endpoints_benchmark.compare(results, baseline, threshold=0.25)
+
+        self.assertEqual(1, len(regressions))
+        self.assertIn('GET /sectors/stats', regressions[0])
+
+    def test_main_writes_the_results_and_fails_on_regressions(self):
+
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, 'results.json')
+            arguments = ['--sizes', '50', '--sectors', '2', '--requests', '1', '--output', output]
+            self.assertEqual(0, endpoints_benchmark.main(arguments))
+
+            with open(output) as file:
+                results = json.load(file)
+            self.assertIn('GET /collaborators/all', results['results']['50'])
+
+            # A baseline where every route was much faster
+            for summary in results['results']['50'].values():
+                summary['p50_ms'] -= 1000
+            baseline = os.path.join(directory, 'baseline.json')
+            with open(baseline, 'w') as file:
+                json.dump(results, file)
+
+            self.assertEqual(1, endpoints_benchmark.main(arguments + ['--baseline', baseline]))
+
+
+if __name__ == '__main__':
+    unittest.main()
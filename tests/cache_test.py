@@ -0,0 +1,150 @@
+import os
+import tempfile
+import time
+import unittest
+
+from __init__ import create_app
+from core.cache import MemoryCache, SQLiteCache
+from database.database import db
+
+
+COLLABORATORS_BASE_URL = 'http://127.0.0.1:5000/collaborators'
+SECTORS_BASE_URL = 'http://127.0.0.1:5000/sectors'
+
+
+class CacheBackendTestCase(unittest.TestCase):
+
+    def test_memory_cache_evicts_the_least_recently_used(self):
+
+        backend = MemoryCache(size=2, ttl=60)
+        backend.set('a', b'1')
+        backend.set('b', b'2')
+
+        # Use 'a', so that 'b' becomes the least recently used
+        self.assertEqual(b'1', backend.get('a'))
+        backend.set('c', b'3')
+
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(b'1', backend.get('a'))
+        self.assertEqual(b'3', backend.get('c'))
+
+    def test_memory_cache_expires_entries(self):
+
+        backend = MemoryCache(size=2, ttl=0.01)
+        backend.set('a', b'1')
+        time.sleep(0.02)
+
+        self.assertIsNone(backend.get('a'))
+
+    def test_sqlite_cache_is_shared_between_instances(self):
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'cache.db')
+            backend1 = SQLiteCache(path)
+            backend2 = SQLiteCache(path)
+
+            backend1.set('a', b'1')
+            self.assertEqual(b'1', backend2.get('a'))
+
+            backend2.delete('a')
+            self.assertIsNone(backend1.get('a'))
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+        self.client = self.app.test_client
+
+        self.collaborator = {
+            'collab_number': 12345,
+            'full_name': 'Bernardino',
+            'birth_date': '2020-11-11 00:00:00',
+            'current_salary': 123.45,
+            'active': True,
+            'sector_name': 'Tecnologia'
+        }
+        self.sector = {'name': 'Tecnologia'}
+
+        with self.app.app_context():
+            db.create_all()
+
+        self.client().post(f'{SECTORS_BASE_URL}/add/{self.sector["name"]}', json=self.sector)
+        self.client().post(f'{COLLABORATORS_BASE_URL}/add/12345', json=self.collaborator)
+
+    def test_get_collaborator_is_cached(self):
+
+        # The first request fills the cache, the second one is served from it
+        first = self.client().get(f'{COLLABORATORS_BASE_URL}/12345')
+        second = self.client().get(f'{COLLABORATORS_BASE_URL}/12345')
+
+        self.assertEqual(first.get_json(), second.get_json())
+        self.assertEqual('application/json', second.mimetype)
+
+        stats = self.client().get('/cache/stats').get_json()
+        self.assertEqual(1, stats['Hits'])
+        self.assertEqual(1, stats['Misses'])
+
+    def test_update_collaborator_invalidates_the_cache(self):
+
+        self.client().get(f'{COLLABORATORS_BASE_URL}/12345')
+
+        updated_data = self.collaborator.copy()
+        updated_data['current_salary'] = 9999.0
+        self.client().put(f'{COLLABORATORS_BASE_URL}/update/12345', json=updated_data)
+
+        response = self.client().get(f'{COLLABORATORS_BASE_URL}/12345')
+        self.assertEqual(9999.0, response.get_json()['current_salary'])
+
+    def test_delete_sector_invalidates_the_cache_of_its_collaborators(self):
+
+        self.client().get(f'{SECTORS_BASE_URL}/Tecnologia')
+        self.client().get(f'{COLLABORATORS_BASE_URL}/12345')
+
+        self.client().delete(f'{SECTORS_BASE_URL}/delete/Tecnologia')
+
+        self.assertEqual(404, self.client().get(f'{SECTORS_BASE_URL}/Tecnologia').status_code)
+        self.assertEqual(404, self.client().get(f'{COLLABORATORS_BASE_URL}/12345').status_code)
+
+    def test_rename_sector_invalidates_the_cache_of_its_collaborators(self):
+
+        self.client().get(f'{COLLABORATORS_BASE_URL}/12345')
+        self.client().put(f'{SECTORS_BASE_URL}/update/Tecnologia', json={'name': 'Limpeza'})
+
+        response = self.client().get(f'{COLLABORATORS_BASE_URL}/12345')
+        self.assertEqual('Limpeza', response.get_json()['sector_name'])
+
+    def test_write_of_another_worker_is_not_served_stale(self):
+
+        # Another worker: an app with its own (in memory) cache, on the same database
+        other_worker = create_app().test_client
+
+        first = self.client().get(f'{COLLABORATORS_BASE_URL}/12345')
+        self.client().get(f'{COLLABORATORS_BASE_URL}/12345')
+
+        updated_data = dict(self.collaborator, current_salary=999.0)
+        other_worker().put(f'{COLLABORATORS_BASE_URL}/update/12345', json=updated_data)
+
+        response = self.client().get(f'{COLLABORATORS_BASE_URL}/12345')
+        self.assertEqual(999.0, response.get_json()['current_salary'])
+        self.assertNotEqual(first.headers['ETag'], response.headers['ETag'])
+
+        # The new ETag goes with the new body
+        response = self.client().get(f'{COLLABORATORS_BASE_URL}/12345', headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(304, response.status_code)
+
+    def test_not_found_is_not_cached(self):
+
+        self.assertEqual(404, self.client().get(f'{SECTORS_BASE_URL}/Limpeza').status_code)
+        self.client().post(f'{SECTORS_BASE_URL}/add/Limpeza', json={'name': 'Limpeza'})
+
+        self.assertEqual(200, self.client().get(f'{SECTORS_BASE_URL}/Limpeza').status_code)
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,16 @@
+import json
 import unittest
 
 
+from sqlalchemy import event
+from sqlalchemy.dialects import postgresql, sqlite
+
 from __init__ import create_app
+from asgi import AsgiApp
+from core import pagination
 from database.database import db
 from datetime import datetime
+from models.collaborator_model import birthday
 
 
 COLLABORATORS_BASE_URL = 'http://127.0.0.1:5000/collaborators'
@@ -12,8 +19,11 @@ SECTORS_BASE_URL = 'http://127.0.0.1:5000/sectors'
 
 class CollaboratorTestCase(unittest.TestCase):
 
+    # Settings of the app under test (overridden by the subclasses that test other modes)
+    config = None
+
     def setUp(self):
-        self.app = create_app()
+        self.app = create_app(self.config)
         self.client = self.app.test_client
 
         today = datetime(year=2020, month=11, day=11)
@@ -131,6 +141,65 @@ class CollaboratorTestCase(unittest.TestCase):
         response_json_str = str(response.get_json())
         self.assertIn(f'Collaborator already exists with number = {collab_number}', response_json_str)
 
+    def test_add_collaborators_in_bulk(self):
+        """ Test if the API can add many collaborators at once, reporting errors per record - (POST request) """
+
+        self.client().post(f'{SECTORS_BASE_URL}/add/{self.sector["name"]}', json=self.sector)
+
+        # Add a collaborator, so that the bulk request contains a duplicate
+        url = f'{COLLABORATORS_BASE_URL}/add/{self.collaborator["collab_number"]}'
+        self.client().post(url, json=self.collaborator)
+
+        collaborator2 = self.collaborator.copy()
+        collaborator2['collab_number'] = 10
+
+        collaborator3 = self.collaborator.copy()
+        collaborator3['collab_number'] = 20
+        collaborator3['sector_name'] = 'Limpeza'
+
+        collaborator4 = self.collaborator.copy()
+        collaborator4['collab_number'] = 30
+
+        collaborators = [self.collaborator, collaborator2, collaborator3, {}, collaborator4]
+        response = self.client().post(f'{COLLABORATORS_BASE_URL}/add/bulk', json=collaborators)
+
+        # Verify the response code
+        self.assertEqual(200, response.status_code)
+
+        # Verify the response content
+        response_json = response.get_json()
+        self.assertEqual(2, response_json['Inserted'])
+        self.assertEqual(['0', '2', '3'], list(response_json['Errors']))
+        self.assertIn('Collaborator already exists', str(response_json['Errors']['0']))
+        self.assertIn('Sector not found with name = Limpeza', str(response_json['Errors']['2']))
+        self.assertIn('Missing data for required field', str(response_json['Errors']['3']))
+
+        # Check whether the valid collaborators were inserted
+        for collab_number in (10, 30):
+            response = self.client().get(f'{COLLABORATORS_BASE_URL}/{collab_number}')
+            self.assertEqual(200, response.status_code)
+
+    def test_add_collaborators_in_bulk_given_ndjson(self):
+        """ Test if the API can add many collaborators sent as NDJSON - (POST request) """
+
+        self.client().post(f'{SECTORS_BASE_URL}/add/{self.sector["name"]}', json=self.sector)
+
+        collaborator2 = self.collaborator.copy()
+        collaborator2['collab_number'] = 10
+
+        body = '\n'.join([json.dumps(self.collaborator), 'not json', json.dumps(collaborator2)])
+        response = self.client().post(
+            f'{COLLABORATORS_BASE_URL}/add/bulk', data=body, content_type='application/x-ndjson'
+        )
+
+        # Verify the response code
+        self.assertEqual(200, response.status_code)
+
+        # Verify the response content
+        response_json = response.get_json()
+        self.assertEqual(2, response_json['Inserted'])
+        self.assertEqual({'1': {'Error': 'Invalid JSON'}}, response_json['Errors'])
+
     def test_list_all_collaborators(self):
 
         self.client().post(f'{SECTORS_BASE_URL}/add/{self.sector["name"]}', json=self.sector)
@@ -165,6 +234,161 @@ class CollaboratorTestCase(unittest.TestCase):
         self.assertIn('Joao', response_json_str)
         self.assertIn('Anna', response_json_str)
 
+    def test_list_all_collaborators_with_constant_query_count(self):
+
+        self.client().post(f'{SECTORS_BASE_URL}/add/{self.sector["name"]}', json=self.sector)
+        self.client().post(f'{SECTORS_BASE_URL}/add/Limpeza', json={'name': 'Limpeza'})
+
+        def add_collaborators(collab_numbers):
+            for collab_number in collab_numbers:
+                collaborator = self.collaborator.copy()
+                collaborator['collab_number'] = collab_number
+                collaborator['sector_name'] = 'Limpeza' if collab_number % 2 else 'Tecnologia'
+                self.client().post(f'{COLLABORATORS_BASE_URL}/add/{collab_number}', json=collaborator)
+
+        def count_queries(url):
+            statements = []
+
+            def before_cursor_execute(*args):
+                statements.append(args[2])
+
+            with self.app.app_context():
+                event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+                try:
+                    response = self.client().get(url)
+                finally:
+                    event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+            return response, len(statements)
+
+        # Count the queries of a small listing
+        add_collaborators(range(1, 3))
+        response, small_listing_queries = count_queries(f'{COLLABORATORS_BASE_URL}/all')
+        self.assertEqual(['Limpeza', 'Tecnologia'], [item['sector_name'] for item in response.get_json()])
+
+        # Count the queries of a bigger listing
+        add_collaborators(range(3, 21))
+        for url in (f'{COLLABORATORS_BASE_URL}/all', f'{COLLABORATORS_BASE_URL}/all/0/100'):
+            response, queries = count_queries(url)
+            self.assertEqual(20, len(response.get_json()))
+            self.assertEqual(small_listing_queries, queries)
+            self.assertNotIn('None', str(response.get_json()))
+
+    def test_list_all_collaborators_streamed(self):
+
+        self.client().post(f'{SECTORS_BASE_URL}/add/{self.sector["name"]}', json=self.sector)
+
+        # Insert collaborators
+        collaborator2 = self.collaborator.copy()
+        collaborator2['collab_number'] = 10
+        collaborator2['full_name'] = 'Joao'
+
+        collaborator3 = self.collaborator.copy()
+        collaborator3['collab_number'] = 20
+        collaborator3['full_name'] = 'Anna'
+
+        collaborators = [self.collaborator, collaborator2, collaborator3]
+        for collaborator in collaborators:
+            self.client().post(
+                f'{COLLABORATORS_BASE_URL}/add/{collaborator["collab_number"]}', json=collaborator
+            )
+
+        # Retrieve the data, one collaborator per line
+        for url in (f'{COLLABORATORS_BASE_URL}/all', f'{COLLABORATORS_BASE_URL}/all/0/20000'):
+            response = self.client().get(url, headers={'Accept': 'application/x-ndjson'})
+
+            # Verify the response code
+            self.assertEqual(200, response.status_code)
+            self.assertEqual('application/x-ndjson', response.mimetype)
+
+            # Verify the response content
+            lines = response.get_data(as_text=True).splitlines()
+            names = {json.loads(line)['full_name'] for line in lines}
+            self.assertEqual({'Bernardino', 'Joao', 'Anna'}, names)
+
+    def test_list_all_collaborators_not_modified(self):
+
+        self.client().post(f'{SECTORS_BASE_URL}/add/{self.sector["name"]}', json=self.sector)
+
+        collab_number = self.collaborator['collab_number']
+        self.client().post(f'{COLLABORATORS_BASE_URL}/add/{collab_number}', json=self.collaborator)
+
+        # Retrieve the data and its ETag
+        url = f'{COLLABORATORS_BASE_URL}/all'
+        response = self.client().get(url)
+        etag = response.headers['ETag']
+
+        # Retrieve it again, with the ETag (nothing changed)
+        response = self.client().get(url, headers={'If-None-Match': etag})
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(b'', response.get_data())
+
+        # Change a collaborator and retrieve the data again, with the old ETag
+        updated_data = self.collaborator.copy()
+        updated_data['current_salary'] = 9999.00
+        self.client().put(f'{COLLABORATORS_BASE_URL}/update/{collab_number}', json=updated_data)
+
+        response = self.client().get(url, headers={'If-None-Match': etag})
+        self.assertEqual(200, response.status_code)
+        self.assertNotEqual(etag, response.headers['ETag'])
+        self.assertIn('9999.0', str(response.get_json()))
+
+    def test_list_all_collaborators_paginated(self):
+
+        self.client().post(f'{SECTORS_BASE_URL}/add/{self.sector["name"]}', json=self.sector)
+
+        # Insert collaborators (two of them with the same name)
+        names = ['Joao', 'Anna', 'Bernardino', 'Anna', 'Carla']
+        for collab_number, name in enumerate(names, start=1):
+            collaborator = self.collaborator.copy()
+            collaborator['collab_number'] = collab_number
+            collaborator['full_name'] = name
+            self.client().post(f'{COLLABORATORS_BASE_URL}/add/{collab_number}', json=collaborator)
+
+        # Walk through the pages
+        pages = []
+        url = f'{COLLABORATORS_BASE_URL}/all?limit=2'
+        while url:
+            response = self.client().get(url)
+            self.assertEqual(200, response.status_code)
+
+            response_json = response.get_json()
+            pages.append([collaborator['collab_number'] for collaborator in response_json['Items']])
+            url = response_json['Next'] and f'{COLLABORATORS_BASE_URL}/all?limit=2&cursor={response_json["Next"]}'
+
+        # Verify the content of the pages (ordered by name, then by insertion)
+        self.assertEqual([[2, 4], [3, 5], [1]], pages)
+
+        # A page of some fields selects only their columns (and those of the key of the page)
+        statements = []
+
+        def before_cursor_execute(*args):
+            statements.append(args[2])
+
+        with self.app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+            try:
+                response = self.client().get(f'{COLLABORATORS_BASE_URL}/all?limit=2&fields=collab_number')
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        self.assertEqual([{'collab_number': 2}, {'collab_number': 4}], response.get_json()['Items'])
+        self.assertNotIn('birth_date', statements[-1])
+
+        response = self.client().get(
+            f'{COLLABORATORS_BASE_URL}/all?limit=2&fields=collab_number&cursor={response.get_json()["Next"]}'
+        )
+        self.assertEqual([{'collab_number': 3}, {'collab_number': 5}], response.get_json()['Items'])
+
+    def test_list_all_collaborators_paginated_given_invalid_parameters(self):
+
+        for query_string in ('limit=0', 'limit=abc', 'cursor=abc'):
+            response = self.client().get(f'{COLLABORATORS_BASE_URL}/all?{query_string}')
+            self.assertEqual(422, response.status_code)
+
+        # Cursors that are valid JSON lists, but not of key values
+        for key in ([{'a': 1}, 2], [[1], 2], ['Ana', None], [True, 2]):
+            response = self.client().get(f'{COLLABORATORS_BASE_URL}/all?cursor={pagination.encode_cursor(key)}')
+            self.assertEqual(422, response.status_code)
+
     def test_list_all_collaborators_filtered_by_name(self):
 
         self.client().post(f'{SECTORS_BASE_URL}/add/{self.sector["name"]}', json=self.sector)
@@ -260,6 +484,55 @@ class CollaboratorTestCase(unittest.TestCase):
         # Verify the response content
         self.assertIn('No collaborators found', response_json_str)
 
+    def test_search_collaborators(self):
+
+        self.client().post(f'{SECTORS_BASE_URL}/add/{self.sector["name"]}', json=self.sector)
+
+        # Insert collaborators
+        names = ['Joao Vitor Andrade', 'Maria Joaquina', 'Joao Pedro Da Silva', 'Bernardino']
+        for collab_number, name in enumerate(names, start=1):
+            collaborator = self.collaborator.copy()
+            collaborator['collab_number'] = collab_number
+            collaborator['full_name'] = name
+            self.client().post(f'{COLLABORATORS_BASE_URL}/add/{collab_number}', json=collaborator)
+
+        # Search for a part of the names
+        response = self.client().get(f'{COLLABORATORS_BASE_URL}/search?q=joa&limit=2')
+
+        # Verify the response code
+        self.assertEqual(200, response.status_code)
+
+        # Verify the response content (at most two collaborators, none of them unrelated)
+        response_json = response.get_json()
+        self.assertEqual(2, len(response_json))
+        self.assertNotIn('Bernardino', str(response_json))
+
+        # Search for texts too short for the search index
+        response = self.client().get(f'{COLLABORATORS_BASE_URL}/search?q=Be')
+        self.assertEqual(['Bernardino'], [collaborator['full_name'] for collaborator in response.get_json()])
+
+    def test_search_collaborators_after_update_and_delete(self):
+
+        self.client().post(f'{SECTORS_BASE_URL}/add/{self.sector["name"]}', json=self.sector)
+
+        collab_number = self.collaborator['collab_number']
+        self.client().post(f'{COLLABORATORS_BASE_URL}/add/{collab_number}', json=self.collaborator)
+
+        # Rename the collaborator
+        updated_data = self.collaborator.copy()
+        updated_data['full_name'] = 'Josefina'
+        self.client().put(f'{COLLABORATORS_BASE_URL}/update/{collab_number}', json=updated_data)
+
+        # Verify that only the new name is found
+        self.assertEqual(404, self.client().get(f'{COLLABORATORS_BASE_URL}/search?q=Bernardino').status_code)
+        self.assertEqual(200, self.client().get(f'{COLLABORATORS_BASE_URL}/search?q=Josefina').status_code)
+        self.assertEqual(200, self.client().get(f'{COLLABORATORS_BASE_URL}/all/sefi').status_code)
+
+        # Delete the collaborator and verify that it is no longer found
+        self.client().delete(f'{COLLABORATORS_BASE_URL}/delete/{collab_number}')
+        self.assertEqual(404, self.client().get(f'{COLLABORATORS_BASE_URL}/search?q=Josefina').status_code)
+        self.assertEqual(404, self.client().get(f'{COLLABORATORS_BASE_URL}/all/sefi').status_code)
+
     def test_get_collaborator_by_number(self):
 
         self.client().post(f'{SECTORS_BASE_URL}/add/{self.sector["name"]}', json=self.sector)
@@ -338,10 +611,68 @@ class CollaboratorTestCase(unittest.TestCase):
         expected_code = 200
         self.assertEqual(response_code, expected_code)
 
-        # Verify response content
+        # Verify response content (the birth date is returned as a date, YYYY-MM-DD)
+        updated_data['birth_date'] = '2020-11-11'
         response_json_str = str(response.get_json())
         self.assertEqual(str(updated_data), response_json_str)
 
+    def test_update_collaborator_sector(self):
+
+        self.client().post(f'{SECTORS_BASE_URL}/add/{self.sector["name"]}', json=self.sector)
+        self.client().post(f'{SECTORS_BASE_URL}/add/Limpeza', json={'name': 'Limpeza'})
+
+        # Add a collaborator
+        collab_number = self.collaborator['collab_number']
+        self.client().post(f'{COLLABORATORS_BASE_URL}/add/{collab_number}', json=self.collaborator)
+
+        # Move the collaborator to another sector, counting the statements sent to the database
+        updated_data = self.collaborator.copy()
+        updated_data['sector_name'] = 'Limpeza'
+
+        statements = []
+
+        def before_cursor_execute(*args):
+            statements.append(args[2])
+
+        with self.app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+            try:
+                response = self.client().put(f'{COLLABORATORS_BASE_URL}/update/{collab_number}', json=updated_data)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+        # Verify response code
+        self.assertEqual(200, response.status_code)
+
+        # Verify that the collaborator was updated by a single statement
+        collaborator_statements = [statement for statement in statements if 'collaborator' in statement]
+        self.assertEqual(1, len(collaborator_statements))
+        self.assertTrue(collaborator_statements[0].startswith('UPDATE collaborator'))
+
+        # Check whether the update took effect
+        response = self.client().get(f'{COLLABORATORS_BASE_URL}/{collab_number}')
+        self.assertEqual('Limpeza', response.get_json()['sector_name'])
+
+    def test_update_collaborator_given_sector_that_doesnt_exist(self):
+
+        self.client().post(f'{SECTORS_BASE_URL}/add/{self.sector["name"]}', json=self.sector)
+
+        # Add a collaborator
+        collab_number = self.collaborator['collab_number']
+        self.client().post(f'{COLLABORATORS_BASE_URL}/add/{collab_number}', json=self.collaborator)
+
+        # Try to move the collaborator to a sector that doesn't exist
+        updated_data = self.collaborator.copy()
+        updated_data['sector_name'] = 'Limpeza'
+        response = self.client().put(f'{COLLABORATORS_BASE_URL}/update/{collab_number}', json=updated_data)
+
+        # Verify response code
+        self.assertEqual(404, response.status_code)
+
+        # Verify response content
+        response_json_str = str(response.get_json())
+        self.assertIn('Sector not found with name = Limpeza', response_json_str)
+
     def test_update_collaborator_given_empty_parameters(self):
 
         self.client().post(f'{SECTORS_BASE_URL}/add/{self.sector["name"]}', json=self.sector)
@@ -481,11 +812,236 @@ class CollaboratorTestCase(unittest.TestCase):
         response_json_str = str(response.get_json())
         self.assertIn(f'Collaborator not found with number = {not_in_database}', response_json_str)
 
+    def _add_collaborators_born(self, birth_dates):
+        self.client().post(f'{SECTORS_BASE_URL}/add/{self.sector["name"]}', json=self.sector)
+        for collab_number, birth_date in enumerate(birth_dates, start=1):
+            collaborator = self.collaborator.copy()
+            collaborator['collab_number'] = collab_number
+            collaborator['birth_date'] = birth_date
+            self.client().post(f'{COLLABORATORS_BASE_URL}/add/{collab_number}', json=collaborator)
+
+    def test_add_collaborator_with_invalid_birth_date(self):
+
+        self.client().post(f'{SECTORS_BASE_URL}/add/{self.sector["name"]}', json=self.sector)
+
+        collaborator = self.collaborator.copy()
+        collaborator['birth_date'] = '2020-02-30'
+        response = self.client().post(f'{COLLABORATORS_BASE_URL}/add/{collaborator["collab_number"]}', json=collaborator)
+
+        self.assertEqual(422, response.status_code)
+        self.assertIn('birth_date', response.get_json())
+
+    def test_list_collaborators_born_between(self):
+
+        self._add_collaborators_born(['1990-05-01', '1985-03-10 00:00:00', '1999-12-31', '2000-01-01'])
+
+        response = self.client().get(f'{COLLABORATORS_BASE_URL}/born/1985-03-10/1999-12-31')
+        self.assertEqual(200, response.status_code)
+
+        # The oldest first, with the dates as YYYY-MM-DD
+        self.assertEqual(
+            [(2, '1985-03-10'), (1, '1990-05-01'), (3, '1999-12-31')],
+            [(collaborator['collab_number'], collaborator['birth_date']) for collaborator in response.get_json()]
+        )
+
+        response = self.client().get(f'{COLLABORATORS_BASE_URL}/born/2001-01-01/2010-01-01')
+        self.assertEqual(404, response.status_code)
+
+        response = self.client().get(f'{COLLABORATORS_BASE_URL}/born/2001-01-01/yesterday')
+        self.assertEqual(422, response.status_code)
+
+    def test_list_upcoming_birthdays(self):
+
+        self._add_collaborators_born(['1990-12-30', '1985-01-02', '1999-12-20', '2000-06-15', '1970-12-28'])
+
+        # From the 28th of December, the range wraps around to the next year
+        response = self.client().get(f'{COLLABORATORS_BASE_URL}/birthdays/7?from=2021-12-28')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([5, 1, 2], [collaborator['collab_number'] for collaborator in response.get_json()])
+
+        response = self.client().get(f'{COLLABORATORS_BASE_URL}/birthdays/0?from=2021-06-15&fields=collab_number')
+        self.assertEqual([{'collab_number': 4}], response.get_json())
+
+        # Everyone has a birthday within a year, the nearest first
+        response = self.client().get(f'{COLLABORATORS_BASE_URL}/birthdays/366?from=2021-12-21')
+        self.assertEqual([5, 1, 2, 4, 3], [collaborator['collab_number'] for collaborator in response.get_json()])
+
+        response = self.client().get(f'{COLLABORATORS_BASE_URL}/birthdays/3?from=2021-03-01')
+        self.assertEqual(404, response.status_code)
+
+        self.assertEqual(422, self.client().get(f'{COLLABORATORS_BASE_URL}/birthdays/400').status_code)
+        self.assertEqual(422, self.client().get(f'{COLLABORATORS_BASE_URL}/birthdays/3?from=now').status_code)
+
+    def test_birthday_of_date_columns(self):
+
+        # The databases other than SQLite store the birth dates as dates, not as text
+        self.assertEqual('to_char(collaborator.birth_date, %(to_char_1)s)',
+                         str(birthday.compile(dialect=postgresql.dialect())))
+        self.assertEqual('substr(collaborator.birth_date, 6, 5)', str(birthday.compile(dialect=sqlite.dialect())))
+
+    def _add_query_collaborators(self):
+        self.client().post(f'{SECTORS_BASE_URL}/add/{self.sector["name"]}', json=self.sector)
+        self.client().post(f'{SECTORS_BASE_URL}/add/Limpeza', json={'name': 'Limpeza'})
+        rows = [
+            (1, 'Ana', 1000.0, True, 'Tecnologia'),
+            (2, 'Bruno', 5000.0, True, 'Tecnologia'),
+            (3, 'Carlos', 3000.0, False, 'Tecnologia'),
+            (4, 'Daniel', 4000.0, True, 'Limpeza'),
+            (5, 'Eduarda', 2000.0, True, 'Limpeza'),
+        ]
+        for collab_number, full_name, current_salary, active, sector_name in rows:
+            collaborator = dict(self.collaborator, collab_number=collab_number, full_name=full_name,
+                                current_salary=current_salary, active=active, sector_name=sector_name)
+            self.client().post(f'{COLLABORATORS_BASE_URL}/add/{collab_number}', json=collaborator)
+
+    def test_query_collaborators(self):
+
+        self._add_query_collaborators()
+
+        # Equality, a range and a sort, answered by the index on (sector, active, salary)
+        response = self.client().get(
+            f'{COLLABORATORS_BASE_URL}/query?sector_name=Tecnologia&active=true&current_salary.gte=1000'
+            f'&sort=-current_salary&fields=collab_number'
+        )
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([{'collab_number': 2}, {'collab_number': 1}], response.get_json()['Items'])
+        self.assertEqual('ix_collaborator_sector_id_active_current_salary', response.get_json()['Plan'])
+
+        # A list of sectors, with a limit
+        response = self.client().get(
+            f'{COLLABORATORS_BASE_URL}/query?sector_name.in=Limpeza,Tecnologia&sort=full_name&limit=2'
+        )
+        self.assertEqual(['Ana', 'Bruno'], [item['full_name'] for item in response.get_json()['Items']])
+
+        # A range of numbers, filtered by status as well
+        response = self.client().get(
+            f'{COLLABORATORS_BASE_URL}/query?collab_number.gt=1&collab_number.lte=4&active=false'
+        )
+        self.assertEqual([3], [item['collab_number'] for item in response.get_json()['Items']])
+        self.assertEqual('ix_collaborator_collab_number', response.get_json()['Plan'])
+
+        # Sorted by an indexed field only
+        response = self.client().get(f'{COLLABORATORS_BASE_URL}/query?sort=-full_name&limit=1')
+        self.assertEqual('Eduarda', response.get_json()['Items'][0]['full_name'])
+
+        response = self.client().get(f'{COLLABORATORS_BASE_URL}/query?collab_number.gt=100')
+        self.assertEqual(404, response.status_code)
+
+    def test_query_collaborators_given_invalid_queries(self):
+
+        self._add_query_collaborators()
+
+        queries = [
+            # Not served by any index
+            'active=true',
+            'current_salary.gte=1000',
+            # Invalid fields, operators and values
+            'salary=1', 'full_name.like=Ana', 'collab_number=abc', 'collab_number=1&sort=salary',
+            'collab_number=1&limit=0',
+            # Too many values (each one is a bound parameter)
+            'collab_number.in=' + ','.join(map(str, range(101))),
+            '&'.join(['collab_number.in=' + ','.join(map(str, range(100)))] * 6),
+        ]
+        for query in queries:
+            response = self.client().get(f'{COLLABORATORS_BASE_URL}/query?{query}')
+            self.assertEqual(422, response.status_code, query)
+            self.assertIn('Error', response.get_json())
+
+    def test_upsert_collaborator(self):
+
+        self.client().post(f'{SECTORS_BASE_URL}/add/{self.sector["name"]}', json=self.sector)
+        self.client().post(f'{SECTORS_BASE_URL}/add/Limpeza', json={'name': 'Limpeza'})
+        collab_number = self.collaborator['collab_number']
+        url = f'{COLLABORATORS_BASE_URL}/upsert/{collab_number}'
+
+        # Insert, then update the collaborator
+        response = self.client().put(url, json=self.collaborator)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('Tecnologia', self.client().get(f'{COLLABORATORS_BASE_URL}/{collab_number}').get_json()['sector_name'])
+
+        updated = dict(self.collaborator, full_name='Bernardino Silva', sector_name='Limpeza')
+        response = self.client().put(url, json=updated)
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(dict(updated, birth_date='2020-11-11'), response.get_json())
+        self.assertEqual(dict(updated, birth_date='2020-11-11'),
+                         self.client().get(f'{COLLABORATORS_BASE_URL}/{collab_number}').get_json())
+
+        # The summaries follow the collaborator to its new sector
+        self.assertEqual(0, self.client().get(f'{SECTORS_BASE_URL}/Tecnologia/summary').get_json()['headcount'])
+        self.assertEqual(1, self.client().get(f'{SECTORS_BASE_URL}/Limpeza/summary').get_json()['headcount'])
+        response = self.client().get(f'{COLLABORATORS_BASE_URL}/all')
+        self.assertEqual(1, len(response.get_json()))
+
+    def test_upsert_collaborator_given_invalid_data(self):
+
+        self.client().post(f'{SECTORS_BASE_URL}/add/{self.sector["name"]}', json=self.sector)
+        collab_number = self.collaborator['collab_number']
+        url = f'{COLLABORATORS_BASE_URL}/upsert/{collab_number}'
+        self.client().put(url, json=self.collaborator)
+
+        # A number other than the one of the URL
+        response = self.client().put(f'{COLLABORATORS_BASE_URL}/upsert/1', json=self.collaborator)
+        self.assertEqual(422, response.status_code)
+
+        # A sector that doesn't exist (for a new collaborator, and for an existing one whose data doesn't change)
+        for number in (1, collab_number):
+            response = self.client().put(f'{COLLABORATORS_BASE_URL}/upsert/{number}',
+                                         json=dict(self.collaborator, collab_number=number, sector_name='Limpeza'))
+            self.assertEqual(404, response.status_code)
+            self.assertEqual({'Error': 'Sector not found with name = Limpeza'}, response.get_json())
+
+        response = self.client().get(f'{COLLABORATORS_BASE_URL}/{collab_number}')
+        self.assertEqual('Tecnologia', response.get_json()['sector_name'])
+        self.assertEqual(404, self.client().get(f'{COLLABORATORS_BASE_URL}/1').status_code)
+
+    def test_upsert_collaborators_in_bulk(self):
+
+        self.client().post(f'{SECTORS_BASE_URL}/add/{self.sector["name"]}', json=self.sector)
+        self.client().post(f'{COLLABORATORS_BASE_URL}/add/1', json=dict(self.collaborator, collab_number=1))
+
+        collaborators = [
+            dict(self.collaborator, collab_number=1, full_name='Ana'),
+            dict(self.collaborator, collab_number=2),
+            dict(self.collaborator, collab_number=3, sector_name='Limpeza'),
+            dict(self.collaborator, collab_number='abc'),
+        ]
+        response = self.client().put(f'{COLLABORATORS_BASE_URL}/upsert/bulk', json=collaborators)
+
+        self.assertEqual(200, response.status_code)
+        result = response.get_json()
+        self.assertEqual(2, result['Upserted'])
+        self.assertEqual(['2', '3'], list(result['Errors']))
+        self.assertEqual({'Error': 'Sector not found with name = Limpeza'}, result['Errors']['2'])
+        self.assertEqual('Ana', self.client().get(f'{COLLABORATORS_BASE_URL}/1').get_json()['full_name'])
+        self.assertEqual(200, self.client().get(f'{COLLABORATORS_BASE_URL}/2').status_code)
+
+        response = self.client().put(f'{COLLABORATORS_BASE_URL}/upsert/bulk', json={'collab_number': 1})
+        self.assertEqual(422, response.status_code)
+
     def tearDown(self):
         with self.app.app_context():
             db.session.remove()
             db.drop_all()
 
 
+class GroupCommitCollaboratorTestCase(CollaboratorTestCase):
+    """ Runs the same tests with the writes committed in groups """
+
+    config = {'DATABASE_GROUP_COMMIT': True}
+
+
+class AsgiCollaboratorTestCase(CollaboratorTestCase):
+    """ Runs the same tests through the ASGI serving mode """
+
+    def setUp(self):
+        super().setUp()
+        self.asgi_app = AsgiApp(self.app)
+        self.client = self.asgi_app.test_client
+
+    def tearDown(self):
+        self.asgi_app.executor.shutdown()
+        super().tearDown()
+
+
 if __name__ == "__main__":
     unittest.main()
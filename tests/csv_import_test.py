@@ -0,0 +1,154 @@
+import csv
+import json
+import os
+import tempfile
+import unittest
+
+from __init__ import create_app
+from core import csv_import
+from database.database import db
+
+
+COLLABORATORS_BASE_URL = 'http://127.0.0.1:5000/collaborators'
+SECTORS_BASE_URL = 'http://127.0.0.1:5000/sectors'
+
+HEADER = 'collab_number,full_name,birth_date,current_salary,active,sector_name\n'
+
+
+class CsvImportTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+        self.client = self.app.test_client
+        self.directory = tempfile.TemporaryDirectory()
+
+        with self.app.app_context():
+            db.create_all()
+
+        for name in ('Tecnologia', 'Limpeza'):
+            self.client().post(f'{SECTORS_BASE_URL}/add/{name}', json={'name': name})
+        self.client().post(f'{COLLABORATORS_BASE_URL}/add/1', json={
+            'collab_number': 1,
+            'full_name': 'Bernardino',
+            'birth_date': '2020-11-11',
+            'current_salary': 100.0,
+            'active': True,
+            'sector_name': 'Tecnologia'
+        })
+
+    def _import(self, content, *arguments):
+        path = os.path.join(self.directory.name, 'collaborators.csv')
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        result = self.app.test_cli_runner().invoke(args=['import-collaborators', path, *arguments])
+        return path, result
+
+    def test_import_adds_and_updates(self):
+
+        path, result = self._import(
+            HEADER +
+            '1,Bernardino Silva,2020-11-11,150.0,false,Limpeza\n'
+            '2,"Ana, Maria",1990-01-31,200.5,true,Tecnologia\n'
+            '3,João,1985-06-15,300.0,True,Limpeza\n',
+            '--chunk-size', '2'
+        )
+
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertIn('3 rows read, 3 imported, 0 rejected', result.output)
+        self.assertIn('Imported 3 collaborators', result.output)
+        self.assertFalse(os.path.exists(f'{path}.rejected.csv'))
+
+        self.assertEqual({
+            'collab_number': 1,
+            'full_name': 'Bernardino Silva',
+            'birth_date': '2020-11-11',
+            'current_salary': 150.0,
+            'active': False,
+            'sector_name': 'Limpeza'
+        }, self.client().get(f'{COLLABORATORS_BASE_URL}/1').get_json())
+        self.assertEqual('Ana, Maria', self.client().get(f'{COLLABORATORS_BASE_URL}/2').get_json()['full_name'])
+
+        # The summaries follow the updated collaborator to its new sector
+        technology = self.client().get(f'{SECTORS_BASE_URL}/Tecnologia/summary').get_json()
+        cleaning = self.client().get(f'{SECTORS_BASE_URL}/Limpeza/summary').get_json()
+        self.assertEqual((1, 200.5), (technology['headcount'], technology['payroll']))
+        self.assertEqual((2, 1, 450.0), (cleaning['headcount'], cleaning['inactive_headcount'], cleaning['payroll']))
+
+    def test_import_rejects_invalid_rows(self):
+
+        path, result = self._import(
+            HEADER +
+            '2,Ana,1990-01-31,200.5,true,Tecnologia\n'
+            'abc,Carlos,1990-01-31,200.5,true,Tecnologia\n'
+            '4,Daniel,,200.5,true,Tecnologia\n'
+            '5,Eduarda,1990-01-31,200.5,true,Financeiro\n'
+            '6,Fernanda,1990-01-31,200.5,true,Limpeza\n'
+        )
+
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertIn('Imported 2 collaborators', result.output)
+        self.assertIn('Rejected 3 rows', result.output)
+        self.assertEqual(200, self.client().get(f'{COLLABORATORS_BASE_URL}/6').status_code)
+
+        with open(f'{path}.rejected.csv', newline='', encoding='utf-8') as file:
+            rejected = list(csv.DictReader(file))
+        self.assertEqual(['3', '4', '5'], [row['line'] for row in rejected])
+        self.assertEqual('abc', rejected[0]['collab_number'])
+        self.assertIn('collab_number', json.loads(rejected[0]['error']))
+        self.assertIn('birth_date', json.loads(rejected[1]['error']))
+        self.assertEqual({'Error': 'Sector not found with name = Financeiro'}, json.loads(rejected[2]['error']))
+
+    def test_import_ignores_other_columns(self):
+
+        _, result = self._import(
+            'department_code,' + HEADER +
+            'D1,2,Ana,1990-01-31,200.5,true,Tecnologia\n'
+            'D2,3,João,1985-06-15,300.0,false,Limpeza\n'
+        )
+
+        self.assertEqual(0, result.exit_code, result.output)
+        self.assertIn('2 rows read, 2 imported, 0 rejected', result.output)
+        self.assertEqual('João', self.client().get(f'{COLLABORATORS_BASE_URL}/3').get_json()['full_name'])
+
+    def test_failed_chunk_is_not_stored(self):
+
+        rows = [
+            {'collab_number': '10', 'full_name': 'Ana', 'birth_date': '1990-01-31', 'current_salary': '200.5',
+             'active': 'true', 'sector_name': 'Tecnologia'},
+            {'collab_number': '11', 'full_name': 'Carlos', 'birth_date': '1990-01-31', 'current_salary': '200.5',
+             'active': 'true', 'sector_name': 'Limpeza'},
+            {'collab_number': '12', 'full_name': 'Daniel', 'birth_date': '1990-01-31', 'current_salary': '200.5',
+             'active': 'true', 'sector_name': 'Tecnologia'},
+        ]
+        with self.app.app_context():
+            the_import = csv_import.Import(os.path.join(self.directory.name, 'rejected.csv'))
+
+            # The sector is deleted after the import read the sector ids, so the first chunk fails on its second row
+            db.session.execute("DELETE FROM sector WHERE name = 'Limpeza'")
+            db.session.commit()
+
+            the_import.load([(2, rows[0]), (3, rows[1])])
+            the_import.load([(4, rows[2])])
+            the_import.close()
+
+        self.assertEqual((3, 1, 2), (the_import.read, the_import.imported, the_import.rejected))
+        self.assertEqual(404, self.client().get(f'{COLLABORATORS_BASE_URL}/10').status_code)
+        self.assertEqual(404, self.client().get(f'{COLLABORATORS_BASE_URL}/11').status_code)
+        self.assertEqual(200, self.client().get(f'{COLLABORATORS_BASE_URL}/12').status_code)
+
+    def test_import_requires_the_columns(self):
+
+        _, result = self._import('collab_number,full_name\n1,Bernardino\n')
+
+        self.assertNotEqual(0, result.exit_code)
+        self.assertIn('Missing columns: active, birth_date, current_salary, sector_name', result.output)
+
+    def tearDown(self):
+        self.directory.cleanup()
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    unittest.main()
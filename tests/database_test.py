@@ -0,0 +1,185 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from sqlalchemy import event
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import QueuePool
+
+from __init__ import create_app
+from database import database, migrations, search
+from database.database import db
+from models.sector_model import Sector
+
+
+class DatabaseConfigurationTestCase(unittest.TestCase):
+
+    def test_sqlite_pragmas_are_set_on_every_connection(self):
+
+        with tempfile.TemporaryDirectory() as directory:
+            app = create_app({
+                'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(directory, "test.db")}',
+                'SQLITE_BUSY_TIMEOUT': 1234,
+            })
+
+            with app.app_context():
+                engine = db.get_engine(app)
+                self.assertIsInstance(engine.pool, QueuePool)
+
+                # Open two connections at once, so that both are set up
+                with engine.connect() as first, engine.connect() as second:
+                    for connection in (first, second):
+                        self.assertEqual('wal', connection.execute('PRAGMA journal_mode').scalar())
+                        self.assertEqual(1, connection.execute('PRAGMA synchronous').scalar())
+                        self.assertEqual(1234, connection.execute('PRAGMA busy_timeout').scalar())
+                        self.assertEqual(1, connection.execute('PRAGMA foreign_keys').scalar())
+                engine.dispose()
+
+    def test_database_uri_from_the_environment(self):
+
+        os.environ['DATABASE_URL'] = 'sqlite://'
+        try:
+            app = create_app()
+        finally:
+            del os.environ['DATABASE_URL']
+
+        self.assertEqual('sqlite://', app.config['SQLALCHEMY_DATABASE_URI'])
+
+    def test_server_database_engine_options(self):
+
+        config = dict(database.DEFAULT_SETTINGS, DATABASE_POOL_SIZE=5)
+        options = database.engine_options(make_url('postgresql://user@localhost/company'), config)
+
+        self.assertEqual(5, options['pool_size'])
+        self.assertEqual(20, options['max_overflow'])
+        self.assertTrue(options['pool_pre_ping'])
+
+
+class GroupCommitTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.app = create_app({
+            'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(self.directory.name, "test.db")}',
+            'DATABASE_GROUP_COMMIT': True,
+            'DATABASE_GROUP_COMMIT_WINDOW': 50,
+        })
+        self.client = self.app.test_client
+
+        with self.app.app_context():
+            db.create_all()
+
+    def test_concurrent_writes_are_committed_together(self):
+
+        # Trace the statements that reach SQLite (the connections are opened again, so that all of them are traced)
+        statements = []
+        with self.app.app_context():
+            engine = db.get_engine(self.app)
+            engine.dispose()
+            event.listen(engine, 'connect', lambda connection, record: connection.set_trace_callback(statements.append))
+
+        # Add sectors from many threads at once (one of them twice)
+        names = [f'Sector {number}' for number in range(20)] + ['Sector 0']
+        responses = {}
+
+        def add(index, name):
+            responses[index] = self.client().post(f'/sectors/add/{name}', json={'name': name})
+
+        threads = [threading.Thread(target=add, args=(index, name)) for index, name in enumerate(names)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Each request gets its own result
+        codes = sorted(response.status_code for response in responses.values())
+        self.assertEqual([200] * 20 + [409], codes)
+
+        # The writes were committed in fewer transactions than there were requests
+        committer = self.app.group_committer
+        self.assertEqual(21, committer.writes)
+        self.assertLess(committer.batches, committer.writes)
+
+        # Each batch is a single transaction of SQLite, with a single commit
+        transactions = [statement.strip() for statement in statements if statement.strip() in ('BEGIN', 'COMMIT')]
+        self.assertEqual(['BEGIN', 'COMMIT'] * committer.batches, transactions)
+
+        response = self.client().get('/sectors/all')
+        self.assertEqual(20, len(response.get_json()))
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+            db.get_engine(self.app).dispose()
+        self.directory.cleanup()
+
+
+class SearchSupportTestCase(unittest.TestCase):
+
+    def test_without_the_tokenizer_the_names_are_filtered_with_like(self):
+
+        # A SQLite library without the tokenizer (e.g. older than 3.34)
+        with mock.patch.object(search, 'TOKENIZER', 'missing_tokenizer'), tempfile.TemporaryDirectory() as directory:
+            app = create_app({'SQLALCHEMY_DATABASE_URI': f'sqlite:///{os.path.join(directory, "test.db")}'})
+            with app.app_context():
+                db.create_all()
+                migrations.upgrade()
+                self.assertFalse(search.is_available())
+                tables = db.session.execute("SELECT name FROM sqlite_master WHERE name LIKE '%search%'").fetchall()
+                self.assertEqual([], tables)
+
+            client = app.test_client()
+            client.post('/sectors/add/Tecnologia', json={'name': 'Tecnologia'})
+            response = client.get('/sectors/all/nolo')
+            self.assertEqual(['Tecnologia'], [item['name'] for item in response.get_json()])
+
+            with app.app_context():
+                db.session.remove()
+                db.get_engine(app).dispose()
+
+
+class BulkUpsertTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+
+        with self.app.app_context():
+            db.create_all()
+
+    def test_bulk_upsert_inserts_and_updates(self):
+
+        with self.app.app_context():
+            table = Sector.__table__
+            database.bulk_upsert(table, [{'id': 1, 'name': 'Tecnologia'}, {'id': 2, 'name': 'Limpeza'}], key='id')
+            database.bulk_upsert(table, [{'id': 2, 'name': 'Financeiro'}, {'id': 3, 'name': 'Vendas'}], key='id')
+            # A row that doesn't change is left alone
+            database.bulk_upsert(table, [{'id': 3, 'name': 'Vendas'}], key='id')
+
+            self.assertEqual([(1, 'Tecnologia'), (2, 'Financeiro'), (3, 'Vendas')],
+                             db.session.execute(table.select().order_by(table.c.id)).fetchall())
+            self.assertEqual(3, database.table_versions('sector')['sector'][0])
+
+    def test_failed_bulk_insert_is_rolled_back(self):
+
+        with self.app.app_context():
+            table = Sector.__table__
+            # The second row breaks the unique name, after the first one was inserted
+            with self.assertRaises(IntegrityError):
+                database.bulk_insert(table, [{'name': 'Tecnologia'}, {'name': 'Tecnologia'}])
+
+            # A later write doesn't commit the first row along with its own
+            database.bulk_insert(table, [{'name': 'Limpeza'}])
+            self.assertEqual(['Limpeza'], [row.name for row in db.session.execute(table.select())])
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    unittest.main()
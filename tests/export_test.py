@@ -0,0 +1,105 @@
+import csv
+import io
+import os
+import tempfile
+import unittest
+from datetime import date
+
+from __init__ import create_app
+from core import export
+from database.database import db
+
+
+COLLABORATORS_BASE_URL = 'http://127.0.0.1:5000/collaborators'
+SECTORS_BASE_URL = 'http://127.0.0.1:5000/sectors'
+EXPORT_BASE_URL = 'http://127.0.0.1:5000/export'
+
+
+class ExportTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+        self.client = self.app.test_client
+
+        with self.app.app_context():
+            db.create_all()
+
+        for name in ('Tecnologia', 'Limpeza'):
+            self.client().post(f'{SECTORS_BASE_URL}/add/{name}', json={'name': name})
+        for collab_number, full_name, sector_name in ((3, 'Ana, "Aninha"', 'Limpeza'),
+                                                      (1, 'Bernardino', 'Tecnologia'),
+                                                      (2, 'João', 'Tecnologia')):
+            self.client().post(f'{COLLABORATORS_BASE_URL}/add/{collab_number}', json={
+                'collab_number': collab_number,
+                'full_name': full_name,
+                'birth_date': '2020-11-11',
+                'current_salary': 123.45,
+                'active': collab_number != 2,
+                'sector_name': sector_name
+            })
+
+    def test_export_csv(self):
+
+        response = self.client().get(f'{EXPORT_BASE_URL}/collaborators?batch_size=2')
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual('text/csv', response.mimetype)
+        self.assertEqual('attachment; filename=collaborators.csv', response.headers['Content-Disposition'])
+        rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual(['collab_number', 'full_name', 'birth_date', 'current_salary', 'active', 'sector_name'], rows[0])
+        self.assertEqual(['1', 'Bernardino', '2020-11-11', '123.45', 'True', 'Tecnologia'], rows[1])
+        self.assertEqual(['1', '2', '3'], [row[0] for row in rows[1:]])
+        self.assertEqual('Ana, "Aninha"', rows[3][1])
+
+    def test_export_binary(self):
+
+        response = self.client().get(f'{EXPORT_BASE_URL}/collaborators?format=binary&batch_size=2')
+
+        self.assertEqual(200, response.status_code)
+        names, rows = export.read_binary(io.BytesIO(response.get_data()))
+        self.assertEqual(['collab_number', 'full_name', 'birth_date', 'current_salary', 'active', 'sector_name'], names)
+        self.assertEqual([
+            (1, 'Bernardino', date(2020, 11, 11), 123.45, True, 'Tecnologia'),
+            (2, 'João', date(2020, 11, 11), 123.45, False, 'Tecnologia'),
+            (3, 'Ana, "Aninha"', date(2020, 11, 11), 123.45, True, 'Limpeza'),
+        ], list(rows))
+
+    def test_export_resumes_after_a_key(self):
+
+        response = self.client().get(f'{EXPORT_BASE_URL}/collaborators?after=1')
+        rows = list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+        self.assertEqual(['2', '3'], [row[0] for row in rows[1:]])
+
+        response = self.client().get(f'{EXPORT_BASE_URL}/sectors?format=binary&after=Limpeza')
+        names, rows = export.read_binary(io.BytesIO(response.get_data()))
+        self.assertEqual(['name'], names)
+        self.assertEqual([('Tecnologia',)], list(rows))
+
+    def test_export_errors(self):
+
+        self.assertEqual(404, self.client().get(f'{EXPORT_BASE_URL}/salaries').status_code)
+        self.assertEqual(422, self.client().get(f'{EXPORT_BASE_URL}/collaborators?format=xml').status_code)
+        self.assertEqual(422, self.client().get(f'{EXPORT_BASE_URL}/collaborators?after=abc').status_code)
+        self.assertEqual(422, self.client().get(f'{EXPORT_BASE_URL}/collaborators?batch_size=0').status_code)
+
+    def test_export_command(self):
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'collaborators.bin')
+            result = self.app.test_cli_runner().invoke(
+                args=['export', 'collaborators', path, '--format', 'binary', '--after', '1', '--batch-size', '1'])
+
+            self.assertEqual(0, result.exit_code, result.output)
+            self.assertIn('2 rows exported (last key: 3)', result.output)
+            with open(path, 'rb') as file:
+                _, rows = export.read_binary(file)
+                self.assertEqual([2, 3], [row[0] for row in rows])
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import time
+import unittest
+
+from flask import g
+from sqlalchemy.exc import IntegrityError
+
+from __init__ import create_app
+from core.metrics import RequestMetrics
+from database.database import db
+from models.sector_model import Sector
+
+
+COLLABORATORS_BASE_URL = 'http://127.0.0.1:5000/collaborators'
+SECTORS_BASE_URL = 'http://127.0.0.1:5000/sectors'
+
+
+class MetricsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app({'METRICS': True})
+        self.client = self.app.test_client
+
+        with self.app.app_context():
+            db.create_all()
+
+        self.client().post(f'{SECTORS_BASE_URL}/add/Tecnologia', json={'name': 'Tecnologia'})
+        self.client().post(f'{COLLABORATORS_BASE_URL}/add/12345', json={
+            'collab_number': 12345,
+            'full_name': 'Bernardino',
+            'birth_date': '2020-11-11 00:00:00',
+            'current_salary': 123.45,
+            'active': True,
+            'sector_name': 'Tecnologia'
+        })
+
+    def _server_timing(self, response):
+        timings = {}
+        for metric in response.headers['Server-Timing'].split(', '):
+            name, *parameters = metric.split(';')
+            timings[name] = dict(parameter.split('=', 1) for parameter in parameters)
+        return timings
+
+    def test_server_timing_header(self):
+
+        response = self.client().get(f'{COLLABORATORS_BASE_URL}/all')
+        timings = self._server_timing(response)
+
+        self.assertEqual({'total', 'sql', 'serialization'}, set(timings))
+        self.assertGreater(float(timings['total']['dur']), 0)
+        self.assertGreater(float(timings['sql']['dur']), 0)
+        self.assertGreaterEqual(float(timings['total']['dur']), float(timings['sql']['dur']))
+        # The versions of the tables (ETag) and the listing
+        self.assertEqual('"2 statements"', timings['sql']['desc'])
+
+    def test_metrics_endpoint(self):
+
+        self.client().get(f'{COLLABORATORS_BASE_URL}/all')
+        self.client().get(f'{COLLABORATORS_BASE_URL}/all')
+        self.client().get(f'{SECTORS_BASE_URL}/Tecnologia')
+        self.client().get(f'{SECTORS_BASE_URL}/Limpeza')
+
+        metrics = self.client().get('/metrics').get_json()
+
+        listing = metrics['GET /collaborators/all']
+        self.assertEqual(2, listing['Requests'])
+        for name in ('Time', 'SqlTime', 'SqlStatements', 'SerializationTime'):
+            self.assertEqual(2, listing[name]['Count'])
+            self.assertEqual(2, sum(listing[name]['Buckets'].values()))
+        self.assertEqual(4, listing['SqlStatements']['Sum'])
+        self.assertEqual(2, metrics['GET /sectors/<string:name>']['Requests'])
+        self.assertEqual(1, metrics['POST /collaborators/add/<int:collab_number>']['Requests'])
+
+    def test_failed_statement_is_not_left_behind(self):
+
+        with self.app.test_request_context():
+            g.request_metrics = RequestMetrics()
+            with db.engine.connect() as connection:
+                # A duplicate name (as in a 409 response)
+                with self.assertRaises(IntegrityError):
+                    connection.execute(Sector.__table__.insert(), name='Tecnologia')
+                self.assertEqual([], connection.info.get('statement_start', []))
+
+                # The next statement is timed from its own start
+                time.sleep(0.05)
+                connection.execute('SELECT 1')
+
+            self.assertEqual(1, g.request_metrics.sql_statements)
+            self.assertLess(g.request_metrics.sql_time, 50)
+
+    def test_disabled_by_default(self):
+
+        app = create_app()
+        response = app.test_client().get(f'{SECTORS_BASE_URL}/Tecnologia')
+
+        self.assertNotIn('Server-Timing', response.headers)
+        self.assertEqual(404, app.test_client().get('/metrics').status_code)
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import unittest
+
+from sqlalchemy import text
+
+from __init__ import create_app
+from database.database import db
+from database import migrations, search
+from models.collaborator_model import Collaborator
+from models.sector_model import Sector
+
+
+class MigrationsTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.app = create_app()
+
+        # Recreate the tables the way they were before the unique indexes existed
+        with self.app.app_context():
+            db.drop_all()
+            db.session.execute(text('CREATE TABLE sector (id INTEGER PRIMARY KEY, name VARCHAR(100) NOT NULL)'))
+            db.session.commit()
+
+    def test_upgrade_creates_the_unique_indexes(self):
+
+        with self.app.app_context():
+            db.create_all()
+            db.session.execute(text("INSERT INTO sector (name) VALUES ('Tecnologia')"))
+            migrations.upgrade()
+
+            indexes = db.session.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")).fetchall()
+            self.assertIn(('ix_sector_name',), indexes)
+            self.assertIn(('ix_collaborator_collab_number',), indexes)
+
+            # The existing sectors must be found through the search index
+            sector_ids = db.session.execute(search.like_ids(Sector.__table__, 'name', '%nolo%')).fetchall()
+            self.assertEqual([(1,)], sector_ids)
+
+            # Running it again must not fail
+            migrations.upgrade()
+
+    def test_upgrade_given_duplicated_values(self):
+
+        with self.app.app_context():
+            db.create_all()
+            db.session.execute(text("INSERT INTO sector (name) VALUES ('Tecnologia'), ('Tecnologia')"))
+
+            with self.assertRaises(migrations.MigrationError) as context:
+                migrations.upgrade()
+            self.assertIn('Tecnologia', str(context.exception))
+
+    def test_upgrade_adds_the_collaborator_cascade(self):
+
+        with self.app.app_context():
+            db.session.execute(text(
+                'CREATE TABLE collaborator (id INTEGER PRIMARY KEY, collab_number INTEGER NOT NULL, '
+                'full_name VARCHAR(100) NOT NULL, birth_date VARCHAR NOT NULL, current_salary FLOAT NOT NULL, '
+                'active BOOLEAN NOT NULL, sector_id INTEGER NOT NULL REFERENCES sector (id))'
+            ))
+            db.create_all()
+            db.session.execute(text("INSERT INTO sector (name) VALUES ('Tecnologia')"))
+            db.session.execute(text(
+                "INSERT INTO collaborator VALUES (1, 10, 'Bernardino', '2020-11-11', 1.5, 1, 1)"
+            ))
+            migrations.upgrade()
+
+            # The collaborators are kept, and found through the search index
+            self.assertEqual(
+                [(1, 10, 'Bernardino')],
+                db.session.execute(text('SELECT id, collab_number, full_name FROM collaborator')).fetchall()
+            )
+            collaborator_ids = db.session.execute(
+                search.like_ids(Collaborator.__table__, 'full_name', '%nardi%')
+            ).fetchall()
+            self.assertEqual([(1,)], collaborator_ids)
+
+            # Deleting the sector deletes its collaborators
+            db.session.execute(text('DELETE FROM sector'))
+            self.assertEqual(0, db.session.execute(text('SELECT COUNT(*) FROM collaborator')).scalar())
+
+    def test_upgrade_given_collaborators_of_missing_sectors(self):
+
+        with self.app.app_context():
+            # Databases created before the foreign keys were enforced may hold such collaborators
+            db.session.execute(text('PRAGMA foreign_keys=OFF'))
+            db.session.execute(text(
+                'CREATE TABLE collaborator (id INTEGER PRIMARY KEY, collab_number INTEGER NOT NULL, '
+                'full_name VARCHAR(100) NOT NULL, birth_date VARCHAR NOT NULL, current_salary FLOAT NOT NULL, '
+                'active BOOLEAN NOT NULL, sector_id INTEGER NOT NULL REFERENCES sector (id))'
+            ))
+            db.create_all()
+            db.session.execute(text("INSERT INTO sector (name) VALUES ('Tecnologia')"))
+            db.session.execute(text(
+                "INSERT INTO collaborator VALUES (1, 10, 'Bernardino', '2020-11-11', 1.5, 1, 1), "
+                "(2, 20, 'Ana', '2020-11-11', 1.5, 1, 2), (3, 30, 'Bruno', '2020-11-11', 1.5, 1, 3)"
+            ))
+            db.session.commit()
+            db.session.execute(text('PRAGMA foreign_keys=ON'))
+
+            with self.assertRaises(migrations.MigrationError) as context:
+                migrations.upgrade()
+            self.assertIn('20, 30', str(context.exception))
+
+            # The collaborators are left as they were
+            db.session.rollback()
+            self.assertEqual(3, db.session.execute(text('SELECT COUNT(*) FROM collaborator')).scalar())
+
+    def test_upgrade_converts_the_birth_dates(self):
+
+        with self.app.app_context():
+            db.create_all()
+            db.session.execute(text("INSERT INTO sector (name) VALUES ('Tecnologia')"))
+            db.session.execute(text(
+                "INSERT INTO collaborator (collab_number, full_name, birth_date, current_salary, active, sector_id) "
+                "VALUES (1, 'Ana', '2020-11-11 00:00:00', 1.5, 1, 1), (2, 'Bruno', '25/12/1990', 1.5, 1, 1), "
+                "(3, 'Carlos', '1985-01-31', 1.5, 1, 1)"
+            ))
+            migrations.upgrade()
+
+            self.assertEqual(
+                [(1, '2020-11-11'), (2, '1990-12-25'), (3, '1985-01-31')],
+                db.session.execute(text('SELECT collab_number, birth_date FROM collaborator ORDER BY 1')).fetchall()
+            )
+
+            indexes = db.session.execute(text("SELECT name FROM sqlite_master WHERE type = 'index'")).fetchall()
+            self.assertIn(('ix_collaborator_birth_date',), indexes)
+            self.assertIn(('ix_collaborator_birthday',), indexes)
+
+    def test_upgrade_given_invalid_birth_dates(self):
+
+        with self.app.app_context():
+            db.create_all()
+            db.session.execute(text("INSERT INTO sector (name) VALUES ('Tecnologia')"))
+            db.session.execute(text(
+                "INSERT INTO collaborator (collab_number, full_name, birth_date, current_salary, active, sector_id) "
+                "VALUES (7, 'Ana', 'yesterday', 1.5, 1, 1)"
+            ))
+
+            with self.assertRaises(migrations.MigrationError) as context:
+                migrations.upgrade()
+            self.assertIn('7 (yesterday)', str(context.exception))
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,15 @@
+import asyncio
+import sys
+import threading
+import time
 import unittest
+from unittest import mock
+
+from sqlalchemy import event
 
 from __init__ import create_app
+from asgi import AsgiApp
+from database import summary
 from database.database import db
 
 
@@ -9,8 +18,11 @@ BASE_URL = 'http://127.0.0.1:5000/sectors'
 
 class SectorTestCase(unittest.TestCase):
 
+    # Settings of the app under test (overridden by the subclasses that test other modes)
+    config = None
+
     def setUp(self):
-        self.app = create_app()
+        self.app = create_app(self.config)
         self.client = self.app.test_client
 
         self.sector = {
@@ -109,6 +121,48 @@ class SectorTestCase(unittest.TestCase):
         self.assertIn('Recursos Tecnológicos', response_json_str)
         self.assertIn('Limpeza', response_json_str)
 
+    def test_list_all_sectors_paginated(self):
+
+        # Add sectors
+        names = ['Recursos Humanos', 'Limpeza', 'Financas']
+        for name in names:
+            self.client().post(f'{BASE_URL}/add/{name}', json={'name': name})
+
+        # Retrieve the first page
+        response = self.client().get(f'{BASE_URL}/all?limit=2')
+
+        # Verify
+        self.assertEqual(200, response.status_code)
+        response_json = response.get_json()
+        self.assertEqual([{'name': 'Financas'}, {'name': 'Limpeza'}], response_json['Items'])
+
+        # Retrieve the second (and last) page
+        response = self.client().get(f'{BASE_URL}/all?limit=2&cursor={response_json["Next"]}')
+
+        # Verify
+        self.assertEqual(200, response.status_code)
+        response_json = response.get_json()
+        self.assertEqual([{'name': 'Recursos Humanos'}], response_json['Items'])
+        self.assertIsNone(response_json['Next'])
+
+    def test_get_sector_not_modified_since(self):
+
+        # Add a sector
+        sector_name = self.sector['name']
+        self.client().post(f'{BASE_URL}/add/{sector_name}', json=self.sector)
+
+        # Retrieve it and its modification date
+        url = f'{BASE_URL}/{sector_name}'
+        response = self.client().get(url)
+        last_modified = response.headers['Last-Modified']
+
+        # Retrieve it again, only if modified since then
+        response = self.client().get(url, headers={'If-Modified-Since': last_modified})
+
+        # Verify
+        self.assertEqual(304, response.status_code)
+        self.assertEqual(b'', response.get_data())
+
     def test_list_all_sectors_empty(self):
 
         # Retrieve the data
@@ -195,6 +249,155 @@ class SectorTestCase(unittest.TestCase):
         response_json_str = str(response.get_json())
         self.assertIn(f'Sector not found with name = {sector["name"]}', response_json_str)
 
+    def test_get_sector_stats(self):
+
+        # Insert the sectors and the collaborators
+        self.client().post(f'{BASE_URL}/add/{self.sector["name"]}', json=self.sector)
+        self.client().post(f'{BASE_URL}/add/Limpeza', json={'name': 'Limpeza'})
+
+        salaries = [10.0, 20.0, 30.0, 40.0, 1000.0]
+        collaborators = [
+            {
+                'collab_number': collab_number,
+                'full_name': f'Collaborator {collab_number}',
+                'birth_date': '2020-11-11 00:00:00',
+                'current_salary': salary,
+                'active': salary < 1000,
+                'sector_name': self.sector['name']
+            }
+            for collab_number, salary in enumerate(salaries)
+        ]
+        self.client().post('http://127.0.0.1:5000/collaborators/add/bulk', json=collaborators)
+
+        # Retrieve the statistics of a sector
+        response = self.client().get(f'{BASE_URL}/{self.sector["name"]}/stats?percentiles=50,90')
+
+        # Verify
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({
+            'name': 'Tecnologia',
+            'headcount': 5,
+            'total_salary': 1100.0,
+            'mean_salary': 220.0,
+            'min_salary': 10.0,
+            'max_salary': 1000.0,
+            'percentiles': {'p50': 30.0, 'p90': 1000.0},
+        }, response.get_json())
+
+        # Retrieve the statistics of every sector, for active collaborators only
+        response = self.client().get(f'{BASE_URL}/stats?active=true&percentiles=50')
+
+        # Verify
+        self.assertEqual(200, response.status_code)
+        limpeza, tecnologia = response.get_json()
+        self.assertEqual(
+            {'name': 'Limpeza', 'headcount': 0, 'total_salary': None, 'mean_salary': None,
+             'min_salary': None, 'max_salary': None, 'percentiles': {'p50': None}},
+            limpeza
+        )
+        self.assertEqual(4, tecnologia['headcount'])
+        self.assertEqual(100.0, tecnologia['total_salary'])
+        self.assertEqual({'p50': 20.0}, tecnologia['percentiles'])
+
+    def test_get_sector_stats_given_invalid_parameters(self):
+
+        self.client().post(f'{BASE_URL}/add/{self.sector["name"]}', json=self.sector)
+
+        for query_string in ('active=maybe', 'percentiles=abc', 'percentiles=0'):
+            response = self.client().get(f'{BASE_URL}/{self.sector["name"]}/stats?{query_string}')
+            self.assertEqual(422, response.status_code)
+
+        response = self.client().get(f'{BASE_URL}/Limpeza/stats')
+        self.assertEqual(404, response.status_code)
+
+    def test_get_sector_summary(self):
+
+        collaborators_url = 'http://127.0.0.1:5000/collaborators'
+
+        # Insert the sectors and the collaborators
+        self.client().post(f'{BASE_URL}/add/{self.sector["name"]}', json=self.sector)
+        self.client().post(f'{BASE_URL}/add/Limpeza', json={'name': 'Limpeza'})
+
+        collaborators = [
+            {
+                'collab_number': collab_number,
+                'full_name': f'Collaborator {collab_number}',
+                'birth_date': '2020-11-11 00:00:00',
+                'current_salary': 100.0,
+                'active': True,
+                'sector_name': self.sector['name']
+            }
+            for collab_number in range(4)
+        ]
+        self.client().post(f'{collaborators_url}/add/bulk', json=collaborators)
+
+        # Deactivate one of them, move another one to the other sector and delete another one
+        deactivated = dict(collaborators[0], active=False, current_salary=50.0)
+        self.client().put(f'{collaborators_url}/update/0', json=deactivated)
+        moved = dict(collaborators[1], sector_name='Limpeza')
+        self.client().put(f'{collaborators_url}/update/1', json=moved)
+        self.client().delete(f'{collaborators_url}/delete/2')
+
+        # Verify
+        response = self.client().get(f'{BASE_URL}/{self.sector["name"]}/summary')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual({
+            'name': 'Tecnologia',
+            'headcount': 2,
+            'active_headcount': 1,
+            'inactive_headcount': 1,
+            'payroll': 150.0,
+            'active_payroll': 100.0,
+            'inactive_payroll': 50.0,
+        }, response.get_json())
+
+        response = self.client().get(f'{BASE_URL}/summary')
+        self.assertEqual(200, response.status_code)
+        self.assertEqual([('Limpeza', 1), ('Tecnologia', 2)],
+                         [(item['name'], item['headcount']) for item in response.get_json()])
+
+        # Deleting a sector deletes its summary
+        self.client().delete(f'{BASE_URL}/delete/Limpeza')
+        self.assertEqual(404, self.client().get(f'{BASE_URL}/Limpeza/summary').status_code)
+
+    def test_sector_summary_without_triggers(self):
+
+        self.client().post(f'{BASE_URL}/add/{self.sector["name"]}', json=self.sector)
+
+        # A database without the triggers (a dialect other than those of summary.DIALECTS)
+        with mock.patch.object(summary, 'DIALECTS', ()):
+            response = self.client().get(f'{BASE_URL}/{self.sector["name"]}/summary')
+            self.assertEqual(501, response.status_code)
+            self.assertEqual({'Error': 'The sector summaries are not supported on sqlite databases'},
+                             response.get_json())
+            self.assertEqual(501, self.client().get(f'{BASE_URL}/summary').status_code)
+
+    def test_rebuild_sector_summaries(self):
+
+        self.client().post(f'{BASE_URL}/add/{self.sector["name"]}', json=self.sector)
+        collaborator = {
+            'collab_number': 1,
+            'full_name': 'Bernardino',
+            'birth_date': '2020-11-11 00:00:00',
+            'current_salary': 100.0,
+            'active': True,
+            'sector_name': self.sector['name']
+        }
+        self.client().post('http://127.0.0.1:5000/collaborators/add/1', json=collaborator)
+
+        # Make the summary drift from the collaborators
+        with self.app.app_context():
+            db.session.execute('UPDATE sector_summary SET active_headcount = 10')
+            db.session.commit()
+
+        # Rebuild the summaries
+        result = self.app.test_cli_runner().invoke(args=['rebuild-sector-summary'])
+        self.assertEqual(0, result.exit_code)
+
+        # Verify
+        response = self.client().get(f'{BASE_URL}/{self.sector["name"]}/summary')
+        self.assertEqual(1, response.get_json()['active_headcount'])
+
     def test_update_sector(self):
 
         sector_name = self.sector['name']
@@ -228,6 +431,25 @@ class SectorTestCase(unittest.TestCase):
         response_json_str = str(response.get_json())
         self.assertEqual(f"{{'Error': 'Sector not found with name = {sector_name}'}}", response_json_str)
 
+    def test_update_sector_to_a_name_that_already_exists(self):
+
+        # Insert two sectors
+        sector_name = self.sector['name']
+        self.client().post(f'{BASE_URL}/add/{sector_name}', json=self.sector)
+        self.client().post(f'{BASE_URL}/add/Limpeza', json={'name': 'Limpeza'})
+
+        # Try to rename one of them to the name of the other
+        url = f'{BASE_URL}/update/Limpeza'
+        response = self.client().put(url, json=self.sector)
+
+        # Verify
+        response_code = response.status_code
+        expected_code = 409
+        self.assertEqual(expected_code, response_code)
+
+        response_json_str = str(response.get_json())
+        self.assertIn(f'Sector already exists with name = {sector_name}', response_json_str)
+
     def test_update_sector_given_empty_parameters(self):
 
         # Insert the sector
@@ -312,6 +534,46 @@ class SectorTestCase(unittest.TestCase):
         response_json_str = str(response.get_json())
         self.assertEqual(f"{{'Error': 'Sector not found with name = {sector_name}'}}", response_json_str)
 
+    def test_delete_sector_with_collaborators(self):
+
+        # Insert the sector and its collaborators
+        sector_name = self.sector['name']
+        self.client().post(f'{BASE_URL}/add/{sector_name}', json=self.sector)
+
+        collaborators = [
+            {
+                'collab_number': collab_number,
+                'full_name': f'Collaborator {collab_number}',
+                'birth_date': '2020-11-11 00:00:00',
+                'current_salary': 123.45,
+                'active': True,
+                'sector_name': sector_name
+            }
+            for collab_number in range(50)
+        ]
+        self.client().post('http://127.0.0.1:5000/collaborators/add/bulk', json=collaborators)
+
+        # Delete the sector, counting the statements sent to the database
+        statements = []
+
+        def before_cursor_execute(*args):
+            statements.append(args[2])
+
+        with self.app.app_context():
+            event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+            try:
+                response = self.client().delete(f'{BASE_URL}/delete/{sector_name}')
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+
+        # Verify
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, len([statement for statement in statements if statement.startswith('DELETE')]))
+        self.assertLess(len(statements), 10)
+
+        response = self.client().get('http://127.0.0.1:5000/collaborators/all')
+        self.assertEqual(404, response.status_code)
+
     def test_delete_sector_that_doesnt_exist(self):
 
         # Try to delete the sector that is not in the database
@@ -326,11 +588,140 @@ class SectorTestCase(unittest.TestCase):
         response_json_str = str(response.get_json())
         self.assertIn(f'Sector not found with name = {self.sector["name"]}', response_json_str)
 
+    def test_upsert_sector(self):
+
+        url = f'{BASE_URL}/upsert/{self.sector["name"]}'
+
+        # Insert the sector, then upsert it again (nothing changes)
+        for _ in range(2):
+            response = self.client().put(url, json=self.sector)
+            self.assertEqual(200, response.status_code)
+            self.assertEqual(self.sector, response.get_json())
+
+        response = self.client().get(f'{BASE_URL}/all')
+        self.assertEqual([self.sector], response.get_json())
+        self.assertEqual(0, self.client().get(f'{BASE_URL}/{self.sector["name"]}/summary').get_json()['headcount'])
+
+        # A name other than the one of the URL
+        response = self.client().put(f'{BASE_URL}/upsert/Limpeza', json=self.sector)
+        self.assertEqual(422, response.status_code)
+
+    def test_upsert_sectors_in_bulk(self):
+
+        self.client().post(f'{BASE_URL}/add/{self.sector["name"]}', json=self.sector)
+
+        sectors = [self.sector, {'name': 'Limpeza'}, {'title': 'Vendas'}]
+        response = self.client().put(f'{BASE_URL}/upsert/bulk', json=sectors)
+
+        # The existing sector is skipped, so only one is written
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(1, response.get_json()['Upserted'])
+        self.assertEqual(['2'], list(response.get_json()['Errors']))
+        response = self.client().get(f'{BASE_URL}/all')
+        self.assertEqual(['Limpeza', 'Tecnologia'], [item['name'] for item in response.get_json()])
+
     def tearDown(self):
         with self.app.app_context():
             db.session.remove()
             db.drop_all()
 
 
+class GroupCommitSectorTestCase(SectorTestCase):
+    """ Runs the same tests with the writes committed in groups """
+
+    config = {'DATABASE_GROUP_COMMIT': True}
+
+
+class AsgiSectorTestCase(SectorTestCase):
+    """ Runs the same tests through the ASGI serving mode """
+
+    def setUp(self):
+        super().setUp()
+        self.asgi_app = AsgiApp(self.app)
+        self.client = self.asgi_app.test_client
+
+    def test_wsgi_write_callable(self):
+
+        def wsgi_app(environ, start_response):
+            write = start_response('200 OK', [('Content-Type', 'text/plain')])
+            write(b'Hello, ')
+            return [b'world']
+
+        self.app.wsgi_app = wsgi_app
+        response = self.client().get(BASE_URL)
+
+        self.assertEqual(200, response.status_code)
+        self.assertEqual(b'Hello, world', response.data)
+
+    def test_wsgi_error_replaces_the_response_until_it_is_sent(self):
+
+        def wsgi_app(environ, start_response):
+            write = start_response('200 OK', [('Content-Type', 'text/plain')])
+            try:
+                if environ['QUERY_STRING'] == 'sent':
+                    write(b'Hello')
+                raise ValueError('Failed')
+            except ValueError:
+                start_response('500 Internal Server Error', [('Content-Type', 'text/plain')], sys.exc_info())
+            return [b'Error']
+
+        self.app.wsgi_app = wsgi_app
+        response = self.client().get(BASE_URL)
+        self.assertEqual(500, response.status_code)
+        self.assertEqual(b'Error', response.data)
+
+        # Once the headers are sent, the error aborts the response
+        with self.assertRaises(ValueError):
+            self.client().get(f'{BASE_URL}?sent')
+
+    def test_shutdown_while_a_request_is_streaming(self):
+
+        streaming = threading.Event()
+
+        def wsgi_app(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            yield b'Hello, '
+            streaming.set()
+            # The rest of the response is sent after the shutdown has started
+            time.sleep(0.1)
+            yield b'world'
+
+        async def scenario():
+            body = bytearray()
+            lifespan = [{'type': 'lifespan.startup'}, {'type': 'lifespan.shutdown'}]
+
+            async def receive_request():
+                return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+            async def send_response(message):
+                body.extend(message.get('body', b''))
+
+            async def receive_lifespan():
+                return lifespan.pop(0)
+
+            async def send_lifespan(message):
+                pass
+
+            scope = {'type': 'http', 'method': 'GET', 'path': '/', 'headers': []}
+            request = asyncio.ensure_future(self.asgi_app(scope, receive_request, send_response))
+            await asyncio.get_running_loop().run_in_executor(None, streaming.wait)
+            await self.asgi_app({'type': 'lifespan'}, receive_lifespan, send_lifespan)
+            await request
+            return bytes(body)
+
+        self.app.wsgi_app = wsgi_app
+        results = []
+        thread = threading.Thread(target=lambda: results.append(asyncio.run(scenario())), daemon=True)
+        thread.start()
+        thread.join(timeout=5)
+
+        self.assertFalse(thread.is_alive(), 'The shutdown waits for a request that waits for the event loop')
+        self.assertEqual([b'Hello, world'], results)
+
+    def tearDown(self):
+        self.asgi_app.executor.shutdown()
+        super().tearDown()
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,141 @@
+import json
+import unittest
+
+from __init__ import create_app
+from core import serialization
+from database.database import db
+from models.collaborator_model import Collaborator
+
+
+COLLABORATORS_BASE_URL = 'http://127.0.0.1:5000/collaborators'
+SECTORS_BASE_URL = 'http://127.0.0.1:5000/sectors'
+
+
+class RowSerializerTestCase(unittest.TestCase):
+
+    def test_row_serializer_keeps_the_order_of_the_fields(self):
+
+        serialize = serialization.row_serializer(Collaborator.fields)
+        result = serialize((1, 'Bernardino', '2020-11-11 00:00:00', 123.45, True, 'Tecnologia'))
+
+        self.assertEqual(list(Collaborator.fields), list(result))
+        self.assertEqual('Bernardino', result['full_name'])
+
+    def test_dumps_without_orjson(self):
+
+        orjson = serialization.orjson
+        serialization.orjson = None
+        try:
+            self.assertEqual(b'{"a":1,"b":[true,null]}', serialization.dumps({'a': 1, 'b': [True, None]}))
+        finally:
+            serialization.orjson = orjson
+
+
+class FastSerializationTestCase(unittest.TestCase):
+    """
+    The fast serialization must produce the same listings as the marshmallow schemas
+    """
+
+    def setUp(self):
+        self.app = create_app()
+        self.client = self.app.test_client
+
+        with self.app.app_context():
+            db.create_all()
+
+        for sector in ('Tecnologia', 'Limpeza'):
+            self.client().post(f'{SECTORS_BASE_URL}/add/{sector}', json={'name': sector})
+        for collab_number in range(1, 6):
+            self.client().post(f'{COLLABORATORS_BASE_URL}/add/{collab_number}', json={
+                'collab_number': collab_number,
+                'full_name': f'João {collab_number}',
+                'birth_date': '2020-11-11 00:00:00',
+                'current_salary': 1000.5 * collab_number,
+                'active': collab_number % 2 == 0,
+                'sector_name': 'Tecnologia' if collab_number < 3 else 'Limpeza'
+            })
+
+    def _get_both(self, url, headers=None):
+        # The same request, with the fast serialization and with the marshmallow schemas
+        fast = self.client().get(url, headers=headers)
+        # Reads streamed responses to the end (closing their request context) before the next request
+        fast.get_data()
+        self.app.config['FAST_SERIALIZATION'] = False
+        try:
+            regular = self.client().get(url, headers=headers)
+        finally:
+            self.app.config['FAST_SERIALIZATION'] = True
+        return fast, regular
+
+    def test_listings_match_the_schemas(self):
+
+        for url in (f'{COLLABORATORS_BASE_URL}/all', f'{COLLABORATORS_BASE_URL}/all/2/4',
+                    f'{COLLABORATORS_BASE_URL}/all/João', f'{SECTORS_BASE_URL}/all', f'{SECTORS_BASE_URL}/all/Tec'):
+            fast, regular = self._get_both(url)
+
+            self.assertEqual(200, fast.status_code, url)
+            self.assertEqual('application/json', fast.mimetype)
+            self.assertEqual(regular.get_json(), fast.get_json(), url)
+
+    def test_listing_keeps_the_order_of_the_fields(self):
+
+        response = self.client().get(f'{COLLABORATORS_BASE_URL}/all')
+        first = json.loads(response.data, object_pairs_hook=lambda pairs: [key for key, _ in pairs])[0]
+
+        self.assertEqual(list(Collaborator.fields), first)
+
+    def test_streamed_listing_matches_the_schema(self):
+
+        fast, regular = self._get_both(f'{COLLABORATORS_BASE_URL}/all', headers={'Accept': 'application/x-ndjson'})
+
+        fast_lines = [json.loads(line) for line in fast.data.splitlines()]
+        regular_lines = [json.loads(line) for line in regular.data.splitlines()]
+        self.assertEqual(5, len(fast_lines))
+        self.assertEqual(regular_lines, fast_lines)
+
+    def test_fields_select_a_subset(self):
+
+        for url in (f'{COLLABORATORS_BASE_URL}/all?fields=full_name,collab_number',
+                    f'{COLLABORATORS_BASE_URL}/all/1/3?fields=collab_number,sector_name',
+                    f'{COLLABORATORS_BASE_URL}/all/João?fields=sector_name'):
+            fast, regular = self._get_both(url)
+
+            self.assertEqual(200, fast.status_code, url)
+            self.assertEqual(regular.get_json(), fast.get_json(), url)
+
+        response = self.client().get(f'{COLLABORATORS_BASE_URL}/all?fields=full_name,collab_number')
+        self.assertEqual({'collab_number': 1, 'full_name': 'João 1'}, response.get_json()[0])
+
+        response = self.client().get(f'{COLLABORATORS_BASE_URL}/all/1/3?fields=collab_number,sector_name')
+        self.assertEqual(['Tecnologia', 'Tecnologia', 'Limpeza'], [row['sector_name'] for row in response.get_json()])
+
+    def test_fields_of_a_page_and_of_a_stream(self):
+
+        response = self.client().get(f'{COLLABORATORS_BASE_URL}/all?limit=2&fields=collab_number')
+        self.assertEqual([{'collab_number': 1}, {'collab_number': 2}], response.get_json()['Items'])
+
+        fast, regular = self._get_both(f'{COLLABORATORS_BASE_URL}/all?fields=full_name',
+                                       headers={'Accept': 'application/x-ndjson'})
+        lines = [json.loads(line) for line in fast.data.splitlines()]
+        self.assertEqual([{'full_name': f'João {number}'} for number in range(1, 6)], lines)
+        self.assertEqual(lines, [json.loads(line) for line in regular.data.splitlines()])
+
+    def test_unknown_fields(self):
+
+        for fields in ('id', 'full_name,salary', ''):
+            response = self.client().get(f'{COLLABORATORS_BASE_URL}/all?fields={fields}')
+            self.assertEqual(422, response.status_code)
+            self.assertIn('Error', response.get_json())
+
+    def test_empty_listing(self):
+
+        self.assertEqual(404, self.client().get(f'{COLLABORATORS_BASE_URL}/all/100/200').status_code)
+
+    def tearDown(self):
+        with self.app.app_context():
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    unittest.main()